@@ -4,10 +4,24 @@ from fastapi.staticfiles import StaticFiles
 import os
 from app.api.routers.folder import folder_router
 from app.api.routers.chat import chat_router
+from app.api.routers.query import query_router
+from app.api.routers.suggestion import suggestion_router
 from app.middlewares.frontend import FrontendMiddleware
+from app.middlewares.metrics import MetricsMiddleware
+from app.middlewares.tracing import TracingMiddleware
+from app.api.routers.metrics import metrics_router
+from app.metrics import init_metrics, mark_process_dead
+from app.observability import init_observability
+
+init_observability()
+init_metrics()
 
 app = FastAPI()
 
+@app.on_event("shutdown")
+def shutdown_metrics():
+    mark_process_dead()
+
 # Ajoute le middleware CORS
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +38,12 @@ if os.path.exists("static"):
 # Ajoute le middleware pour la gestion du frontend
 app.add_middleware(FrontendMiddleware)
 
+# Ajoute une span par requête HTTP (ajouté en dernier pour englober les autres middlewares)
+app.add_middleware(TracingMiddleware)
+
+# Mesure la latence des requêtes par route
+app.add_middleware(MetricsMiddleware)
+
 # Inclut les routes de l'API
 app.include_router(
     folder_router,
@@ -35,4 +55,19 @@ app.include_router(
     chat_router,
     prefix="/api",
     tags=["chat"]  # Ajoute un tag pour la documentation
-)
\ No newline at end of file
+)
+
+app.include_router(
+    query_router,
+    prefix="/api/query",
+    tags=["query"]
+)
+
+app.include_router(
+    suggestion_router,
+    prefix="/api/chat/suggestions",
+    tags=["chat"]
+)
+
+# Métriques Prometheus (agrégées sur tous les workers)
+app.include_router(metrics_router, tags=["metrics"])
\ No newline at end of file
@@ -4,12 +4,20 @@ from app.db.supabase_client import supabase
 import logging
 from app.models.user import User
 from jose import JWTError, jwt
+from opentelemetry import trace
 import os
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    with tracer.start_as_current_span("auth") as span:
+        user = await _get_current_user(token)
+        span.set_attribute("user.id", str(user.id))
+        return user
+
+async def _get_current_user(token: str) -> User:
     try:
         if not token:
             raise HTTPException(
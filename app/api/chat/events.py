@@ -1,17 +1,27 @@
-import json
-import asyncio
 import logging
 from typing import AsyncGenerator, Dict, Any, List, Optional
 from llama_index.core.callbacks.base import BaseCallbackHandler
 from llama_index.core.callbacks.schema import CBEventType
-from pydantic import BaseModel
+
+from app.api.services.event_queue import EventQueue
 
 logger = logging.getLogger(__name__)
 
-class CallbackEvent(BaseModel):
-    event_type: CBEventType
-    payload: Optional[Dict[str, Any]] = None
-    event_id: str = ""
+_UNSET = object()
+
+class CallbackEvent:
+    """
+    Enregistrement léger d'un événement de callback.
+    La réponse envoyée au client n'est calculée qu'une seule fois.
+    """
+    __slots__ = ("event_type", "payload", "event_id", "_response")
+
+    def __init__(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                 event_id: str = ""):
+        self.event_type = event_type
+        self.payload = payload
+        self.event_id = event_id
+        self._response: Any = _UNSET
 
     def get_retrieval_message(self) -> dict | None:
         if self.payload and "nodes" in self.payload:
@@ -23,49 +33,60 @@ class CallbackEvent(BaseModel):
         return None
 
     def to_response(self):
-        try:
-            if self.event_type == "retrieve":
-                return self.get_retrieval_message()
-            return None
-        except Exception as e:
-            logger.error(f"Erreur de conversion: {e}")
-            return None
+        if self._response is _UNSET:
+            try:
+                if self.event_type == "retrieve":
+                    self._response = self.get_retrieval_message()
+                else:
+                    self._response = None
+            except Exception as e:
+                logger.error(f"Erreur de conversion: {e}")
+                self._response = None
+        return self._response
 
 class EventCallbackHandler(BaseCallbackHandler):
-    _aqueue: asyncio.Queue
+    _queue: EventQueue[CallbackEvent]
     is_done: bool = False
 
     def __init__(self):
-        ignored_events = [CBEventType.CHUNKING, CBEventType.NODE_PARSING, 
+        ignored_events = [CBEventType.CHUNKING, CBEventType.NODE_PARSING,
                          CBEventType.EMBEDDING, CBEventType.LLM]
         super().__init__(ignored_events, ignored_events)
-        self._aqueue = asyncio.Queue()
+        # Événements de progression en attente bornés (EVENT_QUEUE_MAXSIZE)
+        self._queue = EventQueue()
 
-    def on_event_start(self, event_type: CBEventType, payload: Dict[str, Any] = None, 
-                      event_id: str = "", **kwargs) -> str:
+    def _enqueue(self, event_type: CBEventType, payload: Optional[Dict[str, Any]],
+                 event_id: str) -> None:
+        # Filtrage par type avant toute allocation : seuls les résultats
+        # de recherche (qui contiennent des noeuds) sont envoyés au client
+        if event_type != CBEventType.RETRIEVE or not payload or "nodes" not in payload:
+            return
         event = CallbackEvent(event_type=event_type, payload=payload, event_id=event_id)
-        if event.to_response():
-            self._aqueue.put_nowait(event)
+        response = event.to_response()
+        if not response:
+            return
+        self._queue.put(event, progress=response["type"] == "events")
+
+    def on_event_start(self, event_type: CBEventType, payload: Dict[str, Any] = None,
+                      event_id: str = "", **kwargs) -> str:
+        self._enqueue(event_type, payload, event_id)
         return event_id
 
     def on_event_end(self, event_type: CBEventType, payload: Dict[str, Any] = None,
                     event_id: str = "", **kwargs) -> None:
-        event = CallbackEvent(event_type=event_type, payload=payload, event_id=event_id)
-        if event.to_response():
-            self._aqueue.put_nowait(event)
+        self._enqueue(event_type, payload, event_id)
 
     def start_trace(self, trace_id: Optional[str] = None) -> None:
         """Démarrer le traçage."""
         pass
 
-    def end_trace(self, trace_id: Optional[str] = None, 
+    def end_trace(self, trace_id: Optional[str] = None,
                  trace_map: Optional[Dict[str, List[str]]] = None) -> None:
         """Terminer le traçage."""
         pass
 
     async def async_event_gen(self) -> AsyncGenerator[CallbackEvent, None]:
-        while not self._aqueue.empty() or not self.is_done:
-            try:
-                yield await asyncio.wait_for(self._aqueue.get(), timeout=0.1)
-            except asyncio.TimeoutError:
-                pass 
\ No newline at end of file
+        while not self._queue.empty() or not self.is_done:
+            event = await self._queue.get(timeout=0.1)
+            if event is not None:
+                yield event
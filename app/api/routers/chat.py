@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List
-import json
 import logging
 from llama_index.core.llms import MessageRole
 from app.engine.engine import get_chat_engine
@@ -14,9 +14,15 @@ from app.api.auth import get_current_user
 from app.db.supabase_client import supabase
 from datetime import datetime
 import asyncio
+import time
 from app.observability import create_chat_span, end_chat_span
 from opentelemetry import trace
 from app.api.chat.events import EventCallbackHandler
+from app.api.routers.models import Message as SuggestionMessage
+from app.api.services.admission import admission_controller
+from app.api.services.suggestion import NextQuestionSuggestion
+from app.api.services.streaming import aclose_chat_response, coalesce_tokens, dumps
+from app.metrics import CHAT_STREAM_DURATION, CHAT_TIME_TO_FIRST_TOKEN
 import os
 
 logger = logging.getLogger(__name__)
@@ -84,7 +90,8 @@ async def create_message(message: ChatMessage, current_user: User = Depends(get_
 
 async def get_chat_response(message: str, conversation_id: str):
     try:
-        chat_engine = get_chat_engine()
+        # Sans utilisateur : uniquement les documents publics
+        chat_engine = get_chat_engine(filters=generate_filters())
         response = chat_engine.chat(message)
         
         # Adapter la réponse au format attendu
@@ -100,8 +107,16 @@ async def get_chat_response(message: str, conversation_id: str):
         )
 
 @chat_router.post("/chat/request")
-async def chat_request(request: ChatRequest, current_user: User = Depends(get_current_user)):
-    # Créer un span pour cette interaction
+async def chat_request(
+    request: ChatRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    # Contrôle d'admission : limite le nombre de requêtes concurrentes vers le LLM (429 si surcharge)
+    admission_slot = await admission_controller.acquire(str(current_user.id))
+    request_start = time.perf_counter()
+
+    # Créer un span pour cette interaction, terminé à la fin du streaming
     span = create_chat_span(tracer, request.conversation_id, request.message)
     
     try:
@@ -116,42 +131,111 @@ async def chat_request(request: ChatRequest, current_user: User = Depends(get_cu
             "created_at": datetime.utcnow().isoformat()
         }
         
-        # Insérer le message utilisateur
-        supabase.client.table('chat_messages').insert(user_message).execute()
-
-        # Initialiser le gestionnaire d'événements
-        event_handler = EventCallbackHandler()
-        
-        # Obtenir la réponse avec streaming
-        chat_engine = get_chat_engine()
-        response = await chat_engine.astream_chat(request.message)
+        with trace.use_span(span, end_on_exit=False):
+            # Insérer le message utilisateur
+            with tracer.start_as_current_span("chat.persist_user_message"):
+                supabase.client.table('chat_messages').insert(user_message).execute()
 
-        # Marquer le span comme réussi avant de commencer le streaming
-        end_chat_span(span, True)
+            # Initialiser le gestionnaire d'événements
+            event_handler = EventCallbackHandler()
+            
+            # Obtenir la réponse avec streaming
+            # (les spans embedding, recherche, rerank, prompt et LLM sont créées par les callbacks)
+            with tracer.start_as_current_span("chat.engine_setup"):
+                # Documents publics et documents privés de l'utilisateur, filtrés par Qdrant
+                chat_engine = get_chat_engine(
+                    filters=generate_filters(user_id=str(current_user.id)),
+                    tenant_id=str(current_user.id),
+                )
+            response = await chat_engine.astream_chat(request.message)
+            span.set_attribute("retrieval.node_count", len(response.source_nodes))
 
         return StreamingResponse(
             content=stream_chat_response(
                 request=request,
                 event_handler=event_handler,
                 response=response,
-                current_user=current_user
+                current_user=current_user,
+                http_request=http_request,
+                admission_slot=admission_slot,
+                span=span,
+                request_start=request_start
             ),
-            media_type="text/event-stream"
+            media_type="text/event-stream",
+            # Libère le slot et termine le span même si le flux n'est jamais démarré
+            background=BackgroundTask(_finish_chat_request, admission_slot, span)
         )
 
     except Exception as e:
+        admission_slot.release()
         # Marquer le span comme échoué
         end_chat_span(span, False, error=str(e))
         logger.error(f"Erreur: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def stream_chat_response(request, event_handler, response, current_user):
+def _finish_chat_request(admission_slot, span):
+    admission_slot.release()
+    end_chat_span(span, False, error="Le flux n'a pas été terminé")
+
+def _persist_partial_responses() -> bool:
+    """Sauvegarder (ou non) les réponses interrompues par une déconnexion du client"""
+    return os.getenv("PERSIST_PARTIAL_RESPONSES", "false").lower() == "true"
+
+def save_assistant_message(request, current_user, content: str):
+    assistant_message = {
+        "conversation_id": request.conversation_id,
+        "user_id": str(current_user.id),
+        "content": content,
+        "role": "assistant",
+        "created_at": datetime.utcnow().isoformat()
+    }
+    supabase.client.table('chat_messages').insert(assistant_message).execute()
+
+async def stream_chat_response(request, event_handler, response, current_user, http_request=None,
+                               admission_slot=None, span=None, request_start=None):
+    # Les tokens sont regroupés en trames pour limiter les écritures et la sérialisation
+    response_parts = []
+    response_size = 0
+    tokens = coalesce_tokens(response.async_response_gen())
+    # Questions suivantes générées en parallèle du streaming (voir NextQuestionSuggestion)
+    chat_history = [SuggestionMessage(role="user", content=request.message)]
+    speculative_chars = NextQuestionSuggestion.get_speculative_chars()
+    questions_task = None
+    is_complete = False
+    is_disconnected = False
+    error = None
+    parent = trace.set_span_in_context(span) if span is not None else None
+    # Temps jusqu'au premier token, puis durée du streaming
+    ttft_span = tracer.start_span("chat.time_to_first_token", context=parent)
+    stream_span = None
+    stream_start = None
     try:
-        final_response = ""
-        async for token in response.async_response_gen():
-            final_response += token
+        async for chunk in tokens:
+            if http_request is not None and await http_request.is_disconnected():
+                is_disconnected = True
+                return
+            if stream_span is None:
+                ttft_span.end()
+                stream_span = tracer.start_span("chat.stream", context=parent)
+                stream_start = time.perf_counter()
+                if request_start is not None:
+                    CHAT_TIME_TO_FIRST_TOKEN.observe(stream_start - request_start)
+                if span is not None and getattr(span, "start_time", None):
+                    # Depuis le début de la requête (recherche et appel au LLM compris)
+                    span.set_attribute("chat.time_to_first_token_ms",
+                                       (time.time_ns() - span.start_time) / 1e6)
+            response_parts.append(chunk)
+            response_size += len(chunk)
+            if questions_task is None and 0 < speculative_chars <= response_size:
+                questions_task = NextQuestionSuggestion.start_speculative(
+                    chat_history, "".join(response_parts)
+                )
             # Format SSE correct
-            yield f"data: {json.dumps({'content': token})}\n\n"
+            yield f"data: {dumps({'content': chunk})}\n\n"
+        is_complete = True
+        if stream_start is not None:
+            CHAT_STREAM_DURATION.observe(time.perf_counter() - stream_start)
+        final_response = "".join(response_parts)
 
         # Une fois le texte terminé, envoyer les sources
         if hasattr(response, 'source_nodes'):
@@ -170,24 +254,56 @@ async def stream_chat_response(request, event_handler, response, current_user):
                     }
                 })
             
-            yield f"data: {json.dumps({'type': 'sources', 'data': source_nodes})}\n\n"
+            yield f"data: {dumps({'type': 'sources', 'data': source_nodes})}\n\n"
+
+        # Questions suivantes envoyées seulement si elles sont prêtes : sinon elles sont
+        # mises en cache et servies par /api/chat/suggestions
+        if questions_task is None:
+            questions_task = NextQuestionSuggestion.start(chat_history, final_response)
+        questions = await NextQuestionSuggestion.collect(questions_task)
+        if questions:
+            yield f"data: {dumps({'type': 'suggested_questions', 'data': questions})}\n\n"
 
         # Sauvegarder le message de l'assistant une fois complet
-        assistant_message = {
-            "conversation_id": request.conversation_id,
-            "user_id": str(current_user.id),
-            "content": final_response,
-            "role": "assistant",
-            "created_at": datetime.utcnow().isoformat()
-        }
-        supabase.client.table('chat_messages').insert(assistant_message).execute()
+        with tracer.start_as_current_span("chat.persist_assistant_message", context=parent):
+            save_assistant_message(request, current_user, final_response)
 
+    except (asyncio.CancelledError, GeneratorExit):
+        # Starlette arrête le générateur lorsque le client se déconnecte
+        is_disconnected = True
+        raise
     except Exception as e:
+        error = str(e)
         logger.error(f"Erreur streaming: {e}")
         # Format SSE pour les erreurs
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield f"data: {dumps({'error': str(e)})}\n\n"
     finally:
+        # Arrêter la génération du LLM si la réponse n'a pas été consommée entièrement
+        await tokens.aclose()
+        if not is_complete:
+            await aclose_chat_response(response)
+            if questions_task is not None:
+                questions_task.cancel()
+        if is_disconnected:
+            logger.info(f"Client déconnecté, génération annulée pour la conversation {request.conversation_id}")
+            if _persist_partial_responses() and response_parts:
+                try:
+                    save_assistant_message(request, current_user, "".join(response_parts))
+                except Exception as e:
+                    logger.error(f"Erreur lors de la sauvegarde de la réponse partielle: {e}")
+        if admission_slot is not None:
+            admission_slot.release()
         event_handler.is_done = True
+        # Terminer les spans du streaming et de l'interaction
+        if stream_span is None:
+            ttft_span.end()
+        else:
+            stream_span.set_attribute("stream.chunk_count", len(response_parts))
+            stream_span.set_attribute("stream.char_count", sum(len(part) for part in response_parts))
+            stream_span.end()
+        if span is not None:
+            span.set_attribute("client.disconnected", is_disconnected)
+            end_chat_span(span, error is None, error=error)
 
 @chat_router.post("/chat/conversation")
 async def create_conversation(current_user: User = Depends(get_current_user)):
@@ -1,4 +1,3 @@
-import asyncio
 import json
 import logging
 from typing import Any, AsyncGenerator, Dict, List, Optional
@@ -6,15 +5,42 @@ from typing import Any, AsyncGenerator, Dict, List, Optional
 from llama_index.core.callbacks.base import BaseCallbackHandler
 from llama_index.core.callbacks.schema import CBEventType
 from llama_index.core.tools.types import ToolOutput
-from pydantic import BaseModel
+
+from app.api.services.event_queue import EventQueue
 
 logger = logging.getLogger(__name__)
 
+# Only these event types can produce a message for the client,
+# every other event is dropped before anything is allocated
+STREAMED_EVENT_TYPES = frozenset(
+    {
+        CBEventType.RETRIEVE,
+        CBEventType.FUNCTION_CALL,
+        CBEventType.AGENT_STEP,
+    }
+)
+
+_UNSET = object()
+
+
+class CallbackEvent:
+    """
+    Lightweight record of a callback event.
+    The response sent to the client is computed once and cached on the record.
+    """
 
-class CallbackEvent(BaseModel):
-    event_type: CBEventType
-    payload: Optional[Dict[str, Any]] = None
-    event_id: str = ""
+    __slots__ = ("event_type", "payload", "event_id", "_response")
+
+    def __init__(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+    ):
+        self.event_type = event_type
+        self.payload = payload
+        self.event_id = event_id
+        self._response: Any = _UNSET
 
     def get_retrieval_message(self) -> dict | None:
         if self.payload:
@@ -83,7 +109,7 @@ class CallbackEvent(BaseModel):
                     }
         return None
 
-    def to_response(self):
+    def _convert(self) -> dict | None:
         try:
             match self.event_type:
                 case "retrieve":
@@ -98,9 +124,14 @@ class CallbackEvent(BaseModel):
             logger.error(f"Error in converting event to response: {e}")
             return None
 
+    def to_response(self) -> dict | None:
+        if self._response is _UNSET:
+            self._response = self._convert()
+        return self._response
+
 
 class EventCallbackHandler(BaseCallbackHandler):
-    _aqueue: asyncio.Queue
+    _queue: EventQueue[CallbackEvent]
     is_done: bool = False
 
     def __init__(
@@ -115,7 +146,23 @@ class EventCallbackHandler(BaseCallbackHandler):
             CBEventType.TEMPLATING,
         ]
         super().__init__(ignored_events, ignored_events)
-        self._aqueue = asyncio.Queue()
+        # Pending progress events are bounded (EVENT_QUEUE_MAXSIZE), tool outputs are not
+        self._queue = EventQueue()
+
+    def _enqueue(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]],
+        event_id: str,
+    ) -> None:
+        # Cheap filtering before allocating anything
+        if event_type not in STREAMED_EVENT_TYPES or not payload:
+            return
+        event = CallbackEvent(event_type=event_type, payload=payload, event_id=event_id)
+        response = event.to_response()
+        if response is None:
+            return
+        self._queue.put(event, progress=response["type"] == "events")
 
     def on_event_start(
         self,
@@ -125,9 +172,7 @@ class EventCallbackHandler(BaseCallbackHandler):
         parent_id: str = "",
         **kwargs: Any,
     ) -> str:
-        event = CallbackEvent(event_id=event_id, event_type=event_type, payload=payload)
-        if event.to_response() is not None:
-            self._aqueue.put_nowait(event)
+        self._enqueue(event_type, payload, event_id)
         return event_id
 
     def on_event_end(
@@ -137,9 +182,7 @@ class EventCallbackHandler(BaseCallbackHandler):
         event_id: str = "",
         **kwargs: Any,
     ) -> None:
-        event = CallbackEvent(event_id=event_id, event_type=event_type, payload=payload)
-        if event.to_response() is not None:
-            self._aqueue.put_nowait(event)
+        self._enqueue(event_type, payload, event_id)
 
     def start_trace(self, trace_id: Optional[str] = None) -> None:
         """No-op."""
@@ -152,8 +195,7 @@ class EventCallbackHandler(BaseCallbackHandler):
         """No-op."""
 
     async def async_event_gen(self) -> AsyncGenerator[CallbackEvent, None]:
-        while not self._aqueue.empty() or not self.is_done:
-            try:
-                yield await asyncio.wait_for(self._aqueue.get(), timeout=0.1)
-            except asyncio.TimeoutError:
-                pass
+        while not self._queue.empty() or not self.is_done:
+            event = await self._queue.get(timeout=0.1)
+            if event is not None:
+                yield event
@@ -4,12 +4,13 @@ from typing import List, Set
 from pydantic import BaseModel
 import shutil
 from app.engine.generate import process_documents
-from app.engine.vectordb import get_vector_store, get_collection_stats
+from app.engine.vectordb import get_vector_store, get_collection_stats, scroll_documents
 import logging
 from fastapi.responses import FileResponse
 from app.api.auth import get_current_user
 from app.models.user import User
 from app.config import DATA_DIR  # Ajouter cet import
+from app.metrics import UPLOAD_QUEUE_DEPTH
 
 logger = logging.getLogger(__name__)
 
@@ -107,6 +108,8 @@ async def index_new_file(file_path: str):
         
     except Exception as e:
         logger.error(f"Erreur lors de l'indexation du fichier {file_path}: {str(e)}", exc_info=True)
+    finally:
+        UPLOAD_QUEUE_DEPTH.dec()
 
 @folder_router.post("/upload")
 async def upload_file(
@@ -142,6 +145,7 @@ async def upload_file(
         
         # Ajouter la tâche d'indexation en arrière-plan
         if background_tasks:
+            UPLOAD_QUEUE_DEPTH.inc()
             background_tasks.add_task(index_new_file, file_path)
         
         return {
@@ -170,25 +174,22 @@ async def debug_vectorstore():
         # Récupérer les stats
         stats = get_collection_stats(vector_store)
         
-        # Récupérer les documents
-        docs = vector_store.client.scroll(
-            collection_name=os.getenv("QDRANT_COLLECTION"),
-            limit=100
-        )
+        # Récupérer les documents (quel que soit le backend)
+        docs = scroll_documents(vector_store, limit=100)
         
         # Grouper par source
         docs_by_source = {}
-        for doc in docs[0]:
-            source = doc.payload.get("metadata", {}).get("source", "unknown")
+        for doc in docs:
+            source = doc.get("metadata", {}).get("source", "unknown")
             if source not in docs_by_source:
                 docs_by_source[source] = 0
             docs_by_source[source] += 1
         
         return {
             "collection_stats": stats,
-            "documents_count": len(docs[0]),
+            "documents_count": len(docs),
             "documents_by_source": docs_by_source,
-            "documents": [doc.payload for doc in docs[0]]
+            "documents": docs
         }
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des stats: {str(e)}")
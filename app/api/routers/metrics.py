@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from app.metrics import render_metrics
+
+metrics_router = r = APIRouter()
+
+
+@r.get("/metrics", include_in_schema=False)
+def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
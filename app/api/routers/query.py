@@ -1,19 +1,69 @@
+import asyncio
 import logging
+import os
+from typing import List, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+
+from app.api.routers.models import SourceNodes
+from app.api.services.admission import admission_controller, get_client_key
+from app.engine.context_packer import ContextPacker, get_token_budgets
 from app.engine.index import IndexConfig, get_index
+from app.engine.parent_child import ParentExpander
+from app.engine.query_filter import generate_filters
+from app.engine.vectordb import abatch_query, get_vector_store
+from llama_index.core import Settings
 from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.response_synthesizers import get_response_synthesizer
+from llama_index.core.schema import NodeWithScore
 
 
 query_router = r = APIRouter()
 
 logger = logging.getLogger("uvicorn")
 
+MAX_BATCH_QUERIES = int(os.getenv("QUERY_BATCH_MAX_QUERIES", "256"))
+SYNTHESIS_CONCURRENCY = int(os.getenv("QUERY_BATCH_SYNTHESIS_CONCURRENCY", "8"))
+EMBED_CONCURRENCY = int(os.getenv("QUERY_BATCH_EMBED_CONCURRENCY", "16"))
+
+
+def get_node_postprocessors() -> List[BaseNodePostprocessor]:
+    # Same as the chat engine: child chunks are replaced by their parent section, then
+    # deduplicated, merged and packed into the context budget. A query has no chat
+    # history, so the history budget goes to the context as well.
+    context_budget, history_budget = get_token_budgets(Settings.llm, "")
+    return [ParentExpander(), ContextPacker(token_budget=context_budget + history_budget)]
+
 
 def get_query_engine() -> BaseQueryEngine:
     index_config = IndexConfig(**{})
     index = get_index(index_config)
-    return index.as_query_engine()
+    # Requête anonyme : uniquement les documents publics
+    return index.as_query_engine(
+        filters=generate_filters(),
+        similarity_top_k=int(os.getenv("CHAT_CANDIDATE_TOP_K", "10")),
+        node_postprocessors=get_node_postprocessors(),
+    )
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1)
+    top_k: int = Field(default=5, ge=1, le=100)
+    synthesize: bool = Field(
+        default=False, description="Also generate an answer for each query from its nodes"
+    )
+
+
+class BatchQueryResult(BaseModel):
+    query: str
+    nodes: List[SourceNodes]
+    response: Optional[str] = None
+
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
 
 
 @r.get(
@@ -23,7 +73,80 @@ def get_query_engine() -> BaseQueryEngine:
 )
 async def query_request(
     query: str,
+    request: Request,
 ) -> str:
-    query_engine = get_query_engine()
-    response = await query_engine.aquery(query)
-    return response.response
+    async with admission_controller.slot(get_client_key(request)):
+        query_engine = get_query_engine()
+        response = await query_engine.aquery(query)
+        return response.response
+
+
+@r.post(
+    "/batch",
+    summary="Retrieve nodes for many queries at once",
+    description="Embeds the queries concurrently, searches the knowledge base with one batch search and returns the ranked nodes of each query. With `synthesize`, the answers are generated concurrently, each generation being admitted like a single query.",
+)
+async def batch_query_request(
+    data: BatchQueryRequest,
+    request: Request,
+) -> BatchQueryResponse:
+    if len(data.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries, the maximum is {MAX_BATCH_QUERIES}",
+        )
+    client_key = get_client_key(request)
+    async with admission_controller.slot(client_key):
+        # Query embeddings, not text embeddings: some models embed queries differently
+        # (instruction prefix for HuggingFace, task type for Gemini)
+        embed_semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+        async def embed(query: str) -> List[float]:
+            async with embed_semaphore:
+                return await Settings.embed_model.aget_query_embedding(query)
+
+        embeddings = await asyncio.gather(*[embed(query) for query in data.queries])
+        results = await abatch_query(
+            get_vector_store(), embeddings, data.top_k, filters=generate_filters()
+        )
+        nodes = [
+            [
+                NodeWithScore(node=node, score=score)
+                for node, score in zip(result.nodes, result.similarities or [])
+            ]
+            for result in results
+        ]
+
+    responses: List[Optional[str]] = [None] * len(data.queries)
+    if data.synthesize:
+        # Each generation is an LLM call and takes its own admission slot, like a single
+        # query. The concurrency stays within the per-user limit so that a batch never
+        # rejects itself.
+        synthesizer = get_response_synthesizer()
+        postprocessors = get_node_postprocessors()
+        semaphore = asyncio.Semaphore(
+            max(1, min(SYNTHESIS_CONCURRENCY, admission_controller.max_per_user))
+        )
+
+        async def synthesize(i: int) -> None:
+            context_nodes = nodes[i]
+            for postprocessor in postprocessors:
+                context_nodes = postprocessor.postprocess_nodes(
+                    context_nodes, query_str=data.queries[i]
+                )
+            async with semaphore, admission_controller.slot(client_key):
+                response = await synthesizer.asynthesize(data.queries[i], context_nodes)
+                responses[i] = str(response)
+
+        await asyncio.gather(*[synthesize(i) for i in range(len(data.queries))])
+
+    return BatchQueryResponse(
+        results=[
+            BatchQueryResult(
+                query=query,
+                nodes=SourceNodes.from_source_nodes(query_nodes),
+                response=response,
+            )
+            for query, query_nodes, response in zip(data.queries, nodes, responses)
+        ]
+    )
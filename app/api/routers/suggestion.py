@@ -0,0 +1,35 @@
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+
+from app.api.auth import get_current_user
+from app.api.routers.models import ChatData
+from app.api.services.admission import admission_controller
+from app.api.services.suggestion import NextQuestionSuggestion
+from app.models.user import User
+
+suggestion_router = r = APIRouter()
+
+logger = logging.getLogger("uvicorn")
+
+
+@r.post("")
+async def suggest_next_questions(
+    data: ChatData,
+    current_user: User = Depends(get_current_user),
+) -> Optional[List[str]]:
+    """
+    Get the next questions for a conversation whose last message is the assistant's answer.
+    Questions generated while streaming the answer are served from the cache, otherwise
+    the LLM call goes through the admission control like a chat request.
+    """
+    if NextQuestionSuggestion.get_configured_prompt() is None:
+        return None
+    questions = await NextQuestionSuggestion.get_cached_questions(data.messages)
+    if questions is not None:
+        return questions
+    async with admission_controller.slot(str(current_user.id)):
+        return await NextQuestionSuggestion.suggest_next_questions_all_messages(
+            data.messages, use_cache=False
+        )
@@ -1,10 +1,12 @@
 import logging
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
+from app.api.auth import get_current_user
 from app.api.routers.models import DocumentFile
+from app.models.user import User
 from app.services.file import FileService
 
 file_upload_router = r = APIRouter()
@@ -19,14 +21,16 @@ class FileUploadRequest(BaseModel):
 
 
 @r.post("")
-def upload_file(request: FileUploadRequest) -> DocumentFile:
+def upload_file(
+    request: FileUploadRequest, current_user: User = Depends(get_current_user)
+) -> DocumentFile:
     """
     To upload a private file from the chat UI.
     """
     try:
         logger.info(f"Processing file: {request.name}")
         return FileService.process_private_file(
-            request.name, request.base64, request.params
+            request.name, request.base64, request.params, user_id=str(current_user.id)
         )
     except Exception as e:
         logger.error(f"Error processing file: {e}", exc_info=True)
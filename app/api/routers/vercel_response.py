@@ -1,6 +1,6 @@
-import json
+import asyncio
 import logging
-from typing import Awaitable, List
+from typing import Awaitable, List, Optional
 
 from aiostream import stream
 from fastapi import BackgroundTasks, Request
@@ -9,7 +9,8 @@ from llama_index.core.chat_engine.types import StreamingAgentChatResponse
 from llama_index.core.schema import NodeWithScore
 
 from app.api.routers.events import EventCallbackHandler
-from app.api.routers.models import ChatData, Message, SourceNodes
+from app.api.routers.models import ChatData, SourceNodes
+from app.api.services.streaming import aclose_chat_response, coalesce_tokens, dumps
 from app.api.services.suggestion import NextQuestionSuggestion
 
 logger = logging.getLogger("uvicorn")
@@ -58,6 +59,9 @@ class VercelStreamResponse(StreamingResponse):
             async with combine.stream() as streamer:
                 async for output in streamer:
                     if await request.is_disconnected():
+                        # Leaving the merged stream closes the chat response generator,
+                        # which stops the LLM generation and the pending follow-up calls
+                        logger.info("Client disconnected, stopping the response stream")
                         break
 
                     if not is_stream_started:
@@ -115,35 +119,63 @@ class VercelStreamResponse(StreamingResponse):
             }
         )
 
-        final_response = ""
-        async for token in result.async_response_gen():
-            final_response += token
-            yield cls.convert_text(token)
-
-        # Generate next questions if next question prompt is configured
-        question_data = await cls._generate_next_questions(
-            chat_data.messages, final_response
-        )
-        if question_data:
-            yield cls.convert_data(question_data)
+        # Group the tokens into bigger frames to reduce the per-token overhead
+        response_parts = []
+        response_size = 0
+        tokens = coalesce_tokens(result.async_response_gen())
+        questions_task: Optional[asyncio.Task] = None
+        speculative_chars = NextQuestionSuggestion.get_speculative_chars()
+        is_complete = False
+        try:
+            async for chunk in tokens:
+                response_parts.append(chunk)
+                response_size += len(chunk)
+                # Speculatively generate the next questions from the partial answer
+                if (
+                    questions_task is None
+                    and speculative_chars > 0
+                    and response_size >= speculative_chars
+                ):
+                    questions_task = NextQuestionSuggestion.start_speculative(
+                        chat_data.messages, "".join(response_parts)
+                    )
+                yield cls.convert_text(chunk)
+            final_response = "".join(response_parts)
+
+            # the text_generator is the leading stream, once it's finished, also finish the event stream
+            event_handler.is_done = True
 
-        # the text_generator is the leading stream, once it's finished, also finish the event stream
-        event_handler.is_done = True
+            # Send the next questions only if they are ready, don't keep the stream open for them
+            if questions_task is None:
+                questions_task = NextQuestionSuggestion.start(
+                    chat_data.messages, final_response
+                )
+            questions = await NextQuestionSuggestion.collect(questions_task)
+            if questions:
+                yield cls.convert_data({"type": "suggested_questions", "data": questions})
+            is_complete = True
+        finally:
+            # Stop the LLM generation if the stream is closed early (e.g. client disconnected)
+            await tokens.aclose()
+            if not is_complete:
+                await aclose_chat_response(result)
+                if questions_task is not None:
+                    questions_task.cancel()
 
     @classmethod
     def convert_text(cls, token: str):
         # Escape newlines and double quotes to avoid breaking the stream
-        token = json.dumps(token)
+        token = dumps(token)
         return f"{cls.TEXT_PREFIX}{token}\n"
 
     @classmethod
     def convert_data(cls, data: dict):
-        data_str = json.dumps(data)
+        data_str = dumps(data)
         return f"{cls.DATA_PREFIX}[{data_str}]\n"
 
     @classmethod
     def convert_error(cls, error: str):
-        error_str = json.dumps(error)
+        error_str = dumps(error)
         return f"{cls.ERROR_PREFIX}{error_str}\n"
 
     @staticmethod
@@ -163,15 +195,3 @@ class VercelStreamResponse(StreamingResponse):
                 "LlamaCloud is not configured. Skipping post processing of nodes"
             )
             pass
-
-    @staticmethod
-    async def _generate_next_questions(chat_history: List[Message], response: str):
-        questions = await NextQuestionSuggestion.suggest_next_questions(
-            chat_history, response
-        )
-        if questions:
-            return {
-                "type": "suggested_questions",
-                "data": questions,
-            }
-        return None
@@ -0,0 +1,239 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict
+
+from fastapi import HTTPException, Request, status
+
+from app.metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT,
+)
+
+logger = logging.getLogger("uvicorn")
+
+
+class AdmissionSlot:
+    """
+    A slot granted by the admission controller, release it once the request is finished.
+    Releasing is idempotent so it can be done from several places (e.g. stream end and background task).
+    """
+
+    __slots__ = ("_controller", "_key", "_released")
+
+    def __init__(self, controller: "AdmissionController", key: str):
+        self._controller = controller
+        self._key = key
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self._key)
+
+
+class AdmissionController:
+    """
+    Limit the number of concurrent LLM-bound requests handled by this worker.
+
+    Requests above the concurrency limit wait in a bounded queue, served round-robin
+    per user so that a single user can't starve the others. Requests are rejected
+    fast with a 429 when the queue is full, when the user already has too many
+    requests in flight or when the wait takes too long.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        max_per_user: int,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self._active = 0
+        self._queued = 0
+        self._per_user: Counter = Counter()
+        # Waiting requests per user, the order of the users is the round-robin order
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._rejected = 0
+        self._admitted = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+            max_per_user=int(os.getenv("ADMISSION_MAX_PER_USER", "2")),
+        )
+
+    def _reject(self, reason: str) -> HTTPException:
+        self._rejected += 1
+        ADMISSION_REJECTED.inc()
+        logger.warning(f"Request rejected by admission control: {reason}")
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=reason,
+            headers={"Retry-After": "1"},
+        )
+
+    async def acquire(self, key: str) -> AdmissionSlot:
+        """
+        Wait for a slot for the given user key, raise a 429 HTTPException if the request is not admitted.
+        """
+        if self._per_user[key] >= self.max_per_user:
+            raise self._reject("Too many concurrent requests for this user")
+
+        if self._active < self.max_concurrency and self._queued == 0:
+            self._grant(key, 0.0)
+            return AdmissionSlot(self, key)
+
+        if self._queued >= self.max_queue:
+            raise self._reject("Server is busy, please retry later")
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        self._queued += 1
+        self._update_gauges()
+        # The user's waiting request counts for its share
+        self._per_user[key] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted while we were cancelled, give it back
+                self._release(key)
+            else:
+                self._remove_waiter(key, future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("Timed out waiting for a free slot")
+            raise
+        self._record_wait(time.perf_counter() - start)
+        return AdmissionSlot(self, key)
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        admission_slot = await self.acquire(key)
+        try:
+            yield admission_slot
+        finally:
+            admission_slot.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "avg_wait_seconds": self._total_wait / self._admitted
+            if self._admitted
+            else 0.0,
+            "max_wait_seconds": self._max_wait,
+        }
+
+    def _grant(self, key: str, wait: float) -> None:
+        self._active += 1
+        self._per_user[key] += 1
+        self._update_gauges()
+        self._record_wait(wait)
+
+    def _record_wait(self, wait: float) -> None:
+        self._admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        ADMISSION_WAIT.observe(wait)
+
+    def _update_gauges(self) -> None:
+        ADMISSION_ACTIVE.set(self._active)
+        ADMISSION_QUEUE_DEPTH.set(self._queued)
+
+    def _remove_waiter(self, key: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(key)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiters[key]
+            self._queued -= 1
+            self._decrement_user(key)
+            self._update_gauges()
+
+    def _decrement_user(self, key: str) -> None:
+        self._per_user[key] -= 1
+        if self._per_user[key] <= 0:
+            del self._per_user[key]
+
+    def _release(self, key: str) -> None:
+        self._active -= 1
+        self._decrement_user(key)
+        self._wake_next()
+        self._update_gauges()
+
+    def _wake_next(self) -> None:
+        while self._active < self.max_concurrency and self._waiters:
+            # Round-robin: take the first user, move it to the end if it has more waiters
+            key, waiters = self._waiters.popitem(last=False)
+            future = waiters.popleft()
+            if waiters:
+                self._waiters[key] = waiters
+            self._queued -= 1
+            if future.done():
+                # Cancelled waiter, give its share back
+                self._decrement_user(key)
+                continue
+            # The waiter's share is kept, it's now an active request
+            self._active += 1
+            future.set_result(None)
+
+
+def _trusted_proxies() -> list:
+    return [
+        ipaddress.ip_network(network.strip(), strict=False)
+        for network in os.getenv("TRUSTED_PROXIES", "").split(",")
+        if network.strip()
+    ]
+
+
+def _is_trusted_proxy(host: str, proxies: list) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in proxies)
+
+
+def get_client_key(request: Request) -> str:
+    """
+    Admission key of an anonymous request: the client address. Behind a proxy or load
+    balancer listed in TRUSTED_PROXIES (addresses or networks, comma separated), the
+    client address is read from X-Forwarded-For: the last address not added by a
+    trusted proxy. Without it, every client would share the proxy's address.
+    """
+    host = request.client.host if request.client else "anonymous"
+    proxies = _trusted_proxies()
+    if not proxies or not _is_trusted_proxy(host, proxies):
+        return host
+    forwarded = [
+        address.strip()
+        for address in request.headers.get("x-forwarded-for", "").split(",")
+        if address.strip()
+    ]
+    for address in reversed(forwarded):
+        if not _is_trusted_proxy(address, proxies):
+            return address
+    return forwarded[0] if forwarded else host
+
+
+# One controller per worker process
+admission_controller = AdmissionController.from_env()
@@ -0,0 +1,68 @@
+import asyncio
+import itertools
+import logging
+import os
+from collections import deque
+from typing import Deque, Generic, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def get_max_progress_events() -> int:
+    return int(os.getenv("EVENT_QUEUE_MAXSIZE", "100"))
+
+
+class EventQueue(Generic[T]):
+    """
+    Callback events waiting to be streamed to the client, in the order they were put.
+
+    Progress events (retrieval and tool-call titles) are bounded so that a slow client
+    can't grow the memory without limit: past `max_progress` pending ones, the oldest is
+    removed, the latest progress being the most relevant one. Data events (tool outputs,
+    rendered by the UI) are never dropped.
+    """
+
+    def __init__(self, max_progress: Optional[int] = None):
+        self.max_progress = max_progress if max_progress is not None else get_max_progress_events()
+        # (sequence number, event): the two queues are merged back in order by `get`
+        self._progress: Deque[Tuple[int, T]] = deque()
+        self._data: Deque[Tuple[int, T]] = deque()
+        self._sequence = itertools.count()
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._progress) + len(self._data)
+
+    def empty(self) -> bool:
+        return not self._progress and not self._data
+
+    def put(self, event: T, progress: bool) -> None:
+        if progress:
+            if len(self._progress) >= self.max_progress:
+                self._progress.popleft()
+                logger.debug("Too many pending progress events, dropping the oldest one")
+            self._progress.append((next(self._sequence), event))
+        else:
+            self._data.append((next(self._sequence), event))
+        self._ready.set()
+
+    def get_nowait(self) -> Optional[T]:
+        if self._progress and (not self._data or self._progress[0][0] < self._data[0][0]):
+            return self._progress.popleft()[1]
+        if self._data:
+            return self._data.popleft()[1]
+        return None
+
+    async def get(self, timeout: float) -> Optional[T]:
+        """
+        Next event, or None if nothing was put within `timeout` seconds
+        """
+        if self.empty():
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.get_nowait()
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, AsyncIterable, AsyncIterator
+
+logger = logging.getLogger("uvicorn")
+
+try:
+    import orjson
+
+    def dumps(data: Any) -> str:
+        """
+        Serialize data to a JSON string, using orjson when it's installed
+        """
+        # Non-str dict keys are coerced to strings, like json.dumps does
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+except ImportError:
+
+    def dumps(data: Any) -> str:
+        """
+        Serialize data to a JSON string, using orjson when it's installed
+        """
+        return json.dumps(data)
+
+
+def get_coalesce_window() -> float:
+    """
+    Time window (in seconds) during which tokens are grouped into one frame.
+    Configure it with STREAM_COALESCE_MS, set it to 0 to send one frame per token.
+    """
+    return float(os.getenv("STREAM_COALESCE_MS", "25")) / 1000
+
+
+def get_coalesce_max_chars() -> int:
+    """
+    Maximum number of characters buffered before a frame is flushed.
+    Configure it with STREAM_COALESCE_MAX_CHARS.
+    """
+    return int(os.getenv("STREAM_COALESCE_MAX_CHARS", "1024"))
+
+
+async def coalesce_tokens(
+    tokens: AsyncIterable[str],
+    window: float | None = None,
+    max_chars: int | None = None,
+) -> AsyncIterator[str]:
+    """
+    Group the tokens of a stream into bigger chunks.
+
+    A chunk is yielded `window` seconds after the first token was buffered
+    or as soon as the buffer reaches `max_chars` characters, whichever comes first.
+    The upstream stream is consumed by a background task so that the deadline
+    is kept even if the upstream stalls.
+    """
+    if window is None:
+        window = get_coalesce_window()
+    if max_chars is None:
+        max_chars = get_coalesce_max_chars()
+
+    if window <= 0:
+        async for token in tokens:
+            if token:
+                yield token
+        return
+
+    buffer: list[str] = []
+    size = 0
+    finished = False
+    has_data = asyncio.Event()
+    is_full = asyncio.Event()
+
+    async def consume():
+        nonlocal size, finished
+        try:
+            async for token in tokens:
+                if not token:
+                    continue
+                buffer.append(token)
+                size += len(token)
+                has_data.set()
+                if size >= max_chars:
+                    is_full.set()
+        finally:
+            finished = True
+            has_data.set()
+            is_full.set()
+
+    consumer = asyncio.ensure_future(consume())
+    try:
+        while True:
+            await has_data.wait()
+            if not finished:
+                try:
+                    await asyncio.wait_for(is_full.wait(), timeout=window)
+                except asyncio.TimeoutError:
+                    pass
+            if finished and not buffer:
+                break
+            chunk = "".join(buffer)
+            buffer.clear()
+            size = 0
+            # Reset the events before yielding, tokens received meanwhile set them again
+            if not finished:
+                has_data.clear()
+                is_full.clear()
+            if chunk:
+                yield chunk
+        # Propagate the error of the upstream stream (if any)
+        await consumer
+    finally:
+        if not consumer.done():
+            consumer.cancel()
+
+
+async def aclose_chat_response(response: Any) -> None:
+    """
+    Stop the generation of a streaming chat response, e.g. when the client is gone.
+    Cancels the task writing the response to the memory and closes the LLM stream.
+    """
+    task = getattr(response, "awrite_response_to_history_task", None)
+    if isinstance(task, asyncio.Task) and not task.done():
+        task.cancel()
+    stream = getattr(response, "achat_stream", None)
+    # A running stream is stopped by cancelling the task which iterates it
+    if stream is not None and not getattr(stream, "ag_running", True):
+        try:
+            await stream.aclose()
+        except Exception as e:
+            logger.debug(f"Error when closing the chat stream: {e}")
@@ -1,21 +1,103 @@
+import asyncio
+import functools
+import hashlib
+import json
 import logging
 import os
 import re
-from typing import List, Optional
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 
-from app.api.routers.models import Message
+from app.metrics import observe_cache
+from llama_index.core.llms import LLM
 from llama_index.core.prompts import PromptTemplate
 from llama_index.core.settings import Settings
 
+if TYPE_CHECKING:
+    # Imported at runtime where needed: importing app.api.routers imports the routers,
+    # which import this module
+    from app.api.routers.models import Message
+
 logger = logging.getLogger("uvicorn")
 
 
+class SuggestionCache:
+    """
+    Next questions shared by all the workers of the server: the follow-up request for the
+    suggestions usually lands on another worker than the chat stream. Entries expire after
+    `ttl` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, questions TEXT NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, keys: List[str]) -> Optional[List[str]]:
+        """
+        Questions of the first key found (and not expired)
+        """
+        if not keys:
+            return None
+        placeholders = ",".join("?" * len(keys))
+        rows = dict(
+            self._connection().execute(
+                f"SELECT key, questions FROM questions WHERE key IN ({placeholders}) "
+                "AND expires_at > ?",
+                (*keys, time.time()),
+            )
+        )
+        for key in keys:
+            if key in rows:
+                return json.loads(rows[key])
+        return None
+
+    def put(self, key: str, questions: List[str]) -> None:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM questions WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO questions VALUES (?, ?, ?)",
+                (key, now + self.ttl, json.dumps(questions)),
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def get_suggestion_cache() -> SuggestionCache:
+    path = os.getenv(
+        "NEXT_QUESTION_CACHE_PATH",
+        os.path.join(os.getenv("STORAGE_DIR", "storage"), "next_questions.sqlite3"),
+    )
+    return SuggestionCache(path, ttl=float(os.getenv("NEXT_QUESTION_CACHE_TTL", "3600")))
+
+
 class NextQuestionSuggestion:
     """
     Suggest the next questions that user might ask based on the conversation history
     Disable this feature by removing the NEXT_QUESTION_PROMPT environment variable
+    Use a cheaper model for the suggestions by setting the NEXT_QUESTION_MODEL environment variable
     """
 
+    _llms: Dict[str, LLM] = {}
+    # Keep references to the suggestion tasks which outlive their stream
+    _background_tasks: Set[asyncio.Task] = set()
+
     @classmethod
     def get_configured_prompt(cls) -> Optional[str]:
         prompt = os.getenv("NEXT_QUESTION_PROMPT", None)
@@ -23,10 +105,73 @@ class NextQuestionSuggestion:
             return None
         return PromptTemplate(prompt)
 
+    @classmethod
+    def get_llm(cls) -> LLM:
+        """
+        Get the LLM used for the suggestions: the configured LLM with the model
+        overridden by NEXT_QUESTION_MODEL (if set)
+        """
+        model = os.getenv("NEXT_QUESTION_MODEL")
+        if not model:
+            return Settings.llm
+        llm = cls._llms.get(model)
+        if llm is None:
+            try:
+                llm = Settings.llm.model_copy(update={"model": model})
+            except Exception as e:
+                logger.warning(
+                    f"Can't use model {model} for next questions, using the default LLM: {e}"
+                )
+                llm = Settings.llm
+            cls._llms[model] = llm
+        return llm
+
+    @staticmethod
+    def _get_last_messages(messages: List["Message"]) -> Tuple[Optional[str], Optional[str]]:
+        last_user_message = None
+        last_assistant_message = None
+        for message in reversed(messages):
+            if message.role == "user" and last_user_message is None:
+                last_user_message = message.content
+            elif message.role == "assistant" and last_assistant_message is None:
+                last_assistant_message = message.content
+            if last_user_message is not None and last_assistant_message is not None:
+                break
+        return last_user_message, last_assistant_message
+
+    @staticmethod
+    def _cache_key(user_message: str, answer: str) -> str:
+        return hashlib.sha256(f"{user_message}\0{answer}".encode()).hexdigest()
+
+    @classmethod
+    def _get_cache_keys(cls, messages: List["Message"]) -> List[str]:
+        """
+        Keys under which the questions for this conversation may be cached: the answer,
+        and the partial answer the questions were speculatively generated from
+        """
+        user_message, answer = cls._get_last_messages(messages)
+        if user_message is None or answer is None:
+            return []
+        keys = [cls._cache_key(user_message, answer)]
+        speculative_chars = cls.get_speculative_chars()
+        if 0 < speculative_chars < len(answer):
+            keys.append(cls._cache_key(user_message, answer[:speculative_chars]))
+        return keys
+
+    @classmethod
+    async def get_cached_questions(cls, messages: List["Message"]) -> Optional[List[str]]:
+        # SQLite in a worker thread: a writer in another worker may hold the lock
+        questions = await asyncio.to_thread(
+            get_suggestion_cache().get, cls._get_cache_keys(messages)
+        )
+        observe_cache("next_questions", questions is not None)
+        return questions
+
     @classmethod
     async def suggest_next_questions_all_messages(
         cls,
-        messages: List[Message],
+        messages: List["Message"],
+        use_cache: bool = True,
     ) -> Optional[List[str]]:
         """
         Suggest the next questions that user might ask based on the conversation history
@@ -36,6 +181,11 @@ class NextQuestionSuggestion:
         if not prompt_template:
             return None
 
+        if use_cache:
+            questions = await cls.get_cached_questions(messages)
+            if questions is not None:
+                return questions
+
         try:
             # Reduce the cost by only using the last two messages
             last_user_message = None
@@ -51,9 +201,15 @@ class NextQuestionSuggestion:
 
             # Call the LLM and parse questions from the output
             prompt = prompt_template.format(conversation=conversation)
-            output = await Settings.llm.acomplete(prompt)
+            output = await cls.get_llm().acomplete(prompt)
             questions = cls._extract_questions(output.text)
 
+            # Cached under the text the questions were generated from
+            user_message, answer = cls._get_last_messages(messages)
+            if questions and user_message is not None and answer is not None:
+                await asyncio.to_thread(
+                    get_suggestion_cache().put, cls._cache_key(user_message, answer), questions
+                )
             return questions
         except Exception as e:
             logger.error(f"Error when generating next question: {e}")
@@ -70,11 +226,61 @@ class NextQuestionSuggestion:
     @classmethod
     async def suggest_next_questions(
         cls,
-        chat_history: List[Message],
+        chat_history: List["Message"],
         response: str,
     ) -> List[str]:
         """
         Suggest the next questions that user might ask based on the chat history and the last response
         """
+        from app.api.routers.models import Message
+
         messages = chat_history + [Message(role="assistant", content=response)]
         return await cls.suggest_next_questions_all_messages(messages)
+
+    @staticmethod
+    def get_speculative_chars() -> int:
+        """
+        Length of the partial answer from which the next questions are generated.
+        Configure it with NEXT_QUESTION_SPECULATIVE_CHARS, 0 disables the speculative generation.
+        """
+        return int(os.getenv("NEXT_QUESTION_SPECULATIVE_CHARS", "500"))
+
+    @classmethod
+    def start(
+        cls, chat_history: List["Message"], response: str
+    ) -> Optional[asyncio.Task]:
+        """
+        Start generating the next questions in the background, None if suggestions are disabled
+        """
+        if cls.get_configured_prompt() is None:
+            return None
+        task = asyncio.create_task(cls.suggest_next_questions(chat_history, response))
+        cls._background_tasks.add(task)
+        task.add_done_callback(cls._background_tasks.discard)
+        return task
+
+    @classmethod
+    def start_speculative(
+        cls, chat_history: List["Message"], partial_response: str
+    ) -> Optional[asyncio.Task]:
+        """
+        Start generating the next questions from the first NEXT_QUESTION_SPECULATIVE_CHARS
+        characters of the answer, while the rest of the answer is streamed
+        """
+        return cls.start(chat_history, partial_response[: cls.get_speculative_chars()])
+
+    @staticmethod
+    async def collect(task: Optional[asyncio.Task]) -> Optional[List[str]]:
+        """
+        Return the next questions if they are ready (after waiting at most NEXT_QUESTION_WAIT_MS).
+        Otherwise, the task keeps running and caches the questions, so that the client
+        can fetch them from the suggestions endpoint.
+        """
+        if task is None:
+            return None
+        wait = float(os.getenv("NEXT_QUESTION_WAIT_MS", "0")) / 1000
+        if not task.done() and wait > 0:
+            await asyncio.wait({task}, timeout=wait)
+        if not task.done() or task.cancelled():
+            return None
+        return task.result()
@@ -0,0 +1,378 @@
+import logging
+import os
+import re
+from abc import abstractmethod
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core import Document
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser import (
+    NodeParser,
+    SemanticSplitterNodeParser,
+    SentenceSplitter,
+)
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+from llama_index.core.settings import Settings
+
+from app.engine.loaders import SUPPORTED_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# (texte de la section, métadonnées propres à la section)
+Section = Tuple[str, Dict[str, Any]]
+
+_MD_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_MD_FENCE = re.compile(r"^\s*(```|~~~)")
+
+HTML_HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+HTML_BLOCKS = HTML_HEADINGS + (
+    "p", "li", "pre", "blockquote", "td", "th", "dt", "dd", "caption", "figcaption",
+)
+
+
+class StructuredSplitter(NodeParser):
+    """
+    Découpage en deux temps : le document est d'abord découpé selon sa structure
+    (titres, lignes...), puis les sections sont regroupées tant qu'elles tiennent dans
+    `chunk_size` tokens, et les sections trop longues redécoupées par phrases.
+
+    Les chunks restent rattachés au document d'origine (ref_doc_id) et gardent leur
+    position dans celui-ci quand le texte est repris tel quel. Sinon (`verbatim_sections`
+    à False, texte extrait du HTML), les positions sont celles du texte extrait, les
+    sections mises bout à bout : sans rapport avec le fichier source, mais cohérentes
+    entre les chunks d'un même document, ce qui suffit au ContextPacker pour fusionner
+    les chunks adjacents.
+    """
+
+    verbatim_sections: ClassVar[bool] = True
+
+    chunk_size: int = Field(description="Nombre maximal de tokens par chunk")
+    chunk_overlap: int = Field(
+        default=0, description="Chevauchement (tokens) des sections redécoupées par phrases"
+    )
+    _sentence_splitter: SentenceSplitter = PrivateAttr()
+    _tokenizer: Callable = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sentence_splitter = SentenceSplitter(
+            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+        )
+        self._tokenizer = Settings.tokenizer
+
+    @abstractmethod
+    def split_sections(self, node: BaseNode) -> List[Section]:
+        """Sections du document, dans l'ordre"""
+
+    def _pack(self, sections: List[Section], max_sections: Optional[int] = None) -> List[Section]:
+        chunks: List[Section] = []
+        text, metadata, tokens, count = "", {}, 0, 0
+        for section_text, section_metadata in sections:
+            section_tokens = len(self._tokenizer(section_text))
+            if (
+                text
+                and tokens + section_tokens <= self.chunk_size
+                and (max_sections is None or count < max_sections)
+            ):
+                # Les petites sections consécutives forment un seul chunk
+                text += section_text
+                tokens += section_tokens
+                count += 1
+                continue
+            if text:
+                chunks.append((text, metadata))
+            if section_tokens > self.chunk_size:
+                chunks.extend(
+                    (split, section_metadata)
+                    for split in self._sentence_splitter.split_text(section_text)
+                )
+                text, metadata, tokens, count = "", {}, 0, 0
+            else:
+                text, metadata, tokens, count = section_text, section_metadata, section_tokens, 1
+        if text:
+            chunks.append((text, metadata))
+        return [(text, metadata) for text, metadata in chunks if text.strip()]
+
+    def _parse_nodes(
+        self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any
+    ) -> List[BaseNode]:
+        all_nodes: List[BaseNode] = []
+        for node in nodes:
+            sections = self.split_sections(node)
+            chunks = self._pack(sections)
+            split_nodes = build_nodes_from_splits(
+                [text for text, _ in chunks], node, id_func=self.id_func
+            )
+            for split_node, (_, metadata) in zip(split_nodes, chunks):
+                split_node.metadata.update(metadata)
+            if not self.verbatim_sections:
+                self._set_extracted_offsets(split_nodes, sections)
+            all_nodes.extend(split_nodes)
+        return all_nodes
+
+    @staticmethod
+    def _set_extracted_offsets(split_nodes: List[BaseNode], sections: List[Section]) -> None:
+        # Les chunks se suivent dans le texte extrait (ou se chevauchent, après un
+        # redécoupage par phrases) : recherche à partir du début du chunk précédent
+        extracted = "".join(text for text, _ in sections)
+        position = 0
+        for split_node in split_nodes:
+            text = split_node.get_content(metadata_mode=MetadataMode.NONE)
+            start = extracted.find(text, position)
+            if start < 0:
+                continue
+            split_node.start_char_idx = start
+            split_node.end_char_idx = start + len(text)
+            position = start
+
+    def _postprocess_parsed_nodes(
+        self, nodes: List[BaseNode], parent_doc_map: Dict[str, Document]
+    ) -> List[BaseNode]:
+        if self.verbatim_sections:
+            return super()._postprocess_parsed_nodes(nodes, parent_doc_map)
+        # La classe parente remplace les positions par celles du texte dans le document
+        # quand elle l'y trouve : les positions dans le texte extrait sont gardées
+        offsets = [(node.start_char_idx, node.end_char_idx) for node in nodes]
+        nodes = super()._postprocess_parsed_nodes(nodes, parent_doc_map)
+        for node, (start, end) in zip(nodes, offsets):
+            node.start_char_idx, node.end_char_idx = start, end
+        return nodes
+
+
+class MarkdownSectionSplitter(StructuredSplitter):
+    """
+    Une section par titre markdown (hors blocs de code), avec le chemin des titres
+    (`header_path`) dans les métadonnées.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MarkdownSectionSplitter"
+
+    def split_sections(self, node: BaseNode) -> List[Section]:
+        sections: List[Section] = []
+        headers: List[str] = []
+        current: List[str] = []
+        in_code = False
+
+        def header_path() -> Dict[str, Any]:
+            return {"header_path": "/" + "/".join(headers) + "/"} if headers else {}
+
+        metadata = header_path()
+        for line in node.get_content(metadata_mode=MetadataMode.NONE).splitlines(keepends=True):
+            if _MD_FENCE.match(line):
+                in_code = not in_code
+            heading = None if in_code else _MD_HEADING.match(line)
+            if heading:
+                if current:
+                    sections.append(("".join(current), metadata))
+                level = len(heading.group(1))
+                headers = headers[: level - 1] + [heading.group(2)]
+                metadata = header_path()
+                current = []
+            current.append(line)
+        if current:
+            sections.append(("".join(current), metadata))
+        return sections
+
+
+class HTMLSectionSplitter(StructuredSplitter):
+    """
+    Texte des blocs du DOM (paragraphes, listes, tableaux...), une section par titre
+    h1-h6 : le balisage HTML n'est pas envoyé à l'embedding ni au LLM.
+    Les positions des chunks sont celles du texte extrait, pas du fichier HTML.
+    """
+
+    verbatim_sections: ClassVar[bool] = False
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HTMLSectionSplitter"
+
+    def split_sections(self, node: BaseNode) -> List[Section]:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(node.get_content(metadata_mode=MetadataMode.NONE), "html.parser")
+        for tag in soup(["script", "style", "noscript", "template"]):
+            tag.decompose()
+
+        sections: List[Section] = []
+        headers: List[str] = []
+        current: List[str] = []
+        metadata: Dict[str, Any] = {}
+        for tag in soup.find_all(HTML_BLOCKS):
+            # Le texte d'un bloc imbriqué est déjà repris par son bloc parent
+            if tag.find_parent(HTML_BLOCKS) is not None:
+                continue
+            text = tag.get_text(" ", strip=True)
+            if not text:
+                continue
+            if tag.name in HTML_HEADINGS:
+                if current:
+                    sections.append(("".join(current), metadata))
+                level = int(tag.name[1])
+                headers = headers[: level - 1] + [text]
+                metadata = {"header_path": "/" + "/".join(headers) + "/"}
+                current = []
+            current.append(text + "\n")
+        if current:
+            sections.append(("".join(current), metadata))
+        return sections
+
+
+class RowGroupSplitter(StructuredSplitter):
+    """
+    Groupes de lignes consécutives pour les tableaux (CSV, Excel) : une ligne n'est
+    jamais coupée, au plus `max_rows` lignes par chunk.
+    """
+
+    max_rows: int = Field(default=50, gt=0, description="Nombre maximal de lignes par chunk")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RowGroupSplitter"
+
+    def split_sections(self, node: BaseNode) -> List[Section]:
+        rows = node.get_content(metadata_mode=MetadataMode.NONE).splitlines(keepends=True)
+        return [(row, {}) for row in rows]
+
+    def _pack(self, sections: List[Section], max_sections: Optional[int] = None) -> List[Section]:
+        return super()._pack(sections, max_sections=self.max_rows)
+
+
+class SemanticSectionSplitter(StructuredSplitter):
+    """
+    Sections de texte délimitées par les ruptures de sens entre phrases consécutives
+    (distance entre embeddings). Chaque phrase est embeddée à l'ingestion.
+    """
+
+    breakpoint_percentile_threshold: int = Field(default=95)
+    _semantic: SemanticSplitterNodeParser = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._semantic = SemanticSplitterNodeParser.from_defaults(
+            embed_model=Settings.embed_model,
+            breakpoint_percentile_threshold=self.breakpoint_percentile_threshold,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SemanticSectionSplitter"
+
+    def split_sections(self, node: BaseNode) -> List[Section]:
+        document = Document(text=node.get_content(metadata_mode=MetadataMode.NONE))
+        return [
+            (split.get_content(), {})
+            for split in self._semantic.build_semantic_nodes_from_documents([document])
+        ]
+
+
+def _sentence_chunker(chunk_size: int, chunk_overlap: int) -> NodeParser:
+    return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+# Registre des découpeurs : nom -> fabrique(chunk_size, chunk_overlap)
+CHUNKERS: Dict[str, Callable[[int, int], NodeParser]] = {
+    "sentence": _sentence_chunker,
+    "markdown": lambda size, overlap: MarkdownSectionSplitter(
+        chunk_size=size, chunk_overlap=overlap
+    ),
+    "html": lambda size, overlap: HTMLSectionSplitter(chunk_size=size, chunk_overlap=overlap),
+    "rows": lambda size, overlap: RowGroupSplitter(
+        chunk_size=size, max_rows=int(os.getenv("CHUNK_MAX_ROWS", "50"))
+    ),
+    "semantic": lambda size, overlap: SemanticSectionSplitter(
+        chunk_size=size, chunk_overlap=overlap
+    ),
+}
+
+# Découpeur par extension ; les autres formats sont traités comme de la prose
+EXTENSION_CHUNKERS: Dict[str, str] = {
+    ".md": "markdown",
+    ".html": "html",
+    ".htm": "html",
+    ".csv": "rows",
+    ".xlsx": "rows",
+    ".xls": "rows",
+}
+
+
+def register_chunker(
+    name: str,
+    factory: Callable[[int, int], NodeParser],
+    extensions: Sequence[str] = (),
+) -> None:
+    """
+    Ajoute un découpeur au registre, éventuellement associé à des extensions de fichiers
+    """
+    CHUNKERS[name] = factory
+    for extension in extensions:
+        EXTENSION_CHUNKERS[extension] = name
+
+
+def get_extension_chunkers() -> Dict[str, str]:
+    """
+    Découpeur de chaque extension supportée. La prose utilise CHUNKER_PROSE
+    (sentence par défaut, semantic pour un découpage selon le sens, plus coûteux),
+    et CHUNKER_BY_EXTENSION remplace des associations (ex. ".md=sentence,.txt=semantic").
+    """
+    prose = os.getenv("CHUNKER_PROSE", "sentence")
+    mapping = {
+        extension: EXTENSION_CHUNKERS.get(extension, prose)
+        for extension in SUPPORTED_EXTENSIONS | set(EXTENSION_CHUNKERS)
+    }
+    for item in filter(None, os.getenv("CHUNKER_BY_EXTENSION", "").split(",")):
+        extension, _, name = item.partition("=")
+        mapping[extension.strip().lower()] = name.strip()
+    unknown = set(mapping.values()) - set(CHUNKERS)
+    if unknown:
+        raise ValueError(f"Unknown chunkers: {', '.join(sorted(unknown))}")
+    return mapping
+
+
+def get_node_extension(node: BaseNode) -> str:
+    path = node.metadata.get("file_path") or node.metadata.get("file_name") or ""
+    return os.path.splitext(path)[1].lower()
+
+
+class ChunkerRouter(TransformComponent):
+    """
+    Découpe chaque document avec le découpeur associé à son extension.
+
+    `chunker` force un même découpeur pour tous les documents (comparaisons).
+    """
+
+    chunk_size: int
+    chunk_overlap: int
+    chunker: Optional[str] = None
+    _mapping: Dict[str, str] = PrivateAttr()
+    _parsers: Dict[str, NodeParser] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._mapping = get_extension_chunkers()
+        if self.chunker is not None and self.chunker not in CHUNKERS:
+            raise ValueError(f"Unknown chunker: {self.chunker}")
+
+    def get_parser(self, node: BaseNode) -> NodeParser:
+        name = self.chunker or self._mapping.get(
+            get_node_extension(node), os.getenv("CHUNKER_PROSE", "sentence")
+        )
+        if name not in self._parsers:
+            self._parsers[name] = CHUNKERS[name](self.chunk_size, self.chunk_overlap)
+        return self._parsers[name]
+
+    def __call__(self, nodes: Sequence[BaseNode], **kwargs: Any) -> Sequence[BaseNode]:
+        groups: Dict[int, List[BaseNode]] = {}
+        parsers: Dict[int, NodeParser] = {}
+        for node in nodes:
+            parser = self.get_parser(node)
+            parsers[id(parser)] = parser
+            groups.setdefault(id(parser), []).append(node)
+
+        result: List[BaseNode] = []
+        for key, group in groups.items():
+            result.extend(parsers[key](group, **kwargs))
+        return result
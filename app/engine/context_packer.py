@@ -0,0 +1,157 @@
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.chat_engine.context import DEFAULT_CONTEXT_TEMPLATE
+from llama_index.core.llms import LLM
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.settings import Settings
+
+from app.engine.token_count import TOKEN_COUNT_KEY, get_node_token_count
+
+logger = logging.getLogger(__name__)
+
+# Marge pour la question de l'utilisateur et le formatage des messages
+PROMPT_MARGIN_TOKENS = 256
+
+
+def get_token_budgets(llm: LLM, system_prompt: str) -> Tuple[int, int]:
+    """
+    Répartit la fenêtre de contexte du modèle entre :
+    prompt système + historique + contexte récupéré + sortie réservée.
+
+    Retourne (budget du contexte, budget de l'historique) en tokens.
+    """
+    tokenizer = Settings.tokenizer
+    metadata = llm.metadata
+    reserved_output = metadata.num_output
+    if reserved_output is None or reserved_output <= 0:
+        reserved_output = int(os.getenv("CHAT_RESERVED_OUTPUT_TOKENS", "1024"))
+    fixed = (
+        len(tokenizer(system_prompt))
+        + len(tokenizer(DEFAULT_CONTEXT_TEMPLATE))
+        + PROMPT_MARGIN_TOKENS
+    )
+    available = max(metadata.context_window - reserved_output - fixed, 0)
+
+    history_budget = int(available * float(os.getenv("CHAT_HISTORY_BUDGET_RATIO", "0.3")))
+    context_budget = available - history_budget
+    # Plafond optionnel, pour limiter le coût par question avec les modèles à grande fenêtre
+    max_context = os.getenv("CHAT_MAX_CONTEXT_TOKENS")
+    if max_context:
+        context_budget = min(context_budget, int(max_context))
+    return context_budget, history_budget
+
+
+def _source_key(node: NodeWithScore) -> Optional[str]:
+    return node.node.ref_doc_id or node.node.metadata.get("file_path")
+
+
+def _merge_group(nodes: List[NodeWithScore], max_gap_chars: int) -> List[NodeWithScore]:
+    """
+    Fusionne les chunks d'un même fichier qui se chevauchent ou se suivent
+    (d'après leur position dans le document).
+    """
+    nodes = sorted(nodes, key=lambda n: n.node.start_char_idx)
+    merged: List[NodeWithScore] = [nodes[0]]
+    for current in nodes[1:]:
+        previous = merged[-1]
+        prev_end = previous.node.end_char_idx
+        start, end = current.node.start_char_idx, current.node.end_char_idx
+        if start > prev_end + max_gap_chars:
+            merged.append(current)
+            continue
+        score = max(previous.score or 0.0, current.score or 0.0)
+        if end <= prev_end:
+            # Chunk contenu dans le précédent
+            previous.score = score
+            continue
+        if start < prev_end:
+            # Le chevauchement (CHUNK_OVERLAP) n'est gardé qu'une fois
+            text = previous.node.get_content() + current.node.get_content()[prev_end - start:]
+        else:
+            text = previous.node.get_content() + "\n" + current.node.get_content()
+        # Le nombre de tokens calculé à l'ingestion ne vaut plus pour le texte fusionné
+        metadata = {
+            k: v for k, v in previous.node.metadata.items() if k != TOKEN_COUNT_KEY
+        }
+        merged[-1] = NodeWithScore(
+            node=previous.node.model_copy(
+                update={"text": text, "end_char_idx": end, "metadata": metadata}
+            ),
+            score=score,
+        )
+    return merged
+
+
+def dedupe_and_merge(nodes: List[NodeWithScore], max_gap_chars: int = 2) -> List[NodeWithScore]:
+    """
+    Supprime les chunks en double et fusionne les chunks adjacents d'un même fichier
+    """
+    unique: Dict[str, NodeWithScore] = {}
+    for node in nodes:
+        key = node.node.node_id
+        if key not in unique or (node.score or 0.0) > (unique[key].score or 0.0):
+            unique[key] = node
+
+    groups: Dict[str, List[NodeWithScore]] = {}
+    result: List[NodeWithScore] = []
+    for node in unique.values():
+        key = _source_key(node)
+        if key is None or node.node.start_char_idx is None or node.node.end_char_idx is None:
+            result.append(node)
+        else:
+            groups.setdefault(key, []).append(node)
+    for group in groups.values():
+        result.extend(_merge_group(group, max_gap_chars))
+    return result
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Remplit le budget de tokens du contexte avec les meilleurs chunks récupérés,
+    après déduplication et fusion des chunks adjacents d'un même fichier.
+    """
+
+    token_budget: int = Field(description="Nombre maximal de tokens de contexte")
+    max_gap_chars: int = Field(
+        default=2, description="Écart maximal (en caractères) entre deux chunks fusionnés"
+    )
+    _tokenizer: Callable = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tokenizer = Settings.tokenizer
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _count_tokens(self, node: NodeWithScore) -> int:
+        # Compte enregistré à l'ingestion si possible, sinon le chunk est tokenisé
+        return get_node_token_count(node.node, self._tokenizer)
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        candidates = dedupe_and_merge(nodes, self.max_gap_chars)
+        candidates.sort(key=lambda n: n.score or 0.0, reverse=True)
+
+        packed: List[NodeWithScore] = []
+        used = 0
+        for node in candidates:
+            tokens = self._count_tokens(node)
+            if used + tokens > self.token_budget:
+                # Un chunk plus petit et moins bien classé peut encore tenir
+                continue
+            packed.append(node)
+            used += tokens
+        logger.debug(
+            f"Context packing: {len(nodes)} candidates, {len(packed)} packed, "
+            f"{used}/{self.token_budget} tokens"
+        )
+        return packed
@@ -2,11 +2,15 @@ import os
 from llama_index.core import Settings, VectorStoreIndex
 from llama_index.core.chat_engine import ContextChatEngine
 from llama_index.llms.openai import OpenAI
-from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.embeddings.openai import OpenAIEmbedding
 
-from app.engine.vectordb import get_vector_store
+from app.engine.context_packer import ContextPacker, get_token_budgets
+from app.engine.numpy_vector_store import NumpyVectorStore
+from app.engine.parent_child import ParentExpander
+from app.engine.retriever import MergingRetriever, NumpyRetriever
+from app.engine.token_count import CachedTokenMemoryBuffer
+from app.engine.vectordb import collection_exists, get_tenant_vector_store, get_vector_store, is_tenant_routing_enabled
 from app.settings import init_settings
 
 # Configuration globale de LlamaIndex
@@ -16,45 +20,72 @@ Settings.llm = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY")
 )
 
+SYSTEM_PROMPT = """Tu es un assistant qui répond aux questions en utilisant uniquement les informations fournies dans le contexte. 
+        Si tu trouves l'information dans le contexte, utilise-la et cite ta source.
+        Si tu ne trouves pas l'information dans le contexte, dis-le clairement."""
+
 # Configuration des embeddings
 Settings.embed_model = OpenAIEmbedding(
     model="text-embedding-3-small",
     api_key=os.getenv("OPENAI_API_KEY")
 )
 
-def get_chat_engine(filters=None):
+def get_retriever(vector_store, filters, top_k: int):
+    """
+    Retriever adapté au backend du vector store.
+    """
+    # Backend numpy : recherche exacte directe dans l'index en mémoire mappée
+    if isinstance(vector_store, NumpyVectorStore):
+        return NumpyRetriever(vector_store, similarity_top_k=top_k, filters=filters)
+    return VectorIndexRetriever(
+        index=VectorStoreIndex.from_vector_store(vector_store),
+        filters=filters,
+        similarity_top_k=top_k,
+        similarity_cutoff=0.1  # Seuil minimal de similarité abaissé
+    )
+
+def get_chat_engine(filters=None, tenant_id=None):
     """
     Crée et retourne un moteur de chat configuré pour le streaming et le RAG.
     
     Args:
         filters: Filtres optionnels pour la recherche de documents
+        tenant_id: Utilisateur dont la collection privée est aussi interrogée (QDRANT_TENANCY=collection)
     """
     # Initialiser les paramètres
     init_settings()
     
-    # Créer l'index avec le vector store existant
+    # Vector store existant
     vector_store = get_vector_store()
-    index = VectorStoreIndex.from_vector_store(vector_store)
     
-    # Créer le retriever avec les paramètres optimisés
-    retriever = VectorIndexRetriever(
-        index=index,
-        filters=filters,
-        similarity_top_k=1,  # Nombre de documents similaires à récupérer
-        similarity_cutoff=0.1  # Seuil minimal de similarité abaissé
-    )
+    # Budgets de tokens dérivés de la fenêtre de contexte du modèle
+    context_budget, history_budget = get_token_budgets(Settings.llm, SYSTEM_PROMPT)
+
+    # Créer le retriever : un ensemble de candidats plus large que le contexte final,
+    # trié et réduit au budget par le ContextPacker
+    top_k = int(os.getenv("CHAT_CANDIDATE_TOP_K", "10"))  # Nombre de chunks candidats
+    retriever = get_retriever(vector_store, filters, top_k)
+
+    # Collection du tenant : interrogée en plus de la collection partagée, si elle existe déjà
+    if tenant_id is not None and is_tenant_routing_enabled():
+        tenant_store = get_tenant_vector_store(tenant_id)
+        if collection_exists(tenant_store):
+            tenant_retriever = get_retriever(tenant_store, filters, top_k)
+            retriever = MergingRetriever([retriever, tenant_retriever], top_k=top_k)
     
     # Créer le chat engine avec le retriever et la mémoire
     chat_engine = ContextChatEngine.from_defaults(
         retriever=retriever,
         llm=Settings.llm,
-        memory=ChatMemoryBuffer.from_defaults(token_limit=3900),
-        system_prompt="""Tu es un assistant qui répond aux questions en utilisant uniquement les informations fournies dans le contexte. 
-        Si tu trouves l'information dans le contexte, utilise-la et cite ta source.
-        Si tu ne trouves pas l'information dans le contexte, dis-le clairement.""",
+        # Nombre de tokens mis en cache par message : l'historique n'est pas re-tokenisé à chaque tour
+        memory=CachedTokenMemoryBuffer.from_defaults(
+            token_limit=history_budget, tokenizer_fn=Settings.tokenizer
+        ),
+        system_prompt=SYSTEM_PROMPT,
         verbose=True,
-        # Paramètres pour améliorer la pertinence
-        node_postprocessors=[],  # Désactiver les post-processeurs qui pourraient affecter les scores
+        # Remplace les chunks enfants par leur section parente, puis déduplique, fusionne
+        # les chunks adjacents et remplit le budget du contexte (sans modifier les scores)
+        node_postprocessors=[ParentExpander(), ContextPacker(token_budget=context_budget)],
         similarity_score_threshold=0.1  # Seuil de score pour considérer un document comme pertinent
     )
     
@@ -0,0 +1,337 @@
+# flake8: noqa: E402
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import yaml  # type: ignore
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.settings import Settings
+
+from app.config import DATA_DIR
+from app.engine.chunkers import get_extension_chunkers
+from app.engine.engine import get_retriever
+from app.engine.generate import build_transformations
+from app.engine.loaders import get_documents
+from app.engine.numpy_vector_store import NumpyVectorStore
+from app.engine.parent_child import get_child_chunk_size
+from app.engine.query_filter import generate_filters
+from app.engine.vectordb import get_collection_stats, get_vector_store, get_vector_store_backend
+from app.settings import init_settings
+
+logger = logging.getLogger(__name__)
+
+EVAL_CACHE_DIR = os.getenv("EVAL_CACHE_DIR", ".eval_cache")
+
+
+def load_golden_set(path: str) -> List[Dict[str, Any]]:
+    """
+    Charge le jeu de questions de référence (YAML ou JSONL).
+
+    Chaque entrée contient `question` et `expected_sources` : les noms des fichiers
+    (relatifs à DATA_DIR ou simples noms de fichiers) qui contiennent la réponse.
+    """
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = yaml.safe_load(f)
+            # YAML : liste de questions, ou {"questions": [...]}
+            if isinstance(items, dict):
+                items = items.get("questions", [])
+    for item in items:
+        if "question" not in item or not item.get("expected_sources"):
+            raise ValueError(f"Invalid golden set entry: {item}")
+    return items
+
+
+def hash_corpus(data_dir: str = DATA_DIR) -> str:
+    """
+    Empreinte du corpus (chemins et contenus des fichiers), pour invalider le cache
+    """
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(data_dir)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, data_dir).encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _cache_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def _index_fingerprint(vector_store) -> Dict[str, Any]:
+    """
+    Identité de l'index existant, ajoutée à la clé du cache des résultats : le hash du
+    corpus ne dit rien de ce qui a été indexé (autre collection, autre backend, ou
+    réindexation depuis). `points_count` est None si les stats ne sont pas disponibles.
+    """
+    return {
+        "backend": get_vector_store_backend(),
+        "collection": vector_store.collection_name,
+        "points_count": get_collection_stats(vector_store).get("points_count"),
+    }
+
+
+def _node_sources(node) -> set:
+    metadata = node.metadata
+    sources = {metadata.get("file_name")}
+    file_path = metadata.get("file_path")
+    if file_path:
+        sources.add(os.path.basename(file_path))
+        sources.add(os.path.relpath(file_path, os.path.abspath(DATA_DIR)))
+    return {source for source in sources if source}
+
+
+def get_eval_vector_store(
+    corpus_hash: str, chunk_size: int, chunk_overlap: int, chunker: Optional[str] = None
+):
+    """
+    Index du corpus pour une configuration de découpage, construit une fois puis gardé
+    dans le cache (NumpyVectorStore) : les relances ne refont pas les embeddings.
+    """
+    persist_dir = os.path.join(
+        EVAL_CACHE_DIR,
+        "indexes",
+        _cache_key(
+            corpus_hash,
+            chunk_size,
+            chunk_overlap,
+            chunker or get_extension_chunkers(),
+            Settings.embed_model.model_name,
+            get_child_chunk_size(),
+        ),
+    )
+    store = NumpyVectorStore(persist_dir=persist_dir)
+    if not store.exists():
+        logger.info(
+            f"Indexation du corpus (chunk_size={chunk_size}, chunk_overlap={chunk_overlap}, "
+            f"chunker={chunker or 'auto'})"
+        )
+        documents = get_documents()
+        for doc in documents:
+            doc.metadata["private"] = "false"
+        IngestionPipeline(
+            # Sections parentes (CHILD_CHUNK_SIZE) à part : l'index de production n'est pas touché
+            transformations=build_transformations(
+                chunk_size,
+                chunk_overlap,
+                chunker,
+                parent_store_path=os.path.join(persist_dir, "parents.sqlite3"),
+            ),
+            vector_store=store,
+        ).run(documents=documents)
+    return store
+
+
+def evaluate_retrieval(
+    vector_store,
+    golden_set: List[Dict[str, Any]],
+    top_ks: List[int],
+    cutoffs: List[float],
+) -> Dict[str, Any]:
+    """
+    Exécute chaque question avec le retriever du chat (au plus grand top_k), puis calcule
+    recall@k, hit rate et MRR pour chaque (top_k, cutoff) à partir du même classement.
+    """
+    retriever = get_retriever(vector_store, generate_filters(), max(top_ks))
+    runs = []
+    for item in golden_set:
+        start = time.perf_counter()
+        nodes = retriever.retrieve(item["question"])
+        latency = time.perf_counter() - start
+        runs.append(
+            {
+                "question": item["question"],
+                "expected": set(item["expected_sources"]),
+                "ranked": [(_node_sources(n.node), n.score or 0.0) for n in nodes],
+                "latency_s": latency,
+            }
+        )
+
+    latencies = sorted(run["latency_s"] for run in runs)
+    results = {}
+    for top_k, cutoff in itertools.product(top_ks, cutoffs):
+        recalls, hits, reciprocal_ranks, per_query = [], [], [], []
+        for run in runs:
+            ranked = [sources for sources, score in run["ranked"][:top_k] if score >= cutoff]
+            found = set().union(*ranked) & run["expected"] if ranked else set()
+            first = next(
+                (rank for rank, sources in enumerate(ranked, 1) if sources & run["expected"]),
+                None,
+            )
+            recalls.append(len(found) / len(run["expected"]))
+            hits.append(1.0 if found else 0.0)
+            reciprocal_ranks.append(1 / first if first else 0.0)
+            per_query.append(
+                {
+                    "question": run["question"],
+                    "recall": recalls[-1],
+                    "first_relevant_rank": first,
+                    "latency_s": run["latency_s"],
+                }
+            )
+        results[f"top_k={top_k},cutoff={cutoff}"] = {
+            "top_k": top_k,
+            "cutoff": cutoff,
+            f"recall@{top_k}": statistics.mean(recalls),
+            "hit_rate": statistics.mean(hits),
+            "mrr": statistics.mean(reciprocal_ranks),
+            "queries": per_query,
+        }
+    return {
+        "latency_s": {
+            "mean": statistics.mean(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        },
+        "results": results,
+    }
+
+
+def run_evaluation(
+    golden_path: str,
+    top_ks: List[int],
+    cutoffs: List[float],
+    chunk_sizes: Optional[List[int]] = None,
+    chunk_overlaps: Optional[List[int]] = None,
+    chunkers: Optional[List[Optional[str]]] = None,
+    workers: int = 1,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Balaye la grille de paramètres. Sans `chunk_sizes`/`chunk_overlaps`/`chunkers`,
+    l'évaluation porte sur l'index existant (`get_vector_store`) ; sinon un index est
+    construit par configuration de découpage (None : découpeur selon l'extension).
+    Les résultats sont mis en cache par (corpus, jeu de questions, paramètres).
+    """
+    init_settings()
+    golden_set = load_golden_set(golden_path)
+    with open(golden_path, "rb") as f:
+        golden_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+    corpus_hash = hash_corpus()
+
+    if chunk_sizes or chunk_overlaps or chunkers:
+        chunk_configs = [
+            (size, overlap, chunker)
+            for size, overlap, chunker in itertools.product(
+                chunk_sizes or [Settings.chunk_size],
+                chunk_overlaps or [Settings.chunk_overlap],
+                chunkers or [None],
+            )
+            # Le chevauchement doit rester inférieur à la taille des chunks
+            if overlap < size
+        ]
+        if not chunk_configs:
+            raise ValueError("No valid (chunk_size, chunk_overlap) combination")
+    else:
+        # Index existant : pas de re-découpage
+        chunk_configs = [None]
+
+    def evaluate(chunk_config) -> Dict[str, Any]:
+        params = {
+            "chunking": list(chunk_config) if chunk_config else "existing_index",
+            "top_ks": top_ks,
+            "cutoffs": cutoffs,
+            "embed_model": Settings.embed_model.model_name,
+            "extension_chunkers": get_extension_chunkers(),
+            "child_chunk_size": get_child_chunk_size(),
+        }
+        cacheable = use_cache
+        if not chunk_config:
+            vector_store = get_vector_store()
+            params["index"] = _index_fingerprint(vector_store)
+            # Index non identifiable : résultats ni lus ni écrits dans le cache
+            cacheable = use_cache and params["index"]["points_count"] is not None
+        cache_path = os.path.join(
+            EVAL_CACHE_DIR, "results", f"{_cache_key(corpus_hash, golden_hash, params)}.json"
+        )
+        if cacheable and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                return json.load(f)
+
+        if chunk_config:
+            vector_store = get_eval_vector_store(corpus_hash, *chunk_config)
+        result = {"params": params, **evaluate_retrieval(vector_store, golden_set, top_ks, cutoffs)}
+        if cacheable:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "w") as f:
+                json.dump(result, f, indent=2)
+        return result
+
+    # Les configurations de découpage sont indépendantes : évaluées en parallèle
+    # (--workers 1 pour des latences non perturbées)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        runs = list(executor.map(evaluate, chunk_configs))
+    return {"corpus_hash": corpus_hash, "golden_set": golden_path, "runs": runs}
+
+
+def _print_summary(report: Dict[str, Any]) -> None:
+    for run in report["runs"]:
+        chunking = run["params"]["chunking"]
+        for result in run["results"].values():
+            top_k = result["top_k"]
+            print(
+                f"chunking={chunking} top_k={top_k} cutoff={result['cutoff']}: "
+                f"recall@{top_k}={result[f'recall@{top_k}']:.3f} "
+                f"hit_rate={result['hit_rate']:.3f} mrr={result['mrr']:.3f} "
+                f"p50={run['latency_s']['p50'] * 1000:.1f}ms"
+            )
+
+
+def main():
+    """
+    Point d'entrée `poetry run eval` : évaluation de la recherche sur un jeu de questions.
+
+    Exemple :
+        poetry run eval golden.yaml --top-k 1,3,5,10 --cutoff 0,0.1,0.3 --chunk-size 512,1024
+    """
+    parser = argparse.ArgumentParser(description="Retrieval evaluation over a golden question set")
+    parser.add_argument("golden_set", help="YAML or JSONL file of questions and expected sources")
+    parser.add_argument("--top-k", default="1,3,5,10")
+    parser.add_argument("--cutoff", default="0")
+    parser.add_argument("--chunk-size", help="Comma-separated chunk sizes (re-indexes the corpus)")
+    parser.add_argument("--chunk-overlap", help="Comma-separated chunk overlaps")
+    parser.add_argument(
+        "--chunker", help="Comma-separated chunkers ('auto' picks one per file type)"
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", help="Write the full report as JSON to this file")
+    args = parser.parse_args()
+
+    def parse(value: Optional[str], cast):
+        return [cast(v) for v in value.split(",")] if value else None
+
+    report = run_evaluation(
+        args.golden_set,
+        top_ks=parse(args.top_k, int),
+        cutoffs=parse(args.cutoff, float),
+        chunk_sizes=parse(args.chunk_size, int),
+        chunk_overlaps=parse(args.chunk_overlap, int),
+        chunkers=parse(args.chunker, lambda name: None if name == "auto" else name),
+        workers=args.workers,
+        use_cache=not args.no_cache,
+    )
+    _print_summary(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,20 @@ load_dotenv()
 
 import logging
 import os
+import time
 
 from llama_index.core.ingestion import DocstoreStrategy, IngestionPipeline
-from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.settings import Settings
 from llama_index.core.storage import StorageContext
 from llama_index.core.storage.docstore import SimpleDocumentStore
 
-from app.engine.loaders import get_documents
-from app.engine.vectordb import get_vector_store, add_documents_to_vectorstore, get_collection_stats
+from app.engine.chunkers import ChunkerRouter
+from app.engine.loaders import aiter_documents, get_documents, load_configs
+from app.engine.loaders.file import FileLoaderConfig, cached_file_extractor, llama_parse_extractor
+from app.engine.parent_child import ParentChildSplitter, get_child_chunk_size
+from app.engine.token_count import TokenCountExtractor
+from app.engine.vectordb import get_vector_store, add_documents_to_vectorstore, get_collection_stats, ensure_payload_indexes
+from app.metrics import observe_ingestion
 from app.settings import init_settings
 
 from typing import Optional
@@ -34,16 +39,52 @@ def get_doc_store():
     Retourne:
         SimpleDocumentStore: Une instance du magasin de documents.
     """
-    if os.path.exists(STORAGE_DIR):
+    # STORAGE_DIR peut aussi contenir le vector store local (voir VECTOR_STORE_BACKEND)
+    if os.path.exists(os.path.join(STORAGE_DIR, "docstore.json")):
         return SimpleDocumentStore.from_persist_dir(STORAGE_DIR)
     else:
         return SimpleDocumentStore()
 
+def build_transformations(
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    chunker: Optional[str] = None,
+    parent_store_path: Optional[str] = None,
+):
+    """
+    Transformations communes à tous les pipelines d'ingestion : découpage en chunks
+    (selon le type de fichier, voir `app.engine.chunkers`), nombre de tokens de chaque
+    chunk (réutilisé par le chat) puis embedding.
+
+    Par défaut, la taille et le chevauchement des chunks sont ceux de `Settings`.
+    `chunker` impose un même découpeur à tous les documents. Avec CHILD_CHUNK_SIZE,
+    ces chunks deviennent des sections parentes et seuls leurs chunks enfants sont embeddés ;
+    `parent_store_path` remplace alors l'emplacement des parents (PARENT_STORE_PATH).
+    """
+    transformations = [
+        ChunkerRouter(
+            chunk_size=chunk_size or Settings.chunk_size,
+            chunk_overlap=Settings.chunk_overlap if chunk_overlap is None else chunk_overlap,
+            chunker=chunker,
+        ),
+    ]
+    # Petits chunks enfants embeddés, sections parentes dans un NodeStore local
+    child_chunk_size = get_child_chunk_size()
+    if child_chunk_size:
+        transformations.append(
+            ParentChildSplitter(
+                child_chunk_size=child_chunk_size,
+                child_chunk_overlap=int(os.getenv("CHILD_CHUNK_OVERLAP", "20")),
+                store_path=parent_store_path,
+            )
+        )
+    return transformations + [TokenCountExtractor(), Settings.embed_model]
+
 def run_pipeline(docstore, vector_store, documents):
     """
     Exécute le pipeline d'ingestion pour traiter et stocker les documents.
 
-    Le pipeline applique un diviseur de phrases et un modèle d'embedding pour transformer
+    Le pipeline applique les transformations de `build_transformations` pour transformer
     les documents en noeuds, qui sont ensuite stockés dans le magasin de documents et le magasin de vecteurs.
 
     Arguments:
@@ -55,20 +96,18 @@ def run_pipeline(docstore, vector_store, documents):
         list: Une liste de noeuds générés par le pipeline.
     """
     pipeline = IngestionPipeline(
-        transformations=[
-            SentenceSplitter(
-                chunk_size=Settings.chunk_size,
-                chunk_overlap=Settings.chunk_overlap,
-            ),
-            Settings.embed_model,
-        ],
+        transformations=build_transformations(),
         docstore=docstore,
         docstore_strategy=DocstoreStrategy.UPSERTS_AND_DELETE,  # type: ignore
         vector_store=vector_store,
     )
 
     # Exécute le pipeline d'ingestion et stocke les résultats
+    start = time.perf_counter()
     nodes = pipeline.run(show_progress=True, documents=documents)
+    observe_ingestion("generate", len(nodes), time.perf_counter() - start)
+    # La collection est créée par la première ingestion : index des champs filtrés
+    ensure_payload_indexes(vector_store)
 
     return nodes
 
@@ -139,8 +178,14 @@ async def process_documents(specific_file: Optional[str] = None):
                 raise FileNotFoundError(f"Le fichier {specific_file} n'existe pas")
             
             logger.info(f"Chargement du fichier: {specific_file}")
+            # Mêmes parseurs que la réindexation complète, avec le cache de parsing
+            file_extractor = None
+            file_config = load_configs().get("file")
+            if file_config is not None and FileLoaderConfig(**file_config).use_llama_parse:
+                file_extractor = llama_parse_extractor()
             new_documents = SimpleDirectoryReader(
-                input_files=[specific_file]
+                input_files=[specific_file],
+                file_extractor=cached_file_extractor(file_extractor),
             ).load_data()
             logger.info(f"Fichier chargé avec succès: {len(new_documents)} document(s)")
 
@@ -152,22 +197,19 @@ async def process_documents(specific_file: Optional[str] = None):
 
             # Créer un pipeline d'ingestion pour les nouveaux documents
             pipeline = IngestionPipeline(
-                transformations=[
-                    SentenceSplitter(
-                        chunk_size=Settings.chunk_size,
-                        chunk_overlap=Settings.chunk_overlap,
-                    ),
-                    Settings.embed_model,
-                ],
+                transformations=build_transformations(),
                 vector_store=vector_store
             )
 
             # Exécuter le pipeline d'ingestion
             logger.info("Début de l'ingestion des nouveaux documents")
+            start = time.perf_counter()
             nodes = pipeline.run(
                 documents=new_documents,
                 show_progress=True
             )
+            observe_ingestion("upload", len(nodes), time.perf_counter() - start)
+            ensure_payload_indexes(vector_store)
             logger.info(f"Ingestion terminée: {len(nodes)} nœuds générés")
             
             # Log des stats après
@@ -179,23 +221,24 @@ async def process_documents(specific_file: Optional[str] = None):
         else:
             # Pour une réindexation complète
             logger.warning("Réindexation complète demandée")
-            documents = get_documents()
-            for doc in documents:
-                doc.metadata["private"] = "false"
-            
+
             # Recréer l'index complet
             vector_store = get_vector_store(force_recreate=True)
             pipeline = IngestionPipeline(
-                transformations=[
-                    SentenceSplitter(
-                        chunk_size=Settings.chunk_size,
-                        chunk_overlap=Settings.chunk_overlap,
-                    ),
-                    Settings.embed_model,
-                ],
+                transformations=build_transformations(),
                 vector_store=vector_store
             )
-            nodes = pipeline.run(documents=documents, show_progress=True)
+            # Chaque lot est ingéré dès qu'il est chargé, pendant le parsing des fichiers suivants
+            start = time.perf_counter()
+            nodes_count = 0
+            async for documents in aiter_documents():
+                if not documents:
+                    continue
+                for doc in documents:
+                    doc.metadata["private"] = "false"
+                nodes_count += len(await pipeline.arun(documents=documents))
+            observe_ingestion("reindex", nodes_count, time.perf_counter() - start)
+            ensure_payload_indexes(vector_store)
         
         return True
         
@@ -14,13 +14,17 @@ class IndexConfig(BaseModel):
     callback_manager: Optional[CallbackManager] = Field(
         default=None,
     )
+    tenant_id: Optional[str] = Field(
+        default=None,
+        description="Route the index to the tenant's collection (QDRANT_TENANCY=collection)",
+    )
 
 
 def get_index(config: IndexConfig = None):
     if config is None:
         config = IndexConfig()
     logger.info("Connecting vector store...")
-    store = get_vector_store()
+    store = get_vector_store(tenant_id=config.tenant_id)
     # Load the index from the vector store
     # If you are using a vector store that doesn't store text,
     # you must load the index from both the vector store and the document store
@@ -1,10 +1,11 @@
+import asyncio
 import logging
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List
 
 import yaml  # type: ignore
 from app.engine.loaders.db import DBLoaderConfig, get_db_documents
-from app.engine.loaders.file import FileLoaderConfig, get_file_documents
-from app.engine.loaders.web import WebLoaderConfig, get_web_documents
+from app.engine.loaders.file import FileLoaderConfig, aiter_file_documents, get_file_documents
+from app.engine.loaders.web import WebLoaderConfig, aget_web_documents, get_web_documents
 from llama_index.core import Document
 
 logger = logging.getLogger(__name__)
@@ -72,3 +73,31 @@ def get_documents() -> List[Document]:
         documents.extend(document)
 
     return documents
+
+
+async def aiter_documents() -> AsyncIterator[List[Document]]:
+    """
+    Version asynchrone de `get_documents` : les documents sont produits par lots, dès
+    qu'ils sont chargés (fichier par fichier pour le chargeur `file`, qui parse plusieurs
+    fichiers en parallèle), pour être ingérés pendant que les suivants sont parsés.
+
+    Lève:
+        ValueError: Si un type de chargeur invalide est spécifié dans les configurations.
+    """
+    config = load_configs()
+    for loader_type, loader_config in config.items():
+        logger.info(
+            f"Chargement des documents depuis le chargeur : {loader_type}, configuration : {loader_config}"
+        )
+        match loader_type:
+            case "file":
+                async for documents in aiter_file_documents(FileLoaderConfig(**loader_config)):
+                    yield documents
+            case "web":
+                yield await aget_web_documents(WebLoaderConfig(**loader_config))
+            case "db":
+                yield await asyncio.to_thread(
+                    get_db_documents, [DBLoaderConfig(**cfg) for cfg in loader_config]
+                )
+            case _:
+                raise ValueError(f"Type de chargeur invalide : {loader_type}")
@@ -1,74 +1,211 @@
+import asyncio
 import os
 import logging
-from typing import Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, TypeVar
+
+import httpx
 from llama_parse import LlamaParse
+from llama_parse.base import JOB_RESULT_URL, JOB_STATUS_ROUTE
+from llama_index.core import Document
+from llama_index.core.readers.base import BaseReader
 from pydantic import BaseModel
 
 from app.config import DATA_DIR
+from app.engine.loaders.parse_cache import cached_reader, get_parse_cache_mode
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 class FileLoaderConfig(BaseModel):
     use_llama_parse: bool = False
 
 
-def llama_parse_parser():
+def get_parse_concurrency() -> int:
+    """
+    Maximum number of files parsed at the same time (PARSE_CONCURRENCY, default 8):
+    LlamaParse jobs in flight, or local readers running in worker threads.
+    """
+    return max(1, int(os.getenv("PARSE_CONCURRENCY", "8")))
+
+
+class PollingLlamaParse(LlamaParse):
+    """
+    LlamaParse polling its jobs with a growing interval: the first status check comes
+    after `min_check_interval` seconds, then the interval grows up to `check_interval`.
+    Small files are picked up quickly while long jobs do not flood the API.
+    """
+
+    min_check_interval: float = 0.25
+
+    async def _get_job_result(
+        self, job_id: str, result_type: str, verbose: bool = False
+    ) -> Dict[str, Any]:
+        client = self.aclient
+        start = time.monotonic()
+        interval = self.min_check_interval
+        while True:
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, self.check_interval)
+            result = await client.get(JOB_STATUS_ROUTE.format(job_id=job_id))
+            status = result.json()["status"] if result.status_code == 200 else "PENDING"
+            if status == "SUCCESS":
+                parsed = await client.get(
+                    JOB_RESULT_URL.format(job_id=job_id, result_type=result_type)
+                )
+                parsed.raise_for_status()
+                return parsed.json()
+            if status != "PENDING":
+                details = result.json()
+                raise Exception(
+                    f"Job ID: {job_id} failed with status: {status}, "
+                    f"Error code: {details.get('error_code', 'No error code found')}, "
+                    f"Error message: {details.get('error_message', 'No error message found')}"
+                )
+            if time.monotonic() - start > self.max_timeout:
+                raise Exception(f"Timeout while parsing the file: {job_id}")
+
+
+def llama_parse_parser(client: Optional[httpx.AsyncClient] = None):
     if os.getenv("LLAMA_CLOUD_API_KEY") is None:
         raise ValueError(
             "LLAMA_CLOUD_API_KEY environment variable is not set. "
             "Please set it in .env file or in your shell environment then run again!"
         )
-    parser = LlamaParse(
+    parser = PollingLlamaParse(
         result_type="markdown",
         verbose=True,
         language="en",
         ignore_errors=False,
+        check_interval=int(os.getenv("LLAMA_PARSE_CHECK_INTERVAL", "5")),
+        # Not applied to the default value by LlamaParse (e.g. a local stub server)
+        base_url=os.getenv("LLAMA_CLOUD_BASE_URL"),
+        custom_client=client,
     )
     return parser
 
 
-def llama_parse_extractor() -> Dict[str, LlamaParse]:
+def llama_parse_extractor(client: Optional[httpx.AsyncClient] = None) -> Dict[str, LlamaParse]:
     from llama_parse.utils import SUPPORTED_FILE_TYPES
 
-    parser = llama_parse_parser()
+    parser = llama_parse_parser(client)
     return {file_type: parser for file_type in SUPPORTED_FILE_TYPES}
 
 
-def get_file_documents(config: FileLoaderConfig):
+def cached_file_extractor(
+    file_extractor: Optional[Dict[str, BaseReader]] = None,
+) -> Optional[Dict[str, BaseReader]]:
+    """
+    Readers by file extension (LlamaParse or the default local readers),
+    wrapped with the parse cache so unchanged files are not parsed again.
+    """
+    from llama_index.core.readers.file.base import SimpleDirectoryReader
+
+    if get_parse_cache_mode() == "off":
+        return file_extractor
+    # Readers classes are only instantiated for the extensions actually found
+    readers = {**SimpleDirectoryReader.supported_suffix_fn(), **(file_extractor or {})}
+    return {extension: cached_reader(reader) for extension, reader in readers.items()}
+
+
+def _is_async_reader(reader: Any) -> bool:
+    # Readers without their own aload_data would block the event loop
+    if reader is None:
+        # Read as plain text
+        return False
+    reader_cls = reader if isinstance(reader, type) else type(reader)
+    return reader_cls.aload_data is not BaseReader.aload_data
+
+
+async def aiter_file_documents(
+    config: FileLoaderConfig,
+    file_extractor: Optional[Dict[str, BaseReader]] = None,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[List[Document]]:
+    """
+    Documents of DATA_DIR, yielded file by file as soon as each file is parsed.
+
+    Up to `concurrency` files (default `get_parse_concurrency`) are parsed at the same
+    time: async readers such as LlamaParse run on the event loop, the local readers in
+    worker threads. `file_extractor` replaces the readers chosen from `config`
+    (e.g. a local stub parser).
+    """
     from llama_index.core.readers import SimpleDirectoryReader
 
-    try:
-        file_extractor = None
-        if config.use_llama_parse:
-            # LlamaParse is async first,
-            # so we need to use nest_asyncio to run it in sync mode
-            import nest_asyncio
-
-            nest_asyncio.apply()
-
-            file_extractor = llama_parse_extractor()
-        reader = SimpleDirectoryReader(
-            DATA_DIR,
-            recursive=True,
-            filename_as_id=True,
-            raise_on_error=True,
-            file_extractor=file_extractor,
-        )
-        return reader.load_data()
-    except Exception as e:
-        import sys
-        import traceback
-
-        # Catch the error if the data dir is empty
-        # and return as empty document list
-        _, _, exc_traceback = sys.exc_info()
-        function_name = traceback.extract_tb(exc_traceback)[-1].name
-        if function_name == "_add_files":
+    async with httpx.AsyncClient(timeout=None) as client:
+        if file_extractor is None and config.use_llama_parse:
+            # One connection pool for every upload and status check
+            file_extractor = llama_parse_extractor(client)
+        file_extractor = cached_file_extractor(file_extractor) or {}
+        try:
+            reader = SimpleDirectoryReader(
+                DATA_DIR,
+                recursive=True,
+                filename_as_id=True,
+                raise_on_error=True,
+                file_extractor=file_extractor,
+            )
+        except ValueError as e:
+            # Empty (or missing) data dir
             logger.warning(
                 f"Failed to load file documents, error message: {e} . Return as empty document list."
             )
-            return []
-        else:
-            # Raise the error if it is not the case of empty data dir
-            raise e
+            return
+
+        semaphore = asyncio.Semaphore(concurrency or get_parse_concurrency())
+
+        async def load(input_file: Path) -> List[Document]:
+            async with semaphore:
+                args = (input_file, reader.file_metadata, file_extractor, True)
+                if _is_async_reader(file_extractor.get(input_file.suffix.lower())):
+                    documents = await SimpleDirectoryReader.aload_file(
+                        *args, raise_on_error=True
+                    )
+                else:
+                    documents = await asyncio.to_thread(
+                        SimpleDirectoryReader.load_file, *args, raise_on_error=True
+                    )
+            return reader._exclude_metadata(documents)
+
+        tasks = [asyncio.create_task(load(input_file)) for input_file in reader.input_files]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # First error, or the consumer stopped early: pending files are not parsed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def aget_file_documents(
+    config: FileLoaderConfig,
+    file_extractor: Optional[Dict[str, BaseReader]] = None,
+    concurrency: Optional[int] = None,
+) -> List[Document]:
+    return [
+        document
+        async for documents in aiter_file_documents(config, file_extractor, concurrency)
+        for document in documents
+    ]
+
+
+def run_sync(coroutine: Awaitable[T]) -> T:
+    """
+    Runs `coroutine` from synchronous code, without patching the running event loop:
+    when called from a coroutine, it runs in its own event loop in a worker thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def get_file_documents(config: FileLoaderConfig):
+    return run_sync(aget_file_documents(config))
@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+from llama_index.core import Document
+from llama_index.core.readers.base import BaseReader
+
+from app.metrics import observe_cache
+
+logger = logging.getLogger(__name__)
+
+# Options des parseurs sans effet sur le résultat (ou secrètes) : exclues de la clé du cache
+_IGNORED_OPTION_PARTS = (
+    "key", "token", "secret", "client", "url", "verbose", "show_progress",
+    "interval", "timeout", "workers",
+)
+
+
+def get_parse_cache_mode() -> str:
+    """
+    PARSE_CACHE :
+    - `on` (défaut) : un fichier déjà parsé avec le même parseur et les mêmes options
+      n'est pas reparsé
+    - `offline` : uniquement le cache, le parseur n'est jamais appelé (service de parsing
+      indisponible, pas de réseau) ; un fichier absent du cache est une erreur
+    - `off` : pas de cache
+    """
+    mode = os.getenv("PARSE_CACHE", "on")
+    if mode not in ("on", "offline", "off"):
+        raise ValueError(f"Invalid PARSE_CACHE: {mode}")
+    return mode
+
+
+class ParseCacheMiss(Exception):
+    pass
+
+
+class ParseCache:
+    """
+    Documents parsés (texte et métadonnées), compressés dans une base SQLite locale,
+    indexés par (contenu du fichier, parseur, options du parseur).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed ("
+                "key TEXT PRIMARY KEY, parser TEXT, created_at REAL, documents BLOB NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[List[Document]]:
+        row = self._connection().execute(
+            "SELECT documents FROM parsed WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return [Document.from_dict(data) for data in json.loads(zlib.decompress(row[0]))]
+
+    def put(self, key: str, parser: str, documents: List[Document]) -> None:
+        blob = zlib.compress(json.dumps([doc.to_dict() for doc in documents]).encode(), 6)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)",
+                (key, parser, time.time(), blob),
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def get_parse_cache(path: Optional[str] = None) -> ParseCache:
+    path = path or os.getenv(
+        "PARSE_CACHE_PATH",
+        os.path.join(os.getenv("STORAGE_DIR", "storage"), "parse_cache.sqlite3"),
+    )
+    return ParseCache(path)
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_ignored_option(name: str) -> bool:
+    return any(part in name.lower() for part in _IGNORED_OPTION_PARTS)
+
+
+def _parser_options(reader: BaseReader) -> Dict[str, Any]:
+    if hasattr(reader, "model_dump"):
+        # Exclues avant la sérialisation : un client HTTP n'est pas sérialisable
+        ignored = {name for name in type(reader).model_fields if _is_ignored_option(name)}
+        return reader.model_dump(mode="json", exclude_none=True, exclude=ignored)
+    return {
+        k: v
+        for k, v in vars(reader).items()
+        if not k.startswith("_") and not _is_ignored_option(k)
+    }
+
+
+class CachedReader(BaseReader):
+    """
+    Lecteur de fichiers qui réutilise les documents déjà parsés par `reader`
+    (voir `get_parse_cache_mode`).
+    """
+
+    def __init__(
+        self,
+        reader: Union[BaseReader, Type[BaseReader]],
+        cache: ParseCache,
+        offline: bool = False,
+    ):
+        # Instance, ou classe instanciée au premier fichier lu (comme SimpleDirectoryReader)
+        self._reader = reader
+        self.cache = cache
+        self.offline = offline
+        self.parser_name = (reader if isinstance(reader, type) else type(reader)).__name__
+        self._options: Optional[str] = None
+
+    @property
+    def reader(self) -> BaseReader:
+        if isinstance(self._reader, type):
+            self._reader = self._reader()
+        return self._reader
+
+    def _cache_key(self, file: Path) -> str:
+        if self._options is None:
+            self._options = json.dumps(_parser_options(self.reader), sort_keys=True, default=str)
+        return hashlib.sha256(
+            f"{_file_hash(file)}:{self.parser_name}:{self._options}".encode()
+        ).hexdigest()
+
+    def _lookup(self, file: Path, extra_info: Optional[Dict]) -> Tuple[str, Optional[List[Document]]]:
+        key = self._cache_key(file)
+        documents = self.cache.get(key)
+        observe_cache("parse", documents is not None)
+        if documents is not None:
+            for doc in documents:
+                # Nouvel identifiant, comme un vrai parsing : deux uploads du même fichier ne
+                # doivent pas partager leur ref_doc_id (la suppression de l'un effacerait
+                # les noeuds de l'autre)
+                doc.id_ = str(uuid.uuid4())
+                # Métadonnées du fichier courant (chemin, dates) plutôt que celles du premier parsing
+                doc.metadata.update(extra_info or {})
+        elif self.offline:
+            raise ParseCacheMiss(f"{file} is not in the parse cache (PARSE_CACHE=offline)")
+        return key, documents
+
+    def load_data(
+        self, file: Path, extra_info: Optional[Dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        file = Path(file)
+        key, documents = self._lookup(file, extra_info)
+        if documents is not None:
+            return documents
+
+        logger.info(f"Parsing {file.name} with {self.parser_name}")
+        documents = self.reader.load_data(file, extra_info=extra_info, **kwargs)
+        self.cache.put(key, self.parser_name, documents)
+        return documents
+
+    async def aload_data(
+        self, file: Path, extra_info: Optional[Dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        # Hash du fichier et SQLite dans un thread : la boucle d'évènements reste libre
+        file = Path(file)
+        key, documents = await asyncio.to_thread(self._lookup, file, extra_info)
+        if documents is not None:
+            return documents
+
+        logger.info(f"Parsing {file.name} with {self.parser_name}")
+        reader = self.reader
+        if type(reader).aload_data is BaseReader.aload_data:
+            # Lecteur local synchrone
+            documents = await asyncio.to_thread(
+                reader.load_data, file, extra_info=extra_info, **kwargs
+            )
+        else:
+            documents = await reader.aload_data(file, extra_info=extra_info, **kwargs)
+        await asyncio.to_thread(self.cache.put, key, self.parser_name, documents)
+        return documents
+
+
+def cached_reader(reader: Union[BaseReader, Type[BaseReader]]) -> BaseReader:
+    """
+    `reader` avec le cache de parsing, sauf si PARSE_CACHE=off
+    """
+    mode = get_parse_cache_mode()
+    if mode == "off":
+        return reader() if isinstance(reader, type) else reader
+    return CachedReader(reader, get_parse_cache(), offline=mode == "offline")
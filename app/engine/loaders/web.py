@@ -1,36 +1,428 @@
-from typing import List, Optional
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal, Optional, Set, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
 
+import httpx
+from llama_index.core import Document
 from pydantic import BaseModel, Field
 
+from app.engine.loaders.file import run_sync
+from app.metrics import observe_cache
+
+logger = logging.getLogger(__name__)
+
 
 class CrawlUrl(BaseModel):
     base_url: str
     prefix: str
     max_depth: int = Field(default=1, ge=0)
+    # auto: headless browser only for pages that need JavaScript to show their text
+    render: Literal["auto", "static", "browser"] = "auto"
 
 
 class WebLoaderConfig(BaseModel):
     driver_arguments: Optional[List[str]] = Field(default_factory=list)
     urls: List[CrawlUrl]
+    max_concurrency_per_host: int = Field(default=2, gt=0)
+    # Minimum delay between two requests to the same host, robots.txt Crawl-delay wins if longer
+    crawl_delay: float = Field(default=0.0, ge=0)
+    browser_pool_size: int = Field(default=2, gt=0)
+    user_agent: str = "rag-crawler/1.0"
+    timeout: float = 30.0
+    respect_robots_txt: bool = True
+
+
+# Pages with less visible text than this, rendered by scripts, go to the browser
+MIN_STATIC_TEXT_CHARS = 200
+_SPA_ROOT_IDS = ("root", "app", "__next", "__nuxt")
+_REMOVED_TAGS = ("script", "style", "noscript", "template", "svg", "head")
+
+
+def normalize_url(url: str) -> str:
+    """
+    URL used for deduplication: no fragment, lowercase scheme and host,
+    no default port, "/" for an empty path.
+    """
+    url, _ = urldefrag(url)
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname or ""
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        netloc = f"{netloc}:{parts.port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+@dataclass
+class Page:
+    url: str
+    text: str
+    title: str = ""
+    links: List[str] = field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def extract_page(url: str, html: str) -> Tuple[Page, bool]:
+    """
+    Visible text, title and links of an HTML page, and whether the page looks
+    rendered by JavaScript (little text, an empty application root or scripts only).
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    links = [urljoin(url, a["href"]) for a in soup.find_all("a", href=True)]
+    has_scripts = soup.find("script") is not None
+    empty_root = any(
+        (root := soup.find(id=root_id)) is not None and not root.get_text(strip=True)
+        for root_id in _SPA_ROOT_IDS
+    )
+    for tag in soup(_REMOVED_TAGS):
+        tag.decompose()
+    lines = (line.strip() for line in soup.get_text("\n").splitlines())
+    text = "\n".join(line for line in lines if line)
+    needs_js = empty_root or (has_scripts and len(text) < MIN_STATIC_TEXT_CHARS)
+    return Page(url=url, text=text, title=title, links=links), needs_js
+
+
+class CrawlCache:
+    """
+    Pages already crawled, with their ETag / Last-Modified validators, in a local
+    SQLite database: an unchanged page (304 Not Modified) is neither downloaded
+    nor extracted again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched_at REAL, "
+                "page BLOB NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, url: str) -> Optional[Page]:
+        row = self._connection().execute(
+            "SELECT etag, last_modified, page FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(zlib.decompress(row[2]))
+        return Page(url=url, etag=row[0], last_modified=row[1], **data)
+
+    def put(self, page: Page) -> None:
+        data = {"text": page.text, "title": page.title, "links": page.links}
+        blob = zlib.compress(json.dumps(data).encode(), 6)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (page.url, page.etag, page.last_modified, time.time(), blob),
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def get_crawl_cache(path: Optional[str] = None) -> CrawlCache:
+    path = path or os.getenv(
+        "CRAWL_CACHE_PATH",
+        os.path.join(os.getenv("STORAGE_DIR", "storage"), "crawl_cache.sqlite3"),
+    )
+    return CrawlCache(path)
+
+
+class BrowserStartError(RuntimeError):
+    """The headless browser could not be started (no Chrome, no driver, bad arguments)."""
+
+
+def _quit_driver(driver) -> None:
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.debug(f"Failed to quit the headless browser: {e}")
+
+
+class BrowserPool:
+    """
+    Headless Chrome instances started on demand (at most `size`) and reused from
+    page to page. Selenium is blocking: pages are rendered in worker threads.
+    """
+
+    def __init__(self, size: int, driver_arguments: List[str], timeout: float):
+        self.size = size
+        self.driver_arguments = driver_arguments
+        self.timeout = timeout
+        self._drivers: List = []
+        self._idle: List = []
+        # One slot per driver, started or not
+        self._slots = asyncio.Semaphore(size)
+
+    def _start_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        for arg in self.driver_arguments:
+            options.add_argument(arg)
+        try:
+            driver = webdriver.Chrome(options=options)
+        except Exception as e:
+            raise BrowserStartError(str(e)) from e
+        driver.set_page_load_timeout(self.timeout)
+        return driver
+
+    async def render(self, url: str) -> str:
+        def load() -> str:
+            driver.get(url)
+            return driver.page_source
+
+        async with self._slots:
+            if self._idle:
+                driver = self._idle.pop()
+            else:
+                driver = await asyncio.to_thread(self._start_driver)
+                self._drivers.append(driver)
+            try:
+                html = await asyncio.to_thread(load)
+            except BaseException:
+                # Crashed session, page load timeout or cancelled render: the driver may be
+                # unusable or still loading, a new one is started for the next render
+                self._drivers.remove(driver)
+                asyncio.get_running_loop().run_in_executor(None, _quit_driver, driver)
+                raise
+            self._idle.append(driver)
+            return html
+
+    async def close(self) -> None:
+        for driver in self._drivers:
+            await asyncio.to_thread(_quit_driver, driver)
+        self._drivers.clear()
+        self._idle.clear()
+
+
+class _Host:
+    """
+    Politeness state of one host: concurrent requests, delay between requests, robots.txt
+    """
+
+    def __init__(self, max_concurrency: int, crawl_delay: float):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.crawl_delay = crawl_delay
+        self.robots: Optional[RobotFileParser] = None
+        self.robots_lock = asyncio.Lock()
+        self._delay_lock = asyncio.Lock()
+        self._next_request = 0.0
+
+    async def wait_turn(self) -> None:
+        if not self.crawl_delay:
+            return
+        async with self._delay_lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.crawl_delay
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class WebCrawler:
+    """
+    Crawls the configured sites breadth first, up to `max_depth` links from each
+    `base_url`, following only the links starting with `prefix`. Every URL is fetched
+    at most once (shared frontier). Static pages are fetched over HTTP with conditional
+    requests (see `CrawlCache`); pages that need JavaScript are rendered in a pooled
+    headless browser.
+    """
+
+    def __init__(self, config: WebLoaderConfig, cache: Optional[CrawlCache] = None):
+        self.config = config
+        self.cache = cache
+        self._hosts: Dict[str, _Host] = {}
+        self._seen: Set[str] = set()
+        self._browser: Optional[BrowserPool] = None
+        self._browser_unavailable = False
+
+    def _host(self, url: str) -> _Host:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = _Host(
+                self.config.max_concurrency_per_host, self.config.crawl_delay
+            )
+        return self._hosts[host]
+
+    async def _allowed(self, client: httpx.AsyncClient, url: str, host: _Host) -> bool:
+        if not self.config.respect_robots_txt:
+            return True
+        async with host.robots_lock:
+            if host.robots is None:
+                parts = urlsplit(url)
+                robots = RobotFileParser()
+                try:
+                    response = await client.get(f"{parts.scheme}://{parts.netloc}/robots.txt")
+                    # No robots.txt (or an error page): everything is allowed
+                    robots.parse(
+                        response.text.splitlines() if response.status_code == 200 else []
+                    )
+                except httpx.HTTPError:
+                    robots.parse([])
+                delay = robots.crawl_delay(self.config.user_agent)
+                if delay:
+                    host.crawl_delay = max(host.crawl_delay, float(delay))
+                host.robots = robots
+        return host.robots.can_fetch(self.config.user_agent, url)
+
+    async def _render(self, url: str, page: Page) -> Page:
+        if self._browser_unavailable:
+            return page
+        if self._browser is None:
+            self._browser = BrowserPool(
+                self.config.browser_pool_size,
+                self.config.driver_arguments or [],
+                self.config.timeout,
+            )
+        try:
+            html = await self._browser.render(url)
+        except ImportError:
+            logger.warning(
+                "selenium is not installed, pages rendered by JavaScript are loaded as static HTML"
+            )
+            self._browser_unavailable = True
+            return page
+        except BrowserStartError as e:
+            logger.warning(
+                f"Failed to start the headless browser, pages rendered by JavaScript are"
+                f" loaded as static HTML: {e}"
+            )
+            self._browser_unavailable = True
+            return page
+        except Exception as e:
+            # WebDriverException, page load timeout...: this page keeps its static HTML
+            logger.warning(f"Failed to render {url} in the headless browser: {e}")
+            return page
+        rendered, _ = extract_page(url, html)
+        rendered.etag, rendered.last_modified = page.etag, page.last_modified
+        return rendered
+
+    async def _fetch(
+        self, client: httpx.AsyncClient, url: str, render: str
+    ) -> Optional[Page]:
+        host = self._host(url)
+        if not await self._allowed(client, url, host):
+            logger.info(f"Skipping {url}, disallowed by robots.txt")
+            return None
+
+        cached = self.cache.get(url) if self.cache else None
+        headers = {}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+        async with host.semaphore:
+            await host.wait_turn()
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to fetch {url}: {e}")
+                return None
+
+        if cached:
+            observe_cache("crawl", response.status_code == 304)
+        if response.status_code == 304 and cached:
+            return cached
+        if response.status_code != 200:
+            logger.warning(f"Failed to fetch {url}: HTTP {response.status_code}")
+            return None
+
+        content_type = response.headers.get("content-type", "")
+        if "html" in content_type:
+            page, needs_js = extract_page(str(response.url), response.text)
+        elif content_type.startswith("text/"):
+            page, needs_js = Page(url=str(response.url), text=response.text), False
+        else:
+            logger.debug(f"Skipping {url}, unsupported content type {content_type}")
+            return None
+        page.url = url
+        page.etag = response.headers.get("etag")
+        page.last_modified = response.headers.get("last-modified")
+
+        if render == "browser" or (render == "auto" and needs_js):
+            page = await self._render(url, page)
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, page)
+        return page
+
+    def _visit(self, url: str) -> bool:
+        url = normalize_url(url)
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        return True
+
+    async def crawl(self) -> List[Document]:
+        documents: List[Document] = []
+        headers = {"User-Agent": self.config.user_agent}
+        async with httpx.AsyncClient(
+            headers=headers, timeout=self.config.timeout, follow_redirects=True
+        ) as client:
+            try:
+                frontier: List[Tuple[str, CrawlUrl]] = [
+                    (normalize_url(site.base_url), site)
+                    for site in self.config.urls
+                    if self._visit(site.base_url)
+                ]
+                depth = 0
+                while frontier:
+                    # One level at a time: all the pages of a level are fetched concurrently
+                    pages = await asyncio.gather(
+                        *(self._fetch(client, url, site.render) for url, site in frontier)
+                    )
+                    next_frontier = []
+                    for (url, site), page in zip(frontier, pages):
+                        if page is None:
+                            continue
+                        if page.text:
+                            documents.append(
+                                Document(
+                                    id_=url,
+                                    text=page.text,
+                                    metadata={"url": url, "title": page.title},
+                                )
+                            )
+                        if depth < site.max_depth:
+                            next_frontier.extend(
+                                (normalize_url(link), site)
+                                for link in page.links
+                                if link.startswith(site.prefix) and self._visit(link)
+                            )
+                    frontier = next_frontier
+                    depth += 1
+            finally:
+                if self._browser is not None:
+                    await self._browser.close()
+        return documents
+
+
+async def aget_web_documents(config: WebLoaderConfig) -> List[Document]:
+    return await WebCrawler(config, cache=get_crawl_cache()).crawl()
 
 
 def get_web_documents(config: WebLoaderConfig):
-    from llama_index.readers.web import WholeSiteReader
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
-
-    options = Options()
-    driver_arguments = config.driver_arguments or []
-    for arg in driver_arguments:
-        options.add_argument(arg)
-
-    docs = []
-    for url in config.urls:
-        scraper = WholeSiteReader(
-            prefix=url.prefix,
-            max_depth=url.max_depth,
-            driver=webdriver.Chrome(options=options),
-        )
-        docs.extend(scraper.load_data(url.base_url))
-
-    return docs
+    return run_sync(aget_web_documents(config))
@@ -0,0 +1,94 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, Sequence
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+
+class NodeStore:
+    """
+    Noeuds (texte et métadonnées) compressés (zlib) dans une base SQLite locale, indexés
+    par identifiant de noeud. Les lectures passent par une projection mémoire du fichier
+    (NODE_STORE_MMAP_BYTES).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                "id TEXT PRIMARY KEY, ref_doc_id TEXT, node_type TEXT, node BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS nodes_ref_doc_id ON nodes (ref_doc_id)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # Une connexion par thread ; WAL : lectures concurrentes pendant une ingestion
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA mmap_size={int(os.getenv('NODE_STORE_MMAP_BYTES', 1 << 30))}")
+            self._local.conn = conn
+        return conn
+
+    def put(self, nodes: Sequence[BaseNode]) -> None:
+        rows = []
+        for node in nodes:
+            # L'embedding reste dans le vector store
+            data = node.to_dict()
+            data["embedding"] = None
+            rows.append(
+                (
+                    node.node_id,
+                    node.ref_doc_id,
+                    node.class_name(),
+                    zlib.compress(json.dumps(data).encode(), 6),
+                )
+            )
+        with self._connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)", rows)
+
+    def get(self, ids: Iterable[str]) -> Dict[str, BaseNode]:
+        """
+        Noeuds des identifiants donnés, en une seule requête (les absents sont ignorés)
+        """
+        ids = list(ids)
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._connection().execute(
+            f"SELECT id, node_type, node FROM nodes WHERE id IN ({placeholders})", ids
+        )
+        return {
+            node_id: metadata_dict_to_node(
+                {"_node_content": zlib.decompress(blob).decode(), "_node_type": node_type}
+            )
+            for node_id, node_type, blob in rows
+        }
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM nodes WHERE id = ?", [(i,) for i in ids])
+
+    def delete_ref_docs(self, ref_doc_ids: Iterable[str]) -> None:
+        with self._connection() as conn:
+            conn.executemany(
+                "DELETE FROM nodes WHERE ref_doc_id = ?", [(i,) for i in ref_doc_ids]
+            )
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM nodes")
+
+
+@functools.lru_cache(maxsize=None)
+def get_node_store(path: str) -> NodeStore:
+    # Une instance par fichier : connexions SQLite réutilisées d'une requête à l'autre
+    return NodeStore(path)
@@ -0,0 +1,623 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+# Lignes converties en float32 par bloc pour le calcul des scores (embeddings float16)
+SCORE_BLOCK_ROWS = 65536
+
+
+def _match_filter(f: MetadataFilter, payload: Dict[str, Any]) -> bool:
+    """
+    Même sémantique que les filtres Qdrant : un champ absent ne correspond à aucune
+    condition, sauf IS_EMPTY.
+    """
+    value = payload.get(f.key)
+    if f.operator == FilterOperator.IS_EMPTY:
+        return value is None or value == [] or value == ""
+    if value is None:
+        return False
+    match f.operator:
+        case FilterOperator.EQ:
+            return value == f.value
+        case FilterOperator.NE:
+            return value != f.value
+        case FilterOperator.GT:
+            return value > f.value
+        case FilterOperator.LT:
+            return value < f.value
+        case FilterOperator.GTE:
+            return value >= f.value
+        case FilterOperator.LTE:
+            return value <= f.value
+        case FilterOperator.IN:
+            return value in f.value
+        case FilterOperator.NIN:
+            return value not in f.value
+        case FilterOperator.CONTAINS:
+            return isinstance(value, list) and f.value in value
+        case FilterOperator.TEXT_MATCH:
+            return str(f.value) in str(value)
+        case FilterOperator.TEXT_MATCH_INSENSITIVE:
+            return str(f.value).lower() in str(value).lower()
+        case _:
+            raise ValueError(f"Unsupported filter operator: {f.operator}")
+
+
+def _scores(embeddings: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    if embeddings.dtype == np.float32:
+        return embeddings @ vector
+    # Pas de BLAS en float16 : conversion par blocs pour borner la mémoire
+    scores = np.empty((len(embeddings),) + vector.shape[1:], dtype=np.float32)
+    for start in range(0, len(embeddings), SCORE_BLOCK_ROWS):
+        block = embeddings[start : start + SCORE_BLOCK_ROWS]
+        scores[start : start + len(block)] = block.astype(np.float32) @ vector
+    return scores
+
+
+class _Segment:
+    """
+    Segment immuable de l'index, écrit une fois par un ajout ou une fusion :
+    - `<nom>.npy` : embeddings, en mémoire mappée ;
+    - `<nom>.json` : identifiants et métadonnées des noeuds, sans leur contenu ;
+    - `<nom>.content` et `<nom>.offsets.npy` : contenu sérialisé des noeuds (`_node_content`,
+      qui porte le texte) bout à bout et ses positions, en mémoire mappée.
+    Seules les métadonnées, utilisées par les filtres, sont chargées dans chaque worker :
+    les embeddings et les textes sont lus dans le cache de pages, partagé entre les process.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        path = os.path.join(directory, name)
+        self.embeddings = np.load(f"{path}.npy", mmap_mode="r")
+        with open(f"{path}.json") as f:
+            self.entries: List[Dict[str, Any]] = json.load(f)
+        self.offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+        with open(f"{path}.content", "rb") as f:
+            # Un fichier vide ne peut pas être mappé
+            size = os.fstat(f.fileno()).st_size
+            self._content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.ids = np.asarray([entry["id"] for entry in self.entries])
+        self._columns: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def content(self, i: int) -> bytes:
+        return self._content[int(self.offsets[i]) : int(self.offsets[i + 1])]
+
+    def column(self, key: str) -> np.ndarray:
+        with self._lock:
+            values = self._columns.get(key)
+            if values is None:
+                values = np.empty(len(self.entries), dtype=object)
+                values[:] = [entry["payload"].get(key) for entry in self.entries]
+                self._columns[key] = values
+        return values
+
+    @staticmethod
+    def write(
+        directory: str,
+        name: str,
+        embeddings: np.ndarray,
+        entries: List[Dict[str, Any]],
+        contents: List[bytes],
+        dtype: str,
+    ) -> None:
+        # Un segment n'est visible qu'une fois listé dans le manifeste, écrit en dernier
+        path = os.path.join(directory, name)
+        with open(f"{path}.npy", "wb") as f:
+            np.save(f, np.asarray(embeddings, dtype=dtype))
+        with open(f"{path}.json", "w") as f:
+            json.dump(entries, f)
+        with open(f"{path}.content", "wb") as f:
+            f.writelines(contents)
+        offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+        np.cumsum([len(content) for content in contents], out=offsets[1:])
+        with open(f"{path}.offsets.npy", "wb") as f:
+            np.save(f, offsets)
+
+    @staticmethod
+    def remove(directory: str, name: str) -> None:
+        # Les workers qui ont encore ce segment en mémoire mappée gardent leurs pages
+        for suffix in (".npy", ".json", ".content", ".offsets.npy"):
+            try:
+                os.remove(os.path.join(directory, f"{name}{suffix}"))
+            except FileNotFoundError:
+                pass
+
+
+class _Snapshot:
+    """
+    État chargé de l'index : les segments listés par le manifeste, les identifiants des
+    noeuds dans un tableau parallèle, les lignes supprimées, et les masques booléens des
+    filtres déjà évalués. Les lignes sont numérotées à la suite, segment après segment.
+    Une écriture crée un nouveau snapshot : les requêtes en cours gardent le précédent.
+    """
+
+    def __init__(self, segments: List[_Segment], manifest: Dict[str, Any], version: tuple):
+        self.segments = segments
+        self.manifest = manifest
+        self.version = version
+        self.starts = np.zeros(len(segments) + 1, dtype=np.int64)
+        np.cumsum([len(segment) for segment in segments], out=self.starts[1:])
+        self.size = int(self.starts[-1])
+        self.ids = (
+            np.concatenate([segment.ids for segment in segments])
+            if segments
+            else np.empty(0, dtype=str)
+        )
+        # Suppressions : lignes masquées jusqu'à la prochaine fusion des segments concernés
+        self.alive: Optional[np.ndarray] = None
+        if manifest["deleted"]:
+            self.alive = np.ones(self.size, dtype=bool)
+            self.alive[manifest["deleted"]] = False
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: LRUCache = LRUCache(maxsize=256)
+        self._lock = threading.Lock()
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self.segments[0].embeddings.shape[1] if self.segments else None
+
+    def count(self) -> int:
+        return self.size - len(self.manifest["deleted"])
+
+    def live(self, mask: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if self.alive is None:
+            return mask
+        return self.alive if mask is None else mask & self.alive
+
+    def _locate(self, row: int) -> Tuple[_Segment, int]:
+        index = int(np.searchsorted(self.starts, row, side="right")) - 1
+        return self.segments[index], row - int(self.starts[index])
+
+    def node(self, row: int) -> BaseNode:
+        segment, local = self._locate(row)
+        payload = dict(segment.entries[local]["payload"])
+        payload["_node_content"] = segment.content(local).decode("utf-8")
+        return metadata_dict_to_node(payload)
+
+    def column(self, key: str) -> np.ndarray:
+        with self._lock:
+            values = self._columns.get(key)
+            if values is None:
+                values = np.empty(self.size, dtype=object)
+                for segment, start in zip(self.segments, self.starts):
+                    values[start : start + len(segment)] = segment.column(key)
+                self._columns[key] = values
+        return values
+
+    def _leaf_mask(self, f: MetadataFilter) -> np.ndarray:
+        values = self.column(f.key)
+        if f.operator in (FilterOperator.EQ, FilterOperator.NE) and not isinstance(
+            f.value, (list, dict)
+        ):
+            present = values != None  # noqa: E711 (comparaison élément par élément)
+            if f.operator == FilterOperator.EQ:
+                return present & (values == f.value)
+            return present & (values != f.value)
+        if f.operator in (FilterOperator.IN, FilterOperator.NIN):
+            accepted = set(f.value)
+            mask = np.fromiter((v in accepted for v in values), dtype=bool, count=len(values))
+            if f.operator == FilterOperator.IN:
+                return mask
+            return ~mask & (values != None)  # noqa: E711
+        return np.fromiter(
+            (_match_filter(f, {f.key: v}) for v in values), dtype=bool, count=len(values)
+        )
+
+    def filter_mask(self, filters) -> np.ndarray:
+        """
+        Masque des noeuds qui correspondent aux filtres, mis en cache par filtre :
+        les sous-filtres communs (ex. documents publics) ne sont évalués qu'une fois.
+        """
+        key = filters.model_dump_json()
+        with self._lock:
+            mask = self._masks.get(key)
+        if mask is not None:
+            return mask
+        if isinstance(filters, MetadataFilter):
+            mask = self._leaf_mask(filters)
+        else:
+            masks = [self.filter_mask(f) for f in filters.filters]
+            if not masks:
+                mask = np.ones(self.size, dtype=bool)
+            elif filters.condition == FilterCondition.OR:
+                mask = np.logical_or.reduce(masks)
+            elif filters.condition == FilterCondition.NOT:
+                mask = ~np.logical_or.reduce(masks)
+            else:
+                mask = np.logical_and.reduce(masks)
+        with self._lock:
+            self._masks[key] = mask
+        return mask
+
+    def scores(self, vector: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Scores des lignes `rows` (triées ; toutes par défaut) pour un vecteur (D,) ou
+        plusieurs (D, B), segment par segment
+        """
+        if not self.segments:
+            return np.empty((0,) + vector.shape[1:], dtype=np.float32)
+        if rows is None:
+            return np.concatenate([_scores(segment.embeddings, vector) for segment in self.segments])
+        parts = np.split(rows, np.searchsorted(rows, self.starts[1:-1]))
+        return np.concatenate(
+            [
+                _scores(segment.embeddings[part - start], vector)
+                for segment, start, part in zip(self.segments, self.starts, parts)
+            ]
+        )
+
+    def search(
+        self, vector: np.ndarray, top_k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recherche exacte : un produit matrice-vecteur puis un `argpartition` pour le top-k
+        """
+        if mask is None:
+            rows = np.arange(self.size)
+            scores = self.scores(vector)
+        else:
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return rows, np.empty(0, dtype=np.float32)
+            # Filtre peu sélectif : un produit sur tout l'index évite de copier les lignes
+            if len(rows) > self.size // 2:
+                scores = self.scores(vector)[rows]
+            else:
+                scores = self.scores(vector, rows)
+        return _top_k(rows, scores, top_k)
+
+    def search_batch(
+        self, vectors: np.ndarray, top_k: int, mask: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Plusieurs requêtes avec le même filtre : un seul produit matriciel (N, D) x (D, B)
+        """
+        rows = np.arange(self.size) if mask is None else np.flatnonzero(mask)
+        if len(rows) == 0:
+            return [(rows, np.empty(0, dtype=np.float32)) for _ in vectors]
+        scores = self.scores(vectors.T, None if mask is None else rows)
+        return [_top_k(rows, scores[:, i], top_k) for i in range(len(vectors))]
+
+
+def _top_k(rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # argpartition en O(N), puis tri des k meilleurs seulement
+    k = min(top_k, len(rows))
+    if k <= 0:
+        return rows[:0], scores[:0]
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return rows[top], scores[top]
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store local, sans service : recherche exacte (produit scalaire sur des
+    embeddings normalisés) dans des fichiers `.npy` chargés en mémoire mappée.
+
+    L'index est une suite de segments immuables (voir `_Segment`) listés par
+    `<persist_dir>/manifest.json`, avec les lignes supprimées. Un ajout écrit un nouveau
+    segment puis remplace le manifeste : son coût ne dépend pas de la taille de l'index.
+    Les derniers segments sont fusionnés quand ils sont de taille comparable, ce qui garde
+    un nombre logarithmique de segments (chaque noeud est réécrit O(log N) fois), et
+    l'index est compacté quand plus de la moitié des lignes sont supprimées.
+    Les autres process (workers uvicorn) rechargent le manifeste quand il a changé, et ne
+    chargent que les nouveaux segments.
+    """
+
+    stores_text: bool = True
+    persist_dir: str
+    dtype: str = "float32"
+
+    _snapshot: Optional[_Snapshot] = PrivateAttr(default=None)
+    _segments: Dict[str, _Segment] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def collection_name(self) -> str:
+        return os.path.basename(os.path.normpath(self.persist_dir))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path(MANIFEST_FILE))
+
+    def _segment(self, name: str) -> _Segment:
+        segment = self._segments.get(name)
+        if segment is None:
+            segment = self._segments[name] = _Segment(self.persist_dir, name)
+        return segment
+
+    def _refresh(self) -> Optional[_Snapshot]:
+        """
+        (Re)charge l'index si le manifeste a été modifié, par ce process ou un autre
+        """
+        for attempt in range(5):
+            try:
+                stat = os.stat(self._path(MANIFEST_FILE))
+            except FileNotFoundError:
+                self._snapshot = None
+                self._segments.clear()
+                return None
+            # Chaque écriture remplace le manifeste : nouvel inode
+            version = (stat.st_ino, stat.st_mtime_ns)
+            if self._snapshot is not None and self._snapshot.version == version:
+                return self._snapshot
+            try:
+                with open(self._path(MANIFEST_FILE)) as f:
+                    manifest = json.load(f)
+                segments = [self._segment(s["name"]) for s in manifest["segments"]]
+            except FileNotFoundError:
+                # Segments fusionnés par un autre process entre-temps : relecture du manifeste
+                if attempt == 4:
+                    raise
+                continue
+            names = {segment.name for segment in segments}
+            for name in [name for name in self._segments if name not in names]:
+                del self._segments[name]
+            self._snapshot = _Snapshot(segments, manifest, version)
+            return self._snapshot
+
+    def _current(self) -> Optional[_Snapshot]:
+        with self._lock:
+            return self._refresh()
+
+    @contextmanager
+    def _write_lock(self):
+        # Verrou inter-process : plusieurs workers peuvent indexer en même temps
+        os.makedirs(self.persist_dir, exist_ok=True)
+        with self._lock, open(self._path(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self._refresh()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _commit(self, manifest: Dict[str, Any], removed: List[str]) -> None:
+        # Le manifeste est remplacé en dernier : les lecteurs ne voient jamais un état partiel
+        tmp_manifest = self._path(f"{MANIFEST_FILE}.tmp")
+        with open(tmp_manifest, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, self._path(MANIFEST_FILE))
+        for name in removed:
+            _Segment.remove(self.persist_dir, name)
+        self._refresh()
+
+    def _new_segment(
+        self,
+        manifest: Dict[str, Any],
+        embeddings: np.ndarray,
+        entries: List[Dict[str, Any]],
+        contents: List[bytes],
+    ) -> Dict[str, Any]:
+        name = f"segment-{manifest['next_segment']:08d}"
+        manifest["next_segment"] += 1
+        _Segment.write(self.persist_dir, name, embeddings, entries, contents, self.dtype)
+        return {"name": name, "rows": len(entries)}
+
+    def _merge(self, manifest: Dict[str, Any], first: int) -> List[str]:
+        """
+        Fusionne les segments à partir de l'indice `first` en un seul, sans les lignes
+        supprimées. Les segments précédents (et leurs numéros de ligne) ne changent pas.
+        Retourne les noms des segments remplacés.
+        """
+        merged = manifest["segments"][first:]
+        start = sum(s["rows"] for s in manifest["segments"][:first])
+        deleted = set(manifest["deleted"])
+        embeddings, entries, contents = [], [], []
+        row = start
+        for s in merged:
+            segment = self._segment(s["name"])
+            keep = [i for i in range(len(segment)) if row + i not in deleted]
+            row += len(segment)
+            embeddings.append(np.asarray(segment.embeddings[keep]))
+            entries.extend(segment.entries[i] for i in keep)
+            contents.extend(segment.content(i) for i in keep)
+        manifest["segments"] = manifest["segments"][:first]
+        manifest["deleted"] = [i for i in manifest["deleted"] if i < start]
+        if entries:
+            manifest["segments"].append(
+                self._new_segment(manifest, np.concatenate(embeddings), entries, contents)
+            )
+        return [s["name"] for s in merged]
+
+    def _compact(self, manifest: Dict[str, Any]) -> List[str]:
+        # Plus de la moitié des lignes supprimées : réécriture complète de l'index
+        rows = sum(s["rows"] for s in manifest["segments"])
+        if manifest["deleted"] and 2 * len(manifest["deleted"]) > rows:
+            return self._merge(manifest, 0)
+        # Sinon fusion des derniers segments tant que le précédent n'est pas plus grand
+        # que leur total (comme un compteur binaire)
+        first = len(manifest["segments"]) - 1
+        total = manifest["segments"][first]["rows"] if first >= 0 else 0
+        while first > 0 and manifest["segments"][first - 1]["rows"] <= total:
+            first -= 1
+            total += manifest["segments"][first]["rows"]
+        if first < len(manifest["segments"]) - 1:
+            return self._merge(manifest, first)
+        return []
+
+    def _manifest(self, snapshot: Optional[_Snapshot]) -> Dict[str, Any]:
+        # Copie modifiable du manifeste courant
+        if snapshot is None:
+            return {"segments": [], "deleted": [], "next_segment": 0}
+        return json.loads(json.dumps(snapshot.manifest))
+
+    def count(self) -> int:
+        snapshot = self._current()
+        return snapshot.count() if snapshot else 0
+
+    def segments_count(self) -> int:
+        snapshot = self._current()
+        return len(snapshot.segments) if snapshot else 0
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        entries, contents = [], []
+        for node in nodes:
+            payload = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+            contents.append(payload.pop("_node_content").encode("utf-8"))
+            entries.append({"id": node.node_id, "payload": payload})
+        with self._write_lock() as snapshot:
+            if snapshot is not None and snapshot.dimension not in (None, vectors.shape[1]):
+                raise ValueError(
+                    f"The vector store '{self.persist_dir}' stores vectors of dimension"
+                    f" {snapshot.dimension}, got {vectors.shape[1]}"
+                )
+            manifest = self._manifest(snapshot)
+            if snapshot is not None:
+                # Un noeud déjà présent est remplacé (même comportement que l'upsert de Qdrant)
+                replaced = snapshot.live(np.isin(snapshot.ids, [e["id"] for e in entries]))
+                manifest["deleted"].extend(int(i) for i in np.flatnonzero(replaced))
+            manifest["segments"].append(self._new_segment(manifest, vectors, entries, contents))
+            self._commit(manifest, self._compact(manifest))
+        return [node.node_id for node in nodes]
+
+    def _delete_where(self, mask_fn) -> None:
+        with self._write_lock() as snapshot:
+            if snapshot is None:
+                return
+            rows = np.flatnonzero(snapshot.live(mask_fn(snapshot)))
+            if len(rows) == 0:
+                return
+            manifest = self._manifest(snapshot)
+            manifest["deleted"].extend(int(i) for i in rows)
+            self._commit(manifest, self._compact(manifest))
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._delete_where(lambda snapshot: snapshot.column("ref_doc_id") == ref_doc_id)
+
+    def _query_mask(
+        self,
+        snapshot: _Snapshot,
+        node_ids: Optional[List[str]] = None,
+        doc_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+    ) -> Optional[np.ndarray]:
+        mask = None
+        if filters is not None:
+            mask = snapshot.filter_mask(filters)
+        if node_ids:
+            ids_mask = np.isin(snapshot.ids, list(node_ids))
+            mask = ids_mask if mask is None else mask & ids_mask
+        if doc_ids:
+            doc_mask = snapshot.filter_mask(
+                MetadataFilter(key="ref_doc_id", value=list(doc_ids), operator=FilterOperator.IN)
+            )
+            mask = doc_mask if mask is None else mask & doc_mask
+        return snapshot.live(mask)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        def mask_fn(snapshot: _Snapshot) -> np.ndarray:
+            mask = self._query_mask(snapshot, node_ids=node_ids, filters=filters)
+            return np.ones(snapshot.size, dtype=bool) if mask is None else mask
+
+        self._delete_where(mask_fn)
+
+    def clear(self) -> None:
+        with self._write_lock() as snapshot:
+            if snapshot is None:
+                return
+            os.remove(self._path(MANIFEST_FILE))
+            for segment in snapshot.segments:
+                _Segment.remove(self.persist_dir, segment.name)
+            self._refresh()
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        limit: Optional[int] = None,
+    ) -> List[BaseNode]:
+        snapshot = self._current()
+        if snapshot is None:
+            return []
+        mask = self._query_mask(snapshot, node_ids=node_ids, filters=filters)
+        rows = np.arange(snapshot.size) if mask is None else np.flatnonzero(mask)
+        return [snapshot.node(i) for i in rows[:limit]]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        snapshot = self._current()
+        if snapshot is None or not snapshot.count() or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        mask = self._query_mask(snapshot, query.node_ids, query.doc_ids, query.filters)
+        vector = np.asarray(query.query_embedding, dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        rows, scores = snapshot.search(vector, query.similarity_top_k, mask)
+
+        return VectorStoreQueryResult(
+            nodes=[snapshot.node(i) for i in rows],
+            similarities=[float(score) for score in scores],
+            ids=[str(snapshot.ids[i]) for i in rows],
+        )
+
+    def query_batch(
+        self,
+        query_embeddings: List[List[float]],
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[VectorStoreQueryResult]:
+        snapshot = self._current()
+        if snapshot is None or not snapshot.count():
+            return [VectorStoreQueryResult(nodes=[], similarities=[], ids=[]) for _ in query_embeddings]
+
+        mask = self._query_mask(snapshot, filters=filters)
+        vectors = np.asarray(query_embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return [
+            VectorStoreQueryResult(
+                nodes=[snapshot.node(i) for i in rows],
+                similarities=[float(score) for score in scores],
+                ids=[str(snapshot.ids[i]) for i in rows],
+            )
+            for rows, scores in snapshot.search_batch(vectors, similarity_top_k, mask)
+        ]
+
+    def persist(self, persist_path: str, fs=None) -> None:
+        # Les données sont écrites à chaque modification
+        pass
@@ -0,0 +1,148 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import (
+    BaseNode,
+    MetadataMode,
+    NodeRelationship,
+    NodeWithScore,
+    QueryBundle,
+    TransformComponent,
+)
+
+from app.engine.node_store import NodeStore, get_node_store
+from app.engine.token_count import TOKEN_COUNT_KEY, TOKENIZER_KEY, TokenCountExtractor
+
+logger = logging.getLogger(__name__)
+
+# Métadonnée des chunks enfants : identifiant de leur section parente
+PARENT_ID_KEY = "parent_id"
+
+
+def get_child_chunk_size() -> Optional[int]:
+    """
+    Taille (tokens) des chunks enfants embeddés. Non définie : pas de découpage
+    parent/enfant, les chunks sont embeddés tels quels.
+    """
+    value = os.getenv("CHILD_CHUNK_SIZE")
+    return int(value) if value else None
+
+
+def get_parent_store(path: Optional[str] = None) -> NodeStore:
+    """
+    Sections parentes, stockées une seule fois et compressées : elles ne sont pas
+    dupliquées dans le payload du vector store.
+    """
+    path = path or os.getenv(
+        "PARENT_STORE_PATH",
+        os.path.join(os.getenv("STORAGE_DIR", "storage"), "parents.sqlite3"),
+    )
+    return get_node_store(path)
+
+
+class ParentChildSplitter(TransformComponent):
+    """
+    Redécoupe chaque chunk (la section parente) en petits chunks enfants, seuls embeddés.
+    Les parents sont écrits dans le store des parents ; les enfants gardent le document
+    d'origine comme source et l'identifiant de leur parent dans les métadonnées.
+    """
+
+    child_chunk_size: int
+    child_chunk_overlap: int = 20
+    store_path: Optional[str] = None
+    _splitter: SentenceSplitter = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._splitter = SentenceSplitter(
+            chunk_size=self.child_chunk_size, chunk_overlap=self.child_chunk_overlap
+        )
+
+    def _children(self, parent: BaseNode) -> List[BaseNode]:
+        text = parent.get_content(metadata_mode=MetadataMode.NONE)
+        splits = self._splitter.split_text_metadata_aware(
+            text, parent.get_metadata_str(MetadataMode.EMBED)
+        )
+        if len(splits) <= 1:
+            splits = [text]
+        children = build_nodes_from_splits(splits, parent)
+        offset = 0
+        for child in children:
+            child.metadata = {
+                **{
+                    k: v
+                    for k, v in parent.metadata.items()
+                    if k not in (TOKEN_COUNT_KEY, TOKENIZER_KEY)
+                },
+                PARENT_ID_KEY: parent.node_id,
+            }
+            child.excluded_embed_metadata_keys = [
+                *parent.excluded_embed_metadata_keys, PARENT_ID_KEY
+            ]
+            child.excluded_llm_metadata_keys = [*parent.excluded_llm_metadata_keys, PARENT_ID_KEY]
+            # Même document source que le parent : suppressions et mises à jour par document
+            if parent.source_node is not None:
+                child.relationships[NodeRelationship.SOURCE] = parent.source_node
+            child.relationships[NodeRelationship.PARENT] = parent.as_related_node_info()
+            position = text.find(child.text, offset)
+            if position >= 0 and parent.start_char_idx is not None:
+                child.start_char_idx = parent.start_char_idx + position
+                child.end_char_idx = child.start_char_idx + len(child.text)
+                offset = position
+        return children
+
+    def __call__(self, nodes: Sequence[BaseNode], **kwargs: Any) -> Sequence[BaseNode]:
+        children: List[BaseNode] = []
+        for parent in nodes:
+            children.extend(self._children(parent))
+
+        # Nombre de tokens des parents : c'est eux qui sont envoyés au LLM
+        parents = TokenCountExtractor()(nodes)
+        store = get_parent_store(self.store_path)
+        # Les documents ré-ingérés remplacent leurs anciennes sections
+        store.delete_ref_docs({p.ref_doc_id for p in parents if p.ref_doc_id})
+        store.put(parents)
+        return children
+
+
+class ParentExpander(BaseNodePostprocessor):
+    """
+    Remplace les chunks enfants retrouvés par leur section parente : une seule fois par
+    parent, avec le meilleur score de ses enfants. Les autres chunks sont gardés tels quels.
+    """
+
+    store_path: Optional[str] = Field(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ParentExpander"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        parent_ids = [n.node.metadata.get(PARENT_ID_KEY) for n in nodes]
+        if not any(parent_ids):
+            return nodes
+        parents = get_parent_store(self.store_path).get({i for i in parent_ids if i})
+
+        expanded: Dict[str, NodeWithScore] = {}
+        result: List[NodeWithScore] = []
+        for node, parent_id in zip(nodes, parent_ids):
+            parent = parents.get(parent_id) if parent_id else None
+            if parent is None:
+                # Chunk sans parent, ou parent supprimé depuis l'ingestion
+                result.append(node)
+            elif parent_id in expanded:
+                best = expanded[parent_id]
+                best.score = max(best.score or 0.0, node.score or 0.0)
+            else:
+                expanded[parent_id] = NodeWithScore(node=parent, score=node.score)
+                result.append(expanded[parent_id])
+        return result
@@ -0,0 +1,104 @@
+import logging
+from typing import Any, List, Sequence, Tuple
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import VectorStoreQueryResult
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+
+from app.engine.node_store import NodeStore, get_node_store
+
+logger = logging.getLogger(__name__)
+
+# Clés de document utilisées par QdrantVectorStore pour les suppressions par document
+DOCUMENT_PAYLOAD_FIELDS = ("doc_id", "document_id", "ref_doc_id")
+
+
+class ExternalTextQdrantVectorStore(QdrantVectorStore):
+    """
+    Qdrant ne stocke que les vecteurs et les champs filtrés (`payload_fields`) ; le texte
+    et les métadonnées des noeuds sont dans un NodeStore local, compressé, lu en une
+    seule requête après chaque recherche.
+
+    Le NodeStore est un fichier local : l'ingestion et l'API doivent partager STORAGE_DIR.
+    Les points écrits avant l'activation de l'option (payload complet) restent lisibles.
+    """
+
+    _node_store: NodeStore = PrivateAttr()
+    _payload_fields: Tuple[str, ...] = PrivateAttr()
+
+    def __init__(
+        self, *args: Any, node_store_path: str, payload_fields: Sequence[str], **kwargs: Any
+    ):
+        super().__init__(*args, **kwargs)
+        self._node_store = get_node_store(node_store_path)
+        self._payload_fields = tuple(payload_fields) + DOCUMENT_PAYLOAD_FIELDS
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ExternalTextQdrantVectorStore"
+
+    @property
+    def node_store(self) -> NodeStore:
+        return self._node_store
+
+    def _build_points(
+        self, nodes: List[BaseNode], sparse_vector_name: str
+    ) -> Tuple[List[Any], List[str]]:
+        points, ids = super()._build_points(nodes, sparse_vector_name)
+        self._node_store.put(nodes)
+        for point in points:
+            point.payload = {k: v for k, v in point.payload.items() if k in self._payload_fields}
+        return points, ids
+
+    def parse_to_query_result(self, response: List[Any]) -> VectorStoreQueryResult:
+        stored = self._node_store.get(
+            str(point.id) for point in response if "_node_content" not in (point.payload or {})
+        )
+        nodes, similarities, ids = [], [], []
+        for point in response:
+            point_id = str(point.id)
+            if "_node_content" in (point.payload or {}):
+                # Point écrit avec le payload complet
+                node = super().parse_to_query_result([point]).nodes[0]
+            elif point_id in stored:
+                node = stored[point_id]
+                vector = point.vector
+                if isinstance(vector, dict):
+                    vector = vector.get(self.dense_vector_name)
+                if vector:
+                    node.embedding = vector
+            else:
+                logger.warning(f"Node {point_id} missing from the node store, skipped")
+                continue
+            nodes.append(node)
+            ids.append(point_id)
+            score = getattr(point, "score", None)
+            similarities.append(1.0 if score is None else score)
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        super().delete(ref_doc_id, **delete_kwargs)
+        self._node_store.delete_ref_docs([ref_doc_id])
+
+    async def adelete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        await super().adelete(ref_doc_id, **delete_kwargs)
+        self._node_store.delete_ref_docs([ref_doc_id])
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs: Any) -> None:
+        super().delete_nodes(node_ids, filters, **delete_kwargs)
+        if node_ids:
+            self._node_store.delete(node_ids)
+
+    async def adelete_nodes(self, node_ids=None, filters=None, **delete_kwargs: Any) -> None:
+        await super().adelete_nodes(node_ids, filters, **delete_kwargs)
+        if node_ids:
+            self._node_store.delete(node_ids)
+
+    def clear(self) -> None:
+        super().clear()
+        self._node_store.clear()
+
+    async def aclear(self) -> None:
+        await super().aclear()
+        self._node_store.clear()
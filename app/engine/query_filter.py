@@ -1,11 +1,51 @@
-from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters
+from typing import List, Optional
 
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+
+def generate_filters(
+    user_id: Optional[str] = None, doc_ids: Optional[List[str]] = None
+) -> MetadataFilters:
+    """
+    Génère les filtres de recherche : documents publics, plus les documents privés
+    de l'utilisateur. Avec `doc_ids`, la recherche est limitée à ces documents.
+
+    Les filtres sont appliqués par Qdrant sur les champs indexés `private`,
+    `user_id` et `doc_id` (voir `ensure_payload_indexes`).
+    """
+    # Les documents indexés sans le champ `private` sont considérés comme publics
+    public_filter = MetadataFilters(
+        filters=[
+            MetadataFilter(key="private", value="true", operator=FilterOperator.NE),
+            MetadataFilter(key="private", value=None, operator=FilterOperator.IS_EMPTY),
+        ],
+        condition=FilterCondition.OR,
+    )
+    if user_id:
+        own_private_filter = MetadataFilters(
+            filters=[
+                MetadataFilter(key="private", value="true"),
+                MetadataFilter(key="user_id", value=str(user_id)),
+            ],
+            condition=FilterCondition.AND,
+        )
+        visibility_filter = MetadataFilters(
+            filters=[public_filter, own_private_filter], condition=FilterCondition.OR
+        )
+    else:
+        visibility_filter = public_filter
 
-def generate_filters(doc_ids=None):
-    """Generate filters for the query engine."""
     if not doc_ids:
-        return None
-    
-    return {
-        "doc_id": {"$in": doc_ids}
-    }
+        return visibility_filter
+    return MetadataFilters(
+        filters=[
+            visibility_filter,
+            MetadataFilter(key="doc_id", value=list(doc_ids), operator=FilterOperator.IN),
+        ],
+        condition=FilterCondition.AND,
+    )
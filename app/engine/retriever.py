@@ -0,0 +1,106 @@
+import asyncio
+from typing import List, Optional
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.settings import Settings
+from llama_index.core.vector_stores.types import MetadataFilters, VectorStoreQuery
+
+from app.engine.numpy_vector_store import NumpyVectorStore
+
+
+class MergingRetriever(BaseRetriever):
+    """
+    Interroge plusieurs retrievers (collection partagée et collection du tenant)
+    et garde les `top_k` meilleurs noeuds, tous retrievers confondus.
+
+    Les scores sont comparables tant que les collections utilisent le même modèle
+    d'embedding et la même distance.
+    """
+
+    def __init__(
+        self,
+        retrievers: List[BaseRetriever],
+        top_k: int,
+        embed_model: Optional[BaseEmbedding] = None,
+        callback_manager: Optional[CallbackManager] = None,
+    ):
+        self._retrievers = retrievers
+        self._top_k = top_k
+        self._embed_model = embed_model or Settings.embed_model
+        super().__init__(callback_manager=callback_manager)
+
+    def _merge(self, results: List[List[NodeWithScore]]) -> List[NodeWithScore]:
+        nodes = [node for result in results for node in result]
+        nodes.sort(key=lambda n: n.score or 0.0, reverse=True)
+        return nodes[: self._top_k]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # La requête n'est vectorisée qu'une fois pour tous les retrievers
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return self._merge([r.retrieve(query_bundle) for r in self._retrievers])
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self._embed_model.aget_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        results = await asyncio.gather(
+            *[r.aretrieve(query_bundle) for r in self._retrievers]
+        )
+        return self._merge(list(results))
+
+
+class NumpyRetriever(BaseRetriever):
+    """
+    Recherche exacte directement dans un NumpyVectorStore, sans passer par un
+    VectorStoreIndex : le store (mis en cache par `get_vector_store`) garde l'index
+    chargé et les masques des filtres d'une requête à l'autre.
+    """
+
+    def __init__(
+        self,
+        vector_store: NumpyVectorStore,
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None,
+        embed_model: Optional[BaseEmbedding] = None,
+        callback_manager: Optional[CallbackManager] = None,
+    ):
+        self._vector_store = vector_store
+        self._similarity_top_k = similarity_top_k
+        self._filters = filters
+        self._embed_model = embed_model or Settings.embed_model
+        super().__init__(callback_manager=callback_manager or Settings.callback_manager)
+
+    def _search(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        result = self._vector_store.query(
+            VectorStoreQuery(
+                query_embedding=query_bundle.embedding,
+                similarity_top_k=self._similarity_top_k,
+                filters=self._filters,
+            )
+        )
+        return [
+            NodeWithScore(node=node, score=score)
+            for node, score in zip(result.nodes, result.similarities)
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return self._search(query_bundle)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self._embed_model.aget_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        # Recherche en mémoire, sans I/O : pas de thread nécessaire
+        return self._search(query_bundle)
@@ -0,0 +1,76 @@
+import functools
+from typing import Any, Callable, List, Optional, Sequence
+
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+from llama_index.core.settings import Settings
+
+# Clés de métadonnées écrites à l'ingestion (exclues du texte envoyé au LLM et à l'embedding)
+TOKEN_COUNT_KEY = "token_count"
+TOKENIZER_KEY = "token_count_tokenizer"
+
+
+def get_tokenizer_name(tokenizer: Optional[Callable] = None) -> str:
+    """
+    Nom du tokenizer, pour ne réutiliser que les comptes calculés avec le même tokenizer
+    """
+    tokenizer = tokenizer or Settings.tokenizer
+    func = tokenizer.func if isinstance(tokenizer, functools.partial) else tokenizer
+    # Encodage tiktoken (ex. cl100k_base) ou tokenizer Hugging Face
+    owner = getattr(func, "__self__", None)
+    name = getattr(owner, "name", None) or getattr(owner, "name_or_path", None)
+    return str(name or getattr(func, "__qualname__", type(func).__name__))
+
+
+class TokenCountExtractor(TransformComponent):
+    """
+    Enregistre dans les métadonnées de chaque chunk son nombre de tokens
+    (contenu tel qu'envoyé au LLM, métadonnées comprises).
+    """
+
+    def __call__(self, nodes: Sequence[BaseNode], **kwargs: Any) -> Sequence[BaseNode]:
+        tokenizer = Settings.tokenizer
+        tokenizer_name = get_tokenizer_name(tokenizer)
+        for node in nodes:
+            for key in (TOKEN_COUNT_KEY, TOKENIZER_KEY):
+                if key not in node.excluded_llm_metadata_keys:
+                    node.excluded_llm_metadata_keys.append(key)
+                if key not in node.excluded_embed_metadata_keys:
+                    node.excluded_embed_metadata_keys.append(key)
+            node.metadata[TOKEN_COUNT_KEY] = len(
+                tokenizer(node.get_content(metadata_mode=MetadataMode.LLM))
+            )
+            node.metadata[TOKENIZER_KEY] = tokenizer_name
+        return nodes
+
+
+def get_node_token_count(node: BaseNode, tokenizer: Optional[Callable] = None) -> int:
+    """
+    Nombre de tokens d'un chunk : celui calculé à l'ingestion s'il correspond au tokenizer
+    courant, sinon le chunk est tokenisé.
+    """
+    tokenizer = tokenizer or Settings.tokenizer
+    count = node.metadata.get(TOKEN_COUNT_KEY)
+    if count is not None and node.metadata.get(TOKENIZER_KEY) == get_tokenizer_name(tokenizer):
+        return int(count)
+    return len(tokenizer(node.get_content(metadata_mode=MetadataMode.LLM)))
+
+
+@functools.lru_cache(maxsize=4096)
+def _count_tokens(tokenizer: Callable, text: str) -> int:
+    return len(tokenizer(text))
+
+
+class CachedTokenMemoryBuffer(ChatMemoryBuffer):
+    """
+    Mémoire de chat qui compte les tokens message par message, avec un cache :
+    l'historique n'est pas re-tokenisé à chaque tour de la conversation.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedTokenMemoryBuffer"
+
+    def _token_count_for_messages(self, messages: List[ChatMessage]) -> int:
+        return sum(_count_tokens(self.tokenizer_fn, str(m.content)) for m in messages)
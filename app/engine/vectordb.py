@@ -1,17 +1,62 @@
+import asyncio
 import os
+import re
+import threading
+from functools import lru_cache
+from cachetools import LRUCache, TTLCache
 from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models as rest
 from llama_index.core import Document
-from typing import List, Dict, Any
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from typing import List, Dict, Any, Optional
 import logging
 
+from app.engine.numpy_vector_store import NumpyVectorStore
+from app.engine.qdrant_store import ExternalTextQdrantVectorStore
+
 logger = logging.getLogger(__name__)
 
-def get_collection_stats(vector_store: QdrantVectorStore) -> Dict[str, Any]:
+# Champs utilisés par les filtres de recherche (voir app.engine.query_filter)
+FILTER_PAYLOAD_FIELDS = ("private", "doc_id", "user_id")
+
+# Collections dont les index de payload ont déjà été vérifiés par ce process
+_indexed_collections: set = set()
+
+# Collections dont le schéma a déjà été vérifié par ce process
+_checked_collections: set = set()
+
+# Collections dont l'existence a été vérifiée (une collection existante le reste)
+_existing_collections: set = set()
+
+# Collections absentes (tenants sans upload), revérifiées après QDRANT_MISSING_COLLECTION_TTL secondes
+_missing_collections: TTLCache = TTLCache(
+    maxsize=int(os.getenv("QDRANT_TENANT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("QDRANT_MISSING_COLLECTION_TTL", "10")),
+)
+
+# Vector stores des collections par tenant, réutilisés d'une requête à l'autre
+_tenant_stores: LRUCache = LRUCache(maxsize=int(os.getenv("QDRANT_TENANT_CACHE_SIZE", "256")))
+_tenant_stores_lock = threading.Lock()
+
+def get_collection_stats(vector_store: BasePydanticVectorStore) -> Dict[str, Any]:
     """
     Récupère les statistiques essentielles de la collection Qdrant.
     """
     try:
-        collection_name = os.getenv("QDRANT_COLLECTION")
+        collection_name = vector_store.collection_name
+        if isinstance(vector_store, NumpyVectorStore):
+            return {
+                "collection_name": collection_name,
+                "points_count": vector_store.count(),
+                "segments_count": vector_store.segments_count(),
+            }
         client = vector_store.client
         
         # Récupérer les infos de la collection
@@ -26,33 +71,481 @@ def get_collection_stats(vector_store: QdrantVectorStore) -> Dict[str, Any]:
         logger.error(f"Erreur lors de la récupération des stats: {str(e)}")
         return {"error": str(e)}
 
-def get_vector_store(force_recreate: bool = False) -> QdrantVectorStore:
+class _AsyncClientAdapter:
+    """
+    Expose les méthodes d'un client Qdrant synchrone sous forme de coroutines.
+    Qdrant embarqué ne peut pas être ouvert par un second client : les appels
+    asynchrones du vector store sont exécutés sur le client synchrone dans un thread.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        return method
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def build_dense_config(
+    dim: int,
+    on_disk: bool = False,
+    hnsw_m: Optional[int] = None,
+    hnsw_ef_construct: Optional[int] = None,
+    hnsw_on_disk: Optional[bool] = None,
+) -> rest.VectorParams:
+    hnsw_config = None
+    if hnsw_m is not None or hnsw_ef_construct is not None or hnsw_on_disk is not None:
+        hnsw_config = rest.HnswConfigDiff(
+            m=hnsw_m, ef_construct=hnsw_ef_construct, on_disk=hnsw_on_disk
+        )
+    return rest.VectorParams(
+        size=dim,
+        distance=rest.Distance.COSINE,
+        on_disk=on_disk,
+        hnsw_config=hnsw_config,
+    )
+
+
+def build_quantization_config(kind: str, always_ram: bool = True):
+    """
+    `scalar` : int8, 4x moins de mémoire ; `binary` : 1 bit par dimension, 32x moins,
+    adapté aux embeddings de grande dimension (OpenAI text-embedding-3-*).
+    """
+    match kind:
+        case "none" | "":
+            return None
+        case "scalar":
+            return rest.ScalarQuantization(
+                scalar=rest.ScalarQuantizationConfig(
+                    type=rest.ScalarType.INT8, quantile=0.99, always_ram=always_ram
+                )
+            )
+        case "binary":
+            return rest.BinaryQuantization(
+                binary=rest.BinaryQuantizationConfig(always_ram=always_ram)
+            )
+        case _:
+            raise ValueError(f"Invalid QDRANT_QUANTIZATION: {kind}")
+
+
+def build_search_params(
+    quantized: bool,
+    rescore: bool = True,
+    oversampling: Optional[float] = None,
+    hnsw_ef: Optional[int] = None,
+) -> Optional[rest.SearchParams]:
+    quantization = None
+    if quantized:
+        # Les candidats trouvés avec les vecteurs quantifiés sont re-scorés avec les vecteurs originaux
+        quantization = rest.QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    if quantization is None and hnsw_ef is None:
+        return None
+    return rest.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+
+def get_collection_config() -> Dict[str, Any]:
+    """
+    Paramètres de création de la collection, lus dans l'environnement :
+
+    - EMBEDDING_DIM : dimension des embeddings (nécessaire pour les options des vecteurs)
+    - QDRANT_ON_DISK_VECTORS : vecteurs originaux sur disque (mmap) plutôt qu'en RAM
+    - QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT, QDRANT_HNSW_ON_DISK : paramètres du graphe HNSW
+    - QDRANT_QUANTIZATION : none (défaut), scalar ou binary ;
+      QDRANT_QUANTIZATION_ALWAYS_RAM : vecteurs quantifiés gardés en RAM (défaut true)
+
+    Ces paramètres ne s'appliquent qu'à la création de la collection.
+    """
+    dim = _env_int("EMBEDDING_DIM")
+    on_disk = _env_flag("QDRANT_ON_DISK_VECTORS")
+    hnsw_m = _env_int("QDRANT_HNSW_M")
+    hnsw_ef_construct = _env_int("QDRANT_HNSW_EF_CONSTRUCT")
+    hnsw_on_disk = _env_flag("QDRANT_HNSW_ON_DISK") if os.getenv("QDRANT_HNSW_ON_DISK") else None
+
+    dense_config = None
+    if dim is not None:
+        dense_config = build_dense_config(dim, on_disk, hnsw_m, hnsw_ef_construct, hnsw_on_disk)
+    elif on_disk or hnsw_m or hnsw_ef_construct or hnsw_on_disk is not None:
+        logger.warning(
+            "EMBEDDING_DIM n'est pas défini : les options des vecteurs et de HNSW sont ignorées"
+        )
+    return {
+        "dense_config": dense_config,
+        "quantization_config": build_quantization_config(
+            os.getenv("QDRANT_QUANTIZATION", "none"),
+            _env_flag("QDRANT_QUANTIZATION_ALWAYS_RAM", "true"),
+        ),
+    }
+
+
+def get_search_params() -> Optional[rest.SearchParams]:
+    """
+    Paramètres de recherche : QDRANT_RESCORE (défaut true), QDRANT_OVERSAMPLING
+    (candidats supplémentaires avant re-scoring, ex. 2.0) et QDRANT_HNSW_EF.
+    """
+    oversampling = os.getenv("QDRANT_OVERSAMPLING")
+    return build_search_params(
+        quantized=os.getenv("QDRANT_QUANTIZATION", "none") not in ("none", ""),
+        rescore=_env_flag("QDRANT_RESCORE", "true"),
+        oversampling=float(oversampling) if oversampling else None,
+        hnsw_ef=_env_int("QDRANT_HNSW_EF"),
+    )
+
+
+class _SearchParamsClient:
+    """
+    Ajoute les paramètres de recherche (re-scoring, oversampling, hnsw_ef) aux recherches
+    du vector store, qui ne permet pas de les passer. Fonctionne pour les clients
+    synchrone et asynchrone.
+    """
+
+    def __init__(self, client, search_params: rest.SearchParams):
+        self._client = client
+        self._search_params = search_params
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+    def search(self, *args, **kwargs):
+        kwargs.setdefault("search_params", self._search_params)
+        return self._client.search(*args, **kwargs)
+
+
+def is_tenant_routing_enabled() -> bool:
     """
-    Récupère ou crée un vector store Qdrant.
+    QDRANT_TENANCY=collection : les documents privés de chaque utilisateur sont stockés
+    dans sa propre collection ; la collection QDRANT_COLLECTION ne contient que les
+    documents partagés. Par défaut (`shared`), tout est dans QDRANT_COLLECTION.
     """
+    return os.getenv("QDRANT_TENANCY", "shared") == "collection"
+
+
+def get_vector_store_backend() -> str:
+    """
+    VECTOR_STORE_BACKEND :
+    - `qdrant` : serveur Qdrant (QDRANT_URL), par défaut
+    - `qdrant_local` : Qdrant embarqué, dans QDRANT_PATH (défaut : STORAGE_DIR/qdrant)
+    - `numpy` : index exact en mémoire mappée, dans STORAGE_DIR/vectors (voir NumpyVectorStore)
+
+    Les backends locaux conviennent aux petits déploiements et au développement :
+    pas de service à faire tourner, pas d'aller-retour réseau.
+    """
+    backend = os.getenv("VECTOR_STORE_BACKEND")
+    if backend:
+        return backend
+    # Compatibilité : QDRANT_PATH seul active Qdrant embarqué
+    return "qdrant_local" if os.getenv("QDRANT_PATH") else "qdrant"
+
+
+def _get_collection_name() -> str:
     collection_name = os.getenv("QDRANT_COLLECTION")
+    if not collection_name and get_vector_store_backend() != "qdrant":
+        return "default"
+    return collection_name
+
+
+def get_tenant_collection_name(tenant_id: str) -> str:
+    base = _get_collection_name()
+    # Noms de collection Qdrant : lettres, chiffres, '-' et '_'
+    return f"{base}_tenant_{re.sub(r'[^A-Za-z0-9_-]', '_', str(tenant_id))}"
+
+
+def _build_store(collection_name: str) -> BasePydanticVectorStore:
+    backend = get_vector_store_backend()
+    storage_dir = os.getenv("STORAGE_DIR", "storage")
     url = os.getenv("QDRANT_URL")
-    api_key = os.getenv("QDRANT_API_KEY")
-    
-    if not collection_name or not url:
+
+    if backend == "numpy":
+        return _get_numpy_store(
+            os.path.join(storage_dir, "vectors", collection_name),
+            os.getenv("NUMPY_VECTOR_DTYPE", "float32"),
+        )
+    if backend not in ("qdrant", "qdrant_local"):
+        raise ValueError(f"Invalid VECTOR_STORE_BACKEND: {backend}")
+    if not collection_name or (backend == "qdrant" and not url):
         raise ValueError(
-            "Please set QDRANT_COLLECTION, QDRANT_URL"
-            " to your environment variables or config them in the .env file"
+            "Please set QDRANT_COLLECTION and QDRANT_URL (or VECTOR_STORE_BACKEND=qdrant_local"
+            " or numpy) to your environment variables or config them in the .env file"
         )
 
-    store = QdrantVectorStore(
+    if backend == "qdrant_local":
+        client = _get_local_client(os.getenv("QDRANT_PATH") or os.path.join(storage_dir, "qdrant"))
+        aclient = _AsyncClientAdapter(client)
+    else:
+        client, aclient = _get_remote_clients(url, os.getenv("QDRANT_API_KEY"))
+        search_params = get_search_params()
+        if search_params is not None:
+            client = _SearchParamsClient(client, search_params)
+            aclient = _SearchParamsClient(aclient, search_params)
+
+    kwargs = dict(
         collection_name=collection_name,
-        url=url,
-        api_key=api_key,
+        client=client,
+        aclient=aclient,
+        # Utilisés par QdrantVectorStore à la création de la collection (première écriture)
+        **get_collection_config(),
     )
+    # QDRANT_EXTERNAL_TEXT : payload réduit aux champs filtrés, texte des noeuds en local
+    if _env_flag("QDRANT_EXTERNAL_TEXT"):
+        return ExternalTextQdrantVectorStore(
+            node_store_path=os.path.join(storage_dir, "nodes", f"{collection_name}.sqlite3"),
+            payload_fields=FILTER_PAYLOAD_FIELDS,
+            **kwargs,
+        )
+    return QdrantVectorStore(**kwargs)
+
+
+def get_vector_store(
+    force_recreate: bool = False, tenant_id: Optional[str] = None
+) -> BasePydanticVectorStore:
+    """
+    Récupère ou crée le vector store du backend configuré (voir `get_vector_store_backend`).
+
+    Avec `tenant_id` et QDRANT_TENANCY=collection, retourne le vector store de la
+    collection du tenant (voir `get_tenant_vector_store`).
+    """
+    if tenant_id is not None and is_tenant_routing_enabled():
+        return get_tenant_vector_store(tenant_id)
+
+    store = _build_store(_get_collection_name())
 
     # Log des stats avant création/modification
     logger.info("Stats de la collection avant modification:")
     logger.info(get_collection_stats(store))
 
+    check_collection_schema(store)
+    ensure_payload_indexes(store)
+
     return store
 
-def add_documents_to_vectorstore(documents: List[Document], vector_store: QdrantVectorStore) -> bool:
+def check_collection_schema(vector_store: BasePydanticVectorStore) -> None:
+    """
+    Vérifie qu'une collection existante correspond à EMBEDDING_DIM, et signale les
+    paramètres de vecteurs (quantification, stockage sur disque) qui diffèrent de la
+    configuration : ils ne s'appliquent qu'à la création de la collection.
+    """
+    dim = _env_int("EMBEDDING_DIM")
+    collection_name = vector_store.collection_name
+    # NumpyVectorStore vérifie la dimension à chaque ajout
+    if collection_name in _checked_collections or not isinstance(vector_store, QdrantVectorStore):
+        return
+    try:
+        if not collection_exists(vector_store):
+            return
+        info = vector_store.client.get_collection(collection_name)
+    except Exception as e:
+        logger.error(f"Erreur lors de la vérification de la collection: {str(e)}")
+        return
+
+    vectors = info.config.params.vectors
+    if isinstance(vectors, dict):
+        # Vecteurs nommés (recherche hybride) : seul le vecteur dense est vérifié
+        vectors = next(iter(vectors.values()), None)
+    if vectors is None:
+        return
+    _checked_collections.add(collection_name)
+    if dim is not None and vectors.size != dim:
+        raise ValueError(
+            f"The collection '{collection_name}' stores vectors of dimension {vectors.size}"
+            f" but EMBEDDING_DIM is {dim}. Recreate the collection or fix EMBEDDING_DIM."
+        )
+    quantization = os.getenv("QDRANT_QUANTIZATION", "none")
+    current = info.config.quantization_config
+    current_kind = (
+        "scalar" if isinstance(current, rest.ScalarQuantization)
+        else "binary" if isinstance(current, rest.BinaryQuantization)
+        else "none"
+    )
+    if current_kind != (quantization or "none"):
+        logger.warning(
+            f"Collection '{collection_name}': quantification '{current_kind}' alors que"
+            f" QDRANT_QUANTIZATION={quantization} (appliqué seulement à la création)"
+        )
+    if bool(vectors.on_disk) != _env_flag("QDRANT_ON_DISK_VECTORS") and dim is not None:
+        logger.warning(
+            f"Collection '{collection_name}': on_disk={bool(vectors.on_disk)} alors que"
+            f" QDRANT_ON_DISK_VECTORS={os.getenv('QDRANT_ON_DISK_VECTORS', 'false')}"
+        )
+
+def ensure_payload_indexes(vector_store: BasePydanticVectorStore) -> None:
+    """
+    Crée les index de payload des champs filtrés s'ils n'existent pas.
+
+    Sans index, Qdrant doit lire le payload de chaque point candidat pour appliquer
+    les filtres ; avec un index, le filtre est résolu avant/pendant la recherche HNSW.
+    La collection n'existe qu'après la première ingestion : la fonction est aussi
+    appelée à la fin des pipelines d'ingestion.
+    """
+    collection_name = vector_store.collection_name
+    # Qdrant embarqué et NumpyVectorStore n'utilisent pas les index de payload
+    if collection_name in _indexed_collections or get_vector_store_backend() != "qdrant":
+        return
+    client = vector_store.client
+    try:
+        if not client.collection_exists(collection_name):
+            return
+        existing = client.get_collection(collection_name).payload_schema or {}
+        for field in FILTER_PAYLOAD_FIELDS:
+            if field not in existing:
+                logger.info(f"Création de l'index de payload '{field}' sur '{collection_name}'")
+                client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field,
+                    field_schema=rest.PayloadSchemaType.KEYWORD,
+                )
+        _indexed_collections.add(collection_name)
+    except Exception as e:
+        logger.error(f"Erreur lors de la création des index de payload: {str(e)}")
+
+def get_tenant_vector_store(tenant_id: str) -> BasePydanticVectorStore:
+    """
+    Vector store de la collection d'un tenant, mis en cache.
+
+    La collection est créée à la première écriture (par QdrantVectorStore) ;
+    utiliser `collection_exists` avant de la lire.
+    """
+    collection_name = get_tenant_collection_name(tenant_id)
+    with _tenant_stores_lock:
+        store = _tenant_stores.get(collection_name)
+        if store is None:
+            store = _build_store(collection_name)
+            _tenant_stores[collection_name] = store
+    return store
+
+
+def collection_exists(vector_store: BasePydanticVectorStore) -> bool:
+    # Une collection existante le reste ; une collection absente peut être créée entre-temps
+    # (par un upload, éventuellement dans un autre worker) : réponse négative mise en cache
+    # pour une courte durée seulement
+    collection_name = vector_store.collection_name
+    if collection_name in _existing_collections:
+        return True
+    if collection_name in _missing_collections:
+        return False
+    if isinstance(vector_store, NumpyVectorStore):
+        exists = vector_store.exists()
+    else:
+        exists = vector_store.client.collection_exists(collection_name)
+    if exists:
+        _existing_collections.add(collection_name)
+        return True
+    _missing_collections[collection_name] = True
+    return False
+
+
+def on_collection_written(vector_store: BasePydanticVectorStore) -> None:
+    """
+    À appeler après une écriture hors des pipelines d'ingestion (upload d'un fichier) :
+    la collection existe désormais pour ce process, et ses champs filtrés sont indexés.
+    """
+    _missing_collections.pop(vector_store.collection_name, None)
+    ensure_payload_indexes(vector_store)
+
+
+@lru_cache(maxsize=None)
+def _get_numpy_store(persist_dir: str, dtype: str) -> NumpyVectorStore:
+    # Une instance par dossier : l'index chargé et les masques des filtres sont réutilisés
+    # d'une requête à l'autre. NUMPY_VECTOR_DTYPE=float16 divise la mémoire par deux.
+    return NumpyVectorStore(persist_dir=persist_dir, dtype=dtype)
+
+@lru_cache(maxsize=None)
+def _get_remote_clients(url: str, api_key: Optional[str]):
+    # Clients partagés : leur pool de connexions HTTP est réutilisé d'une requête à l'autre
+    return QdrantClient(url=url, api_key=api_key), AsyncQdrantClient(url=url, api_key=api_key)
+
+@lru_cache(maxsize=None)
+def _get_local_client(path: str) -> QdrantClient:
+    # Un seul client par dossier : Qdrant embarqué verrouille son dossier de stockage
+    return QdrantClient(path=path)
+
+def scroll_documents(vector_store: BasePydanticVectorStore, limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    Payloads (métadonnées et contenu) des premiers noeuds du vector store
+    """
+    if isinstance(vector_store, NumpyVectorStore):
+        return [
+            node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+            for node in vector_store.get_nodes(limit=limit)
+        ]
+    points, _ = vector_store.client.scroll(
+        collection_name=vector_store.collection_name, limit=limit
+    )
+    return [point.payload for point in points]
+
+def _get_async_client():
+    # Mêmes clients (mis en cache) que ceux passés au vector store par `_build_store`
+    if get_vector_store_backend() == "qdrant_local":
+        storage_dir = os.getenv("STORAGE_DIR", "storage")
+        return _AsyncClientAdapter(
+            _get_local_client(os.getenv("QDRANT_PATH") or os.path.join(storage_dir, "qdrant"))
+        )
+    return _get_remote_clients(os.getenv("QDRANT_URL"), os.getenv("QDRANT_API_KEY"))[1]
+
+async def abatch_query(
+    vector_store: BasePydanticVectorStore,
+    query_embeddings: List[List[float]],
+    similarity_top_k: int,
+    filters: Optional[MetadataFilters] = None,
+) -> List[VectorStoreQueryResult]:
+    """
+    Recherche de plusieurs requêtes déjà vectorisées, en un seul appel au vector store :
+    `search_batch` de Qdrant, ou un seul produit matriciel pour NumpyVectorStore.
+    """
+    if isinstance(vector_store, NumpyVectorStore):
+        return vector_store.query_batch(query_embeddings, similarity_top_k, filters)
+    if not isinstance(vector_store, QdrantVectorStore):
+        return list(
+            await asyncio.gather(
+                *[
+                    vector_store.aquery(
+                        VectorStoreQuery(
+                            query_embedding=embedding,
+                            similarity_top_k=similarity_top_k,
+                            filters=filters,
+                        )
+                    )
+                    for embedding in query_embeddings
+                ]
+            )
+        )
+    if not collection_exists(vector_store):
+        return [VectorStoreQueryResult(nodes=[], similarities=[], ids=[]) for _ in query_embeddings]
+
+    # Conversion des MetadataFilters en filtre Qdrant, comme pour `query`
+    query_filter = vector_store._build_query_filter(
+        VectorStoreQuery(similarity_top_k=similarity_top_k, filters=filters)
+    )
+    search_params = get_search_params()
+    requests = [
+        rest.SearchRequest(
+            vector=rest.NamedVector(name=vector_store.dense_vector_name, vector=embedding),
+            limit=similarity_top_k,
+            filter=query_filter,
+            params=search_params,
+            with_payload=True,
+        )
+        for embedding in query_embeddings
+    ]
+    responses = await _get_async_client().search_batch(
+        collection_name=vector_store.collection_name, requests=requests
+    )
+    return [vector_store.parse_to_query_result(response) for response in responses]
+
+def add_documents_to_vectorstore(documents: List[Document], vector_store: BasePydanticVectorStore) -> bool:
     """
     Ajoute de nouveaux documents au vector store existant sans réinitialiser la collection.
     """
@@ -0,0 +1,273 @@
+"""
+Métriques Prometheus de l'application (latence HTTP, chat, LLM, embeddings, recherche, ingestion, caches).
+
+Avec plusieurs workers (`run.prod`), définir PROMETHEUS_MULTIPROC_DIR : chaque process
+écrit ses métriques dans ce dossier et `/metrics` agrège celles de tous les workers.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from cachetools import TTLCache
+from llama_index.core import Settings
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.callbacks.token_counting import TokenCounter, get_llm_token_counts
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+# Secondes, des appels rapides (embedding, recherche) aux générations longues
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500)
+RESULT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Durée des requêtes HTTP, réponse en streaming comprise",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+CHAT_TIME_TO_FIRST_TOKEN = Histogram(
+    "chat_time_to_first_token_seconds",
+    "Temps entre le début de la requête de chat et le premier token envoyé",
+    buckets=LATENCY_BUCKETS,
+)
+CHAT_STREAM_DURATION = Histogram(
+    "chat_stream_duration_seconds",
+    "Durée du streaming de la réponse, du premier au dernier token",
+    buckets=LATENCY_BUCKETS,
+)
+LLM_REQUESTS = Counter(
+    "llm_requests_total", "Appels au LLM", ["provider", "model", "status"]
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds",
+    "Durée des appels au LLM (jusqu'au dernier token en streaming)",
+    ["provider", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens consommés par le LLM", ["provider", "model", "type"]
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_completion_tokens_per_second",
+    "Débit de génération du LLM",
+    ["provider", "model"],
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+EMBEDDING_REQUESTS = Counter(
+    "embedding_requests_total", "Appels au modèle d'embedding", ["provider", "model", "status"]
+)
+EMBEDDING_REQUEST_DURATION = Histogram(
+    "embedding_request_duration_seconds",
+    "Durée des appels au modèle d'embedding",
+    ["provider", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+EMBEDDING_TEXTS = Counter(
+    "embedding_texts_total", "Textes envoyés au modèle d'embedding", ["provider", "model"]
+)
+VECTOR_SEARCH_DURATION = Histogram(
+    "vector_search_duration_seconds",
+    "Durée de la recherche dans le vector store (embedding de la requête exclu)",
+    buckets=LATENCY_BUCKETS,
+)
+VECTOR_SEARCH_RESULTS = Histogram(
+    "vector_search_results",
+    "Nombre de noeuds retournés par la recherche",
+    buckets=RESULT_COUNT_BUCKETS,
+)
+INGESTION_CHUNKS = Counter("ingestion_chunks_total", "Chunks indexés", ["source"])
+INGESTION_DURATION = Histogram(
+    "ingestion_duration_seconds",
+    "Durée d'une exécution du pipeline d'ingestion",
+    ["source"],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_QUEUE_DEPTH = Gauge(
+    "upload_indexing_queue_depth",
+    "Fichiers uploadés en attente ou en cours d'indexation",
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Accès aux caches applicatifs", ["cache", "result"]
+)
+ADMISSION_ACTIVE = Gauge(
+    "admission_active_requests",
+    "Requêtes admises en cours de traitement (LLM)",
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requêtes en attente d'un slot du contrôle d'admission",
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds",
+    "Attente avant l'admission d'une requête (0 si admise immédiatement)",
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requêtes rejetées par le contrôle d'admission (429)"
+)
+
+
+def observe_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def observe_ingestion(source: str, chunks: int, duration: float) -> None:
+    INGESTION_CHUNKS.labels(source=source).inc(chunks)
+    INGESTION_DURATION.labels(source=source).observe(duration)
+
+
+def get_provider() -> str:
+    return os.getenv("MODEL_PROVIDER", "unknown")
+
+
+def _model_name(component: Any) -> str:
+    return str(
+        getattr(component, "model", None)
+        or getattr(component, "model_name", None)
+        or type(component).__name__
+    )
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Mesure les appels au LLM, au modèle d'embedding et au vector store à partir des événements LlamaIndex.
+    """
+
+    def __init__(self):
+        super().__init__(
+            event_starts_to_ignore=[],
+            event_ends_to_ignore=[],
+        )
+        self._token_counter = TokenCounter()
+        # event_id -> [début, parent_id, durée des embeddings enfants]
+        self._events: TTLCache = TTLCache(maxsize=10000, ttl=600)
+        self._lock = threading.Lock()
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        if event_type in (CBEventType.LLM, CBEventType.EMBEDDING, CBEventType.RETRIEVE):
+            with self._lock:
+                self._events[event_id] = [time.perf_counter(), parent_id, 0.0]
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            event = self._events.pop(event_id, None)
+        if event is None:
+            return
+        start, parent_id, child_duration = event
+        duration = time.perf_counter() - start
+        payload = payload or {}
+        status = "error" if EventPayload.EXCEPTION in payload else "ok"
+        try:
+            if event_type == CBEventType.LLM:
+                self._observe_llm(payload, duration, status)
+            elif event_type == CBEventType.EMBEDDING:
+                self._observe_embedding(payload, duration, status)
+                # La durée de l'embedding de la requête est retirée de celle de la recherche
+                with self._lock:
+                    parent = self._events.get(parent_id)
+                    if parent is not None:
+                        parent[2] += duration
+            elif event_type == CBEventType.RETRIEVE and status == "ok":
+                VECTOR_SEARCH_DURATION.observe(max(duration - child_duration, 0.0))
+                VECTOR_SEARCH_RESULTS.observe(len(payload.get(EventPayload.NODES) or []))
+        except Exception as e:
+            logger.debug(f"Failed to record metrics for {event_type}: {e}")
+
+    def _observe_llm(self, payload: Dict[str, Any], duration: float, status: str) -> None:
+        provider, model = get_provider(), _model_name(Settings.llm)
+        LLM_REQUESTS.labels(provider=provider, model=model, status=status).inc()
+        if status != "ok":
+            return
+        LLM_REQUEST_DURATION.labels(provider=provider, model=model).observe(duration)
+        counts = get_llm_token_counts(self._token_counter, payload)
+        LLM_TOKENS.labels(provider=provider, model=model, type="prompt").inc(
+            counts.prompt_token_count
+        )
+        LLM_TOKENS.labels(provider=provider, model=model, type="completion").inc(
+            counts.completion_token_count
+        )
+        if duration > 0 and counts.completion_token_count:
+            LLM_TOKENS_PER_SECOND.labels(provider=provider, model=model).observe(
+                counts.completion_token_count / duration
+            )
+
+    def _observe_embedding(self, payload: Dict[str, Any], duration: float, status: str) -> None:
+        provider, model = get_provider(), _model_name(Settings.embed_model)
+        EMBEDDING_REQUESTS.labels(provider=provider, model=model, status=status).inc()
+        if status != "ok":
+            return
+        EMBEDDING_REQUEST_DURATION.labels(provider=provider, model=model).observe(duration)
+        EMBEDDING_TEXTS.labels(provider=provider, model=model).inc(
+            len(payload.get(EventPayload.CHUNKS) or [])
+        )
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        pass
+
+
+_initialized = False
+
+
+def init_metrics() -> None:
+    global _initialized
+    if _initialized:
+        return
+    _initialized = True
+    Settings.callback_manager.add_handler(MetricsCallbackHandler())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Métriques au format texte Prometheus, agrégées sur tous les workers en mode multi-process
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """
+    À appeler à l'arrêt d'un worker, pour retirer ses jauges des agrégats
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
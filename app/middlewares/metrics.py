@@ -0,0 +1,58 @@
+import time
+
+from app.metrics import HTTP_REQUEST_DURATION
+
+
+class MetricsMiddleware:
+    """
+    Mesure la durée des requêtes HTTP par route (modèle de chemin, pas le chemin brut).
+
+    Middleware ASGI pur : la durée inclut l'envoi complet des réponses en streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.labels(
+                method=scope.get("method", ""),
+                route=_route_template(scope),
+                status=str(status_code),
+            ).observe(time.perf_counter() - start)
+
+
+def _route_template(scope) -> str:
+    """
+    Modèle de chemin de la route appelée (par ex. /api/folder/view/{filename}),
+    pour ne pas créer une série par valeur de paramètre
+    """
+    # Route renseignée par FastAPI après le routage
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    # Selon la version de FastAPI, le chemin de la route n'inclut pas le préfixe du routeur
+    try:
+        rendered = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope.get("path", "")
+    if path.endswith(rendered):
+        return path[: len(path) - len(rendered)] + template
+    return template
@@ -0,0 +1,40 @@
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+tracer = trace.get_tracer(__name__)
+
+
+class TracingMiddleware:
+    """
+    Ouvre une span serveur par requête HTTP, parente des spans de l'application
+    (authentification, chat, pipeline RAG).
+
+    Middleware ASGI pur : contrairement à BaseHTTPMiddleware, la span reste ouverte
+    jusqu'à la fin des réponses en streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "")
+        path = scope.get("path", "")
+        with tracer.start_as_current_span(
+            f"{method} {path}", kind=SpanKind.SERVER
+        ) as span:
+            span.set_attribute("http.method", method)
+            span.set_attribute("http.target", path)
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    span.set_attribute("http.status_code", status_code)
+                    if status_code >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -1,6 +1,17 @@
 import llama_index.core
 import os
+import random
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from cachetools import TTLCache
+from llama_index.core import Settings
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.callbacks.token_counting import TokenCounter, get_llm_token_counts
+from opentelemetry import context as otel_context
 from opentelemetry import trace
+from opentelemetry.sdk.trace import SpanProcessor
 from opentelemetry.trace import Status, StatusCode
 import logging
 from dotenv import load_dotenv
@@ -8,48 +19,304 @@ from dotenv import load_dotenv
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Collecteur OTLP local par défaut (Phoenix, OpenTelemetry Collector, Jaeger...)
+DEFAULT_OTLP_ENDPOINT = "http://127.0.0.1:6006/v1/traces"
+LLAMATRACE_ENDPOINT = "https://llamatrace.com/v1/traces"
+
+# Type de span OpenInference, pour l'affichage dans Phoenix
+_SPAN_KINDS = {
+    CBEventType.LLM: "LLM",
+    CBEventType.EMBEDDING: "EMBEDDING",
+    CBEventType.RETRIEVE: "RETRIEVER",
+    CBEventType.RERANKING: "RERANKER",
+}
+
+_tracer_provider = None
+
+
+def _capture_content() -> bool:
+    """Joindre (ou non) le texte des messages aux spans, TRACE_CAPTURE_CONTENT=false pour ne garder que leur taille"""
+    return os.getenv("TRACE_CAPTURE_CONTENT", "true").lower() == "true"
+
+
+def _max_attribute_length() -> int:
+    return int(os.getenv("OTEL_SPAN_ATTRIBUTE_VALUE_LENGTH_LIMIT", "1024"))
+
+
+def _truncate(value: str) -> str:
+    # Tronqué ici plutôt que par le SDK, qui journalise chaque troncature
+    limit = _max_attribute_length()
+    return value if len(value) <= limit else value[:limit]
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Garde les spans d'une trace en mémoire jusqu'à la fin de sa span racine locale,
+    puis ne transmet la trace à l'export que si elle est lente ou en erreur
+    (plus une fraction `keep_rate` des autres traces).
+
+    La mémoire est bornée : au-delà de `max_traces` traces en cours, les plus anciennes sont abandonnées.
+    """
+
+    def __init__(
+        self,
+        delegate,
+        slow_threshold_ms: float,
+        keep_rate: float = 0.0,
+        max_traces: int = 2048,
+        max_spans_per_trace: int = 512,
+    ):
+        self._delegate = delegate
+        self._slow_threshold_ns = slow_threshold_ms * 1e6
+        self._keep_rate = keep_rate
+        self._max_traces = max_traces
+        self._max_spans_per_trace = max_spans_per_trace
+        self._traces: "OrderedDict[int, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None) -> None:
+        self._delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span) -> None:
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            if spans is None:
+                spans = self._traces[trace_id] = []
+                while len(self._traces) > self._max_traces:
+                    self._traces.popitem(last=False)
+            if len(spans) < self._max_spans_per_trace:
+                spans.append(span)
+            if not is_local_root:
+                return
+            spans = self._traces.pop(trace_id, [])
+
+        if self._should_keep(span, spans):
+            for finished in spans:
+                self._delegate.on_end(finished)
+
+    def _should_keep(self, root, spans) -> bool:
+        if root.end_time - root.start_time >= self._slow_threshold_ns:
+            return True
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            return True
+        return random.random() < self._keep_rate
+
+    def shutdown(self) -> None:
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._delegate.force_flush(timeout_millis)
+
+
+def get_otlp_endpoint() -> str:
+    """
+    URL du collecteur OTLP (HTTP) qui reçoit les traces.
+    OTEL_EXPORTER_OTLP_TRACES_ENDPOINT est prioritaire, puis PHOENIX_COLLECTOR_ENDPOINT.
+    Sans configuration, LlamaTrace est utilisé si PHOENIX_API_KEY est défini, sinon un collecteur local.
+    """
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.getenv(
+        "PHOENIX_COLLECTOR_ENDPOINT"
+    )
+    if endpoint:
+        return endpoint
+    return LLAMATRACE_ENDPOINT if os.getenv("PHOENIX_API_KEY") else DEFAULT_OTLP_ENDPOINT
+
+
 def init_observability():
+    global _tracer_provider
+    if _tracer_provider is not None:
+        return trace.get_tracer(__name__)
     try:
-        PHOENIX_API_KEY = os.getenv("PHOENIX_API_KEY")
-        if not PHOENIX_API_KEY:
-            raise ValueError("PHOENIX_API_KEY environment variable is not set")
-            
-        # Configuration de base pour LlamaTrace
-        os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"api_key={PHOENIX_API_KEY}"
-        
-        # Initialiser LlamaIndex avec Phoenix
-        llama_index.core.set_global_handler(
-            "arize_phoenix", 
-            endpoint="https://llamatrace.com/v1/traces"
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+        if os.getenv("OTEL_SDK_DISABLED", "false").lower() == "true":
+            logger.info("Observability disabled (OTEL_SDK_DISABLED)")
+            return trace.get_tracer(__name__)
+
+        endpoint = get_otlp_endpoint()
+        headers = {}
+        # La clé n'est nécessaire que pour LlamaTrace / Phoenix Cloud, pas pour un collecteur local
+        phoenix_api_key = os.getenv("PHOENIX_API_KEY")
+        if phoenix_api_key:
+            headers["api_key"] = phoenix_api_key
+
+        # Échantillonnage en tête : une fraction des traces est enregistrée (les spans filles suivent leur parent)
+        sample_rate = os.getenv("TRACE_SAMPLE_RATE")
+        sampler = ParentBased(TraceIdRatioBased(float(sample_rate))) if sample_rate else None
+        _tracer_provider = TracerProvider(
+            resource=Resource.create(
+                {"service.name": os.getenv("OTEL_SERVICE_NAME", "rag-backend")}
+            ),
+            sampler=sampler,
+            # Les attributs trop longs (messages, prompts) sont tronqués
+            span_limits=SpanLimits(
+                max_span_attribute_length=_max_attribute_length()
+            ),
         )
-        
-        # Obtenir le traceur pour les spans personnalisées
-        tracer = trace.get_tracer(__name__)
-        
-        logger.info("Observability initialized successfully with LlamaTrace")
-        return tracer
-        
+        # Export en lot dans un thread, jamais sur le chemin de la requête.
+        # La file est bornée (OTEL_BSP_MAX_QUEUE_SIZE, 2048 par défaut) : au-delà, les spans sont abandonnées.
+        processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, headers=headers))
+        # Échantillonnage en queue : ne garder que les traces lentes ou en erreur
+        if os.getenv("TRACE_ONLY_SLOW_OR_FAILED", "false").lower() == "true":
+            processor = TailSamplingSpanProcessor(
+                processor,
+                slow_threshold_ms=float(os.getenv("TRACE_SLOW_THRESHOLD_MS", "2000")),
+                keep_rate=float(os.getenv("TRACE_TAIL_SAMPLE_RATE", "0")),
+            )
+        _tracer_provider.add_span_processor(processor)
+        trace.set_tracer_provider(_tracer_provider)
+
+        # Une span par étape du pipeline RAG (embedding, recherche, rerank, prompt, LLM)
+        Settings.callback_manager.add_handler(OpenTelemetryCallbackHandler())
+
+        # Instrumentation détaillée de LlamaIndex (OpenInference), si elle est installée
+        if os.getenv("PHOENIX_INSTRUMENT_LLAMA_INDEX", "false").lower() == "true":
+            llama_index.core.set_global_handler(
+                "arize_phoenix", tracer_provider=_tracer_provider
+            )
+
+        logger.info(f"Observability initialized, exporting traces to {endpoint}")
+        return trace.get_tracer(__name__)
+
     except Exception as e:
         logger.error(f"Failed to initialize observability: {str(e)}")
         raise
 
+
+class OpenTelemetryCallbackHandler(BaseCallbackHandler):
+    """
+    Transforme les événements LlamaIndex en spans OpenTelemetry, imbriquées dans la span courante
+    (par ex. celle de la requête de chat), avec le nombre de noeuds et de tokens en attributs.
+    """
+
+    def __init__(self):
+        super().__init__(
+            event_starts_to_ignore=[CBEventType.CHUNKING],
+            event_ends_to_ignore=[CBEventType.CHUNKING, CBEventType.EXCEPTION],
+        )
+        self._tracer = trace.get_tracer(__name__)
+        self._token_counter = TokenCounter()
+        # Les événements jamais terminés (flux annulé) sont oubliés au bout de 10 minutes
+        self._spans: TTLCache = TTLCache(maxsize=10000, ttl=600)
+        # Les callbacks peuvent venir de threads (appels synchrones dans un executor)
+        self._lock = threading.Lock()
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        payload = payload or {}
+        with self._lock:
+            parent = self._spans.get(parent_id)
+        if event_type == CBEventType.EXCEPTION:
+            if parent is not None:
+                exception = payload.get(EventPayload.EXCEPTION)
+                if isinstance(exception, BaseException):
+                    parent.record_exception(exception)
+                parent.set_status(Status(StatusCode.ERROR))
+            return event_id
+
+        context = (
+            trace.set_span_in_context(parent)
+            if parent is not None
+            else otel_context.get_current()
+        )
+        span = self._tracer.start_span(f"rag.{event_type.value}", context=context)
+        span.set_attribute("openinference.span.kind", _SPAN_KINDS.get(event_type, "CHAIN"))
+        if EventPayload.TOP_K in payload:
+            span.set_attribute("retrieval.top_k", payload[EventPayload.TOP_K])
+        if event_type == CBEventType.RERANKING:
+            span.set_attribute(
+                "reranker.input_node_count", len(payload.get(EventPayload.NODES) or [])
+            )
+        if EventPayload.TEMPLATE_VARS in payload:
+            span.set_attribute(
+                "template.variable_count", len(payload[EventPayload.TEMPLATE_VARS] or {})
+            )
+        with self._lock:
+            self._spans[event_id] = span
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            span = self._spans.pop(event_id, None)
+        if span is None:
+            return
+        if not span.is_recording():
+            # Trace non échantillonnée : inutile de compter les tokens
+            span.end()
+            return
+        payload = payload or {}
+        try:
+            if EventPayload.NODES in payload:
+                nodes = payload[EventPayload.NODES] or []
+                span.set_attribute("retrieval.node_count", len(nodes))
+                scores = [n.score for n in nodes if getattr(n, "score", None) is not None]
+                if scores:
+                    span.set_attribute("retrieval.top_score", max(scores))
+            if EventPayload.CHUNKS in payload:
+                span.set_attribute("embedding.text_count", len(payload[EventPayload.CHUNKS] or []))
+            if event_type == CBEventType.LLM:
+                counts = get_llm_token_counts(self._token_counter, payload)
+                span.set_attribute("llm.token_count.prompt", counts.prompt_token_count)
+                span.set_attribute("llm.token_count.completion", counts.completion_token_count)
+                span.set_attribute("llm.token_count.total", counts.total_token_count)
+        except Exception as e:
+            logger.debug(f"Failed to set span attributes for {event_type}: {e}")
+        finally:
+            span.end()
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        pass
+
+
 def create_chat_span(tracer, conversation_id: str, user_message: str):
     """
-    Crée un span pour suivre une interaction de chat
+    Crée un span pour suivre une interaction de chat.
+    Le span n'est pas terminé ici : il couvre aussi le streaming de la réponse
+    et doit être terminé avec `end_chat_span`.
     """
-    with tracer.start_as_current_span("chat_interaction") as span:
-        span.set_attribute("conversation_id", conversation_id)
-        span.set_attribute("user_message", user_message)
-        return span
+    span = tracer.start_span("chat_interaction")
+    span.set_attribute("conversation_id", conversation_id)
+    span.set_attribute("user_message.length", len(user_message))
+    if _capture_content():
+        span.set_attribute("user_message", _truncate(user_message))
+    return span
 
 def end_chat_span(span, success: bool, response: str = None, error: str = None):
     """
     Termine un span de chat avec les résultats
     """
+    # Déjà terminé (ou non échantillonné)
+    if not span.is_recording():
+        return
     if success:
         span.set_status(Status(StatusCode.OK))
-        if response:
-            span.set_attribute("assistant_response", response)
+        if response and _capture_content():
+            span.set_attribute("assistant_response", _truncate(response))
     else:
         span.set_status(Status(StatusCode.ERROR))
         if error:
@@ -3,6 +3,7 @@ import logging
 import mimetypes
 import os
 import re
+import time
 import uuid
 from io import BytesIO
 from pathlib import Path
@@ -18,6 +19,8 @@ from llama_index.indices.managed.llama_cloud.base import LlamaCloudIndex
 from llama_index.readers.file import FlatReader
 from pydantic import BaseModel, Field
 
+from app.metrics import observe_ingestion
+
 logger = logging.getLogger(__name__)
 
 PRIVATE_STORE_PATH = str(Path("output", "uploaded"))
@@ -52,9 +55,11 @@ class FileService:
         file_name: str,
         base64_content: str,
         params: Optional[dict] = None,
+        user_id: Optional[str] = None,
     ) -> DocumentFile:
         """
         Store the uploaded file and index it if necessary.
+        The indexed documents are only visible to `user_id` (see `generate_filters`).
         """
         try:
             from app.engine.index import IndexConfig, get_index
@@ -65,7 +70,8 @@ class FileService:
             params = {}
 
         # Add the nodes to the index and persist it
-        index_config = IndexConfig(**params)
+        # The tenant is always the authenticated user, whatever the client sent in params
+        index_config = IndexConfig(**{**params, "tenant_id": user_id})
         index = get_index(index_config)
 
         # Preprocess and store the file
@@ -89,7 +95,7 @@ class FileService:
                 # Add document ids to the file metadata
                 document_file.refs = [doc_id]
             else:
-                documents = cls._load_file_to_documents(document_file)
+                documents = cls._load_file_to_documents(document_file, user_id)
                 cls._add_documents_to_vector_store_index(documents, index)
                 # Add document ids to the file metadata
                 document_file.refs = [doc.doc_id for doc in documents]
@@ -183,7 +189,9 @@ class FileService:
         return base64.b64decode(data), extension
 
     @staticmethod
-    def _load_file_to_documents(file: DocumentFile) -> List[Document]:
+    def _load_file_to_documents(
+        file: DocumentFile, user_id: Optional[str] = None
+    ) -> List[Document]:
         """
         Load the file from the private directory and return the documents
         """
@@ -195,17 +203,24 @@ class FileService:
         # Otherwise, use the default file loaders
         reader = _get_llamaparse_parser()
         if reader is None:
-            reader_cls = _default_file_loaders_map().get(f".{extension}")
-            if reader_cls is None:
+            reader = _default_file_loaders_map().get(f".{extension}")
+            if reader is None:
                 raise ValueError(f"File extension {extension} is not supported")
-            reader = reader_cls()
         if file.path is None:
             raise ValueError("Document file path is not set")
-        documents = reader.load_data(Path(file.path))
+        # Files already parsed with the same parser and options are served from the parse cache
+        from app.engine.loaders.parse_cache import cached_reader
+
+        documents = cached_reader(reader).load_data(Path(file.path))
         # Add custom metadata
         for doc in documents:
             doc.metadata["file_name"] = file.name
             doc.metadata["private"] = "true"
+            if user_id is not None:
+                doc.metadata["user_id"] = user_id
+                # Only used for filtering, not relevant for the embeddings and the LLM
+                doc.excluded_embed_metadata_keys.append("user_id")
+                doc.excluded_llm_metadata_keys.append("user_id")
         return documents
 
     @staticmethod
@@ -215,14 +230,22 @@ class FileService:
         """
         Add the documents to the vector store index
         """
-        pipeline = IngestionPipeline()
+        start = time.perf_counter()
+        from app.engine.generate import build_transformations
+
+        pipeline = IngestionPipeline(transformations=build_transformations())
         nodes = pipeline.run(documents=documents)
+        observe_ingestion("private_upload", len(nodes), time.perf_counter() - start)
 
         # Add the nodes to the index and persist it
         if index is None:
             index = VectorStoreIndex(nodes=nodes)
         else:
             index.insert_nodes(nodes=nodes)
+            from app.engine.vectordb import on_collection_written
+
+            # The tenant collection may have just been created by this insert
+            on_collection_written(index.vector_store)
         index.storage_context.persist(
             persist_dir=os.environ.get("STORAGE_DIR", "storage")
         )
@@ -42,6 +42,10 @@ def init_settings():
     Settings.chunk_size = int(os.getenv("CHUNK_SIZE", "1024"))
     Settings.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "20"))
 
+    # Report the LLM and embedding events to the global handlers (e.g. tracing)
+    Settings.llm.callback_manager = Settings.callback_manager
+    Settings.embed_model.callback_manager = Settings.callback_manager
+
 
 def init_ollama():
     try:
@@ -0,0 +1,96 @@
+"""
+Chunk count and chunk size versus retrieval recall, per chunking strategy.
+
+Each strategy splits the documents of DATA_DIR ("auto" picks the chunker of each file
+type, see app.engine.chunkers; the other names force one chunker for every file).
+The chunk statistics need no embedding, except for the "semantic" strategy which
+embeds every sentence. With --golden, the corpus is also indexed with
+each strategy and evaluated on the golden question set (see app.engine.evaluate), which
+calls the embedding model configured in the environment.
+
+Usage:
+    python -m benchmarks.chunking --strategies auto,sentence --chunk-size 512,1024
+    python -m benchmarks.chunking --golden golden.yaml --top-k 5
+"""
+
+import argparse
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.settings import Settings
+
+from app.engine.chunkers import ChunkerRouter, get_node_extension
+from app.engine.evaluate import run_evaluation
+from app.engine.loaders import get_documents
+from app.engine.token_count import TOKEN_COUNT_KEY, TokenCountExtractor
+from app.settings import init_settings
+from benchmarks.loadtest import percentiles
+
+
+def chunk_stats(documents, chunk_size: int, chunk_overlap: int, chunker: Optional[str]):
+    router = ChunkerRouter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, chunker=chunker)
+    nodes = TokenCountExtractor()(router(documents))
+    tokens = [node.metadata[TOKEN_COUNT_KEY] for node in nodes]
+    return {
+        "chunks": len(nodes),
+        "chunks_by_extension": dict(Counter(get_node_extension(node) or "none" for node in nodes)),
+        "total_tokens": sum(tokens),
+        "tokens_per_chunk": percentiles(tokens),
+        # Text only: the token counts above include the metadata sent to the LLM
+        "over_chunk_size": sum(
+            1 for node in nodes if len(Settings.tokenizer(node.get_content())) > chunk_size
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--strategies", default="auto,sentence")
+    parser.add_argument("--chunk-size", default="512,1024")
+    parser.add_argument("--chunk-overlap", type=int, default=None)
+    parser.add_argument("--golden", help="Golden question set for recall (YAML or JSONL)")
+    parser.add_argument("--top-k", default="5")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    init_settings()
+    documents = get_documents()
+    strategies: List[Optional[str]] = [
+        None if name == "auto" else name for name in args.strategies.split(",")
+    ]
+    chunk_sizes = [int(size) for size in args.chunk_size.split(",")]
+    chunk_overlap = Settings.chunk_overlap if args.chunk_overlap is None else args.chunk_overlap
+    top_ks = [int(k) for k in args.top_k.split(",")]
+
+    report: Dict[str, Any] = {"meta": {"documents": len(documents)}, "results": {}}
+    for strategy in strategies:
+        for chunk_size in chunk_sizes:
+            overlap = min(chunk_overlap, chunk_size // 2)
+            name = f"{strategy or 'auto'}-{chunk_size}"
+            result = chunk_stats(documents, chunk_size, overlap, strategy)
+            if args.golden:
+                evaluation = run_evaluation(
+                    args.golden,
+                    top_ks=top_ks,
+                    cutoffs=[0.0],
+                    chunk_sizes=[chunk_size],
+                    chunk_overlaps=[overlap],
+                    chunkers=[strategy],
+                )["runs"][0]
+                result["retrieval"] = {
+                    key: {k: v for k, v in value.items() if k != "queries"}
+                    for key, value in evaluation["results"].items()
+                }
+                result["retrieval_latency_s"] = evaluation["latency_s"]
+            report["results"][name] = result
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output)
+
+
+if __name__ == "__main__":
+    main()
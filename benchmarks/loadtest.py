@@ -0,0 +1,321 @@
+"""
+End-to-end load test of the API, fully offline.
+
+By default it starts the OpenAI/PostgREST stub (see `benchmarks.stub_server`), indexes a few
+generated documents into an embedded Qdrant, starts the app and drives
+`/api/chat/request`, `/api/query` and `/api/upload`. It reports the p50/p95/p99 latency,
+the time to first token (chat) and the throughput per scenario.
+
+Usage:
+    python -m benchmarks.loadtest --requests 100 --concurrency 10 --output loadtest.json
+    python -m benchmarks.loadtest --base-url http://localhost:8000 --token <jwt> --scenarios chat
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from jose import jwt
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+JWT_SECRET = "loadtest-secret"
+QUESTIONS = [
+    "How does the retrieval pipeline split files?",
+    "Which passages are used to answer questions?",
+    "What does the document describe?",
+]
+
+
+@dataclass
+class ScenarioResult:
+    latencies: List[float] = field(default_factory=list)
+    ttfts: List[float] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=dict)
+    duration: float = 0.0
+
+    def add_error(self, error: str) -> None:
+        self.errors[error] = self.errors.get(error, 0) + 1
+
+    def report(self) -> Dict:
+        report = {
+            "requests": len(self.latencies) + sum(self.errors.values()),
+            "succeeded": len(self.latencies),
+            "errors": self.errors,
+            "throughput_rps": len(self.latencies) / self.duration
+            if self.duration
+            else 0.0,
+            "latency_s": percentiles(self.latencies),
+        }
+        if self.ttfts:
+            report["ttft_s"] = percentiles(self.ttfts)
+        return report
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": ordered[-1]}
+
+
+def start_stub(port: int, token_latency_ms: float, tokens: int) -> None:
+    import uvicorn
+
+    from benchmarks import stub_server
+
+    stub_server.config.token_latency = token_latency_ms / 1000
+    stub_server.config.tokens = tokens
+    server = uvicorn.Server(
+        uvicorn.Config(stub_server.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+
+def prepare_workdir(workdir: Path, documents: int) -> None:
+    config_dir = workdir / "config"
+    config_dir.mkdir(parents=True)
+    shutil.copy(ROOT_DIR / "config" / "tools.yaml", config_dir / "tools.yaml")
+    # No LlamaParse: the load test must run offline
+    (config_dir / "loaders.yaml").write_text("file:\n  use_llama_parse: false\n")
+    data_dir = workdir / "data"
+    data_dir.mkdir()
+    for i in range(documents):
+        paragraphs = [
+            f"Document {i}, section {j}: the retrieval pipeline splits files into chunks, "
+            "embeds them and answers questions using the most relevant passages."
+            # Short enough to be split by paragraphs only (no NLTK data needed)
+            for j in range(20)
+        ]
+        (data_dir / f"doc_{i}.txt").write_text("\n\n".join(paragraphs))
+
+
+def app_env(stub_url: str, workdir: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "PYTHONPATH": str(ROOT_DIR),
+            "MODEL_PROVIDER": "openai",
+            "MODEL": "gpt-4o-mini",
+            "EMBEDDING_MODEL": "text-embedding-3-small",
+            "OPENAI_API_KEY": "stub",
+            "OPENAI_API_BASE": f"{stub_url}/v1",
+            "QDRANT_COLLECTION": "loadtest",
+            "QDRANT_PATH": str(workdir / "qdrant"),
+            "STORAGE_DIR": str(workdir / "storage"),
+            "SUPABASE_URL": stub_url,
+            "SUPABASE_SERVICE_KEY": jwt.encode({"role": "service_role"}, JWT_SECRET),
+            "JWT_SECRET_KEY": JWT_SECRET,
+        }
+    )
+    # /api/query is anonymous, all its requests share the client address as admission key
+    env.setdefault("ADMISSION_MAX_PER_USER", "1000")
+    env.pop("PHOENIX_API_KEY", None)
+    return env
+
+
+def seed_users(stub_url: str, count: int) -> List[str]:
+    """
+    Create users in the PostgREST stub and return their access tokens
+    """
+    tokens = []
+    for i in range(count):
+        user_id = str(uuid.uuid4())
+        httpx.post(
+            f"{stub_url}/rest/v1/users",
+            json={
+                "id": user_id,
+                "email": f"loadtest{i}@example.com",
+                "username": f"loadtest{i}",
+                "created_at": datetime.utcnow().isoformat(),
+            },
+        ).raise_for_status()
+        tokens.append(jwt.encode({"sub": user_id}, JWT_SECRET))
+    return tokens
+
+
+def start_app(workdir: Path, env: Dict[str, str], port: int) -> subprocess.Popen:
+    # Index the generated documents before starting the app (embedded Qdrant is single-process)
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from app.engine.generate import generate_datasource; generate_datasource()",
+        ],
+        cwd=workdir,
+        env=env,
+        check=True,
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.api.app:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=workdir,
+        env=env,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/docs").status_code == 200:
+                return process
+        except httpx.TransportError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError("The app exited during startup")
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The app didn't start in time")
+
+
+async def chat_request(client: httpx.AsyncClient, token: str, i: int, result: ScenarioResult):
+    start = time.perf_counter()
+    first_token = None
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"message": QUESTIONS[i % len(QUESTIONS)], "conversation_id": str(uuid.uuid4())}
+    async with client.stream("POST", "/api/chat/request", json=body, headers=headers) as response:
+        if response.status_code != 200:
+            result.add_error(str(response.status_code))
+            await response.aread()
+            return
+        async for line in response.aiter_lines():
+            if first_token is None and line.startswith("data: ") and '"content"' in line:
+                first_token = time.perf_counter() - start
+    result.latencies.append(time.perf_counter() - start)
+    if first_token is not None:
+        result.ttfts.append(first_token)
+
+
+async def query_request(client: httpx.AsyncClient, token: str, i: int, result: ScenarioResult):
+    start = time.perf_counter()
+    response = await client.get("/api/query/", params={"query": QUESTIONS[i % len(QUESTIONS)]})
+    if response.status_code != 200:
+        result.add_error(str(response.status_code))
+        return
+    result.latencies.append(time.perf_counter() - start)
+
+
+async def upload_request(client: httpx.AsyncClient, token: str, i: int, result: ScenarioResult):
+    start = time.perf_counter()
+    content = f"Uploaded document {i}: the retrieval pipeline answers questions.\n" * 20
+    response = await client.post(
+        "/api/upload",
+        files={"file": (f"upload_{uuid.uuid4().hex}.txt", content, "text/plain")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if response.status_code != 200:
+        result.add_error(str(response.status_code))
+        return
+    result.latencies.append(time.perf_counter() - start)
+
+
+SCENARIOS = {
+    "chat": chat_request,
+    "query": query_request,
+    "upload": upload_request,
+}
+
+
+async def run_scenario(
+    base_url: str, scenario: str, tokens: List[str], requests: int, concurrency: int
+) -> ScenarioResult:
+    result = ScenarioResult()
+    semaphore = asyncio.Semaphore(concurrency)
+    request_fn = SCENARIOS[scenario]
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+
+        async def run_one(i: int):
+            async with semaphore:
+                try:
+                    await request_fn(client, tokens[i % len(tokens)], i, result)
+                except httpx.HTTPError as e:
+                    result.add_error(type(e).__name__)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[run_one(i) for i in range(requests)])
+        result.duration = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", help="Use a running app instead of starting one")
+    parser.add_argument("--token", help="Access token to use with --base-url")
+    parser.add_argument("--scenarios", default="upload,query,chat")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=9000)
+    parser.add_argument("--token-latency-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    process: Optional[subprocess.Popen] = None
+    workdir = None
+    if args.base_url:
+        if not args.token:
+            parser.error("--token is required with --base-url")
+        base_url = args.base_url
+        tokens = [args.token]
+    else:
+        stub_url = f"http://127.0.0.1:{args.stub_port}"
+        start_stub(args.stub_port, args.token_latency_ms, args.tokens)
+        workdir = Path(tempfile.mkdtemp(prefix="loadtest-"))
+        prepare_workdir(workdir, args.documents)
+        process = start_app(workdir, app_env(stub_url, workdir), args.app_port)
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        # One user per concurrent client, so that per-user admission limits don't skew the results
+        tokens = seed_users(stub_url, args.concurrency)
+
+    report = {}
+    try:
+        for scenario in args.scenarios.split(","):
+            result = asyncio.run(
+                run_scenario(base_url, scenario, tokens, args.requests, args.concurrency)
+            )
+            report[scenario] = result.report()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output)
+
+
+if __name__ == "__main__":
+    main()
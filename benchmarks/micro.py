@@ -0,0 +1,362 @@
+"""
+Microbenchmarks of the ingestion, retrieval and streaming hot paths.
+
+Results are written as JSON so that they can be diffed across commits:
+    python -m benchmarks.micro --output results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.micro --compare results/<baseline>.json
+
+With --compare, the command exits with a non-zero status when a benchmark is slower
+than the baseline by more than --threshold (10% by default).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# The chat router creates the Supabase client when imported, no request is sent
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9100")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "stub.stub.stub")
+os.environ.setdefault("FILESERVER_URL_PREFIX", "http://localhost:8000/api/files")
+
+PARAGRAPH = (
+    "The retrieval pipeline splits the uploaded files into chunks, embeds them and "
+    "stores them in the vector store. At question time the most relevant chunks are "
+    "retrieved and given to the LLM as context to write the answer."
+)
+
+# name -> setup function returning the function to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    def decorator(setup: Callable[[], Callable[[], Any]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def make_text(paragraphs: int) -> str:
+    return "\n\n".join(f"{i}. {PARAGRAPH}" for i in range(paragraphs))
+
+
+@benchmark("chunking.sentence_splitter")
+def bench_sentence_splitter():
+    from llama_index.core import Document
+    from llama_index.core.node_parser import SentenceSplitter
+
+    splitter = SentenceSplitter(
+        chunk_size=int(os.getenv("CHUNK_SIZE", "1024")),
+        chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "20")),
+    )
+    documents = [Document(text=make_text(200)) for _ in range(5)]
+    return lambda: splitter.get_nodes_from_documents(documents)
+
+
+def _write_pdf(path: Path, lines: List[str]) -> None:
+    """
+    Write a minimal one-page PDF with the given text lines
+    """
+    text = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(
+        f"({line}) '" for line in lines
+    ) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        "/Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(text)} >>\nstream\n{text}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    content = "%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{i} 0 obj\n{obj}\nendobj\n"
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    content += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    path.write_bytes(content.encode("latin-1"))
+
+
+def _write_docx(path: Path, paragraphs: List[str]) -> None:
+    """
+    Write a minimal docx document with the given paragraphs
+    """
+    body = "".join(f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs)
+    with zipfile.ZipFile(path, "w") as docx:
+        docx.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>",
+        )
+        docx.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/'
+            '2006/relationships/officeDocument" Target="word/document.xml"/>'
+            "</Relationships>",
+        )
+        docx.writestr(
+            "word/document.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>",
+        )
+
+
+FILE_FORMATS: Dict[str, Callable[[Path], None]] = {
+    "txt": lambda path: path.write_text(make_text(100)),
+    "md": lambda path: path.write_text(
+        "\n\n".join(f"## Section {i}\n\n{PARAGRAPH}" for i in range(100))
+    ),
+    "html": lambda path: path.write_text(
+        "<html><body>"
+        + "".join(f"<h2>Section {i}</h2><p>{PARAGRAPH}</p>" for i in range(100))
+        + "</body></html>"
+    ),
+    "csv": lambda path: path.write_text(
+        "id,text\n" + "\n".join(f'{i},"{PARAGRAPH}"' for i in range(500))
+    ),
+    "pdf": lambda path: _write_pdf(path, [f"Line {i} of the document" for i in range(60)]),
+    "docx": lambda path: _write_docx(path, [PARAGRAPH] * 100),
+}
+
+
+def _bench_file_documents(file_format: str):
+    def setup():
+        from app.engine.loaders import file as file_loader
+
+        data_dir = Path(tempfile.mkdtemp(prefix=f"bench-{file_format}-"))
+        for i in range(5):
+            FILE_FORMATS[file_format](data_dir / f"doc_{i}.{file_format}")
+        # get_file_documents reads the module level DATA_DIR
+        file_loader.DATA_DIR = str(data_dir)
+        config = file_loader.FileLoaderConfig(use_llama_parse=False)
+        return lambda: file_loader.get_file_documents(config)
+
+    return setup
+
+
+for _file_format in FILE_FORMATS:
+    benchmark(f"loaders.get_file_documents.{_file_format}")(
+        _bench_file_documents(_file_format)
+    )
+
+
+@benchmark("models.source_nodes.from_source_nodes")
+def bench_source_nodes():
+    from llama_index.core.schema import NodeWithScore, TextNode
+
+    from app.api.routers.models import SourceNodes
+
+    nodes = [
+        NodeWithScore(
+            node=TextNode(
+                text=PARAGRAPH * 5,
+                metadata={
+                    "file_name": f"doc_{i}.pdf",
+                    "file_path": os.path.abspath(f"data/doc_{i}.pdf"),
+                    "page_label": str(i),
+                    "private": "false",
+                },
+            ),
+            score=1.0 / (i + 1),
+        )
+        for i in range(20)
+    ]
+    return lambda: SourceNodes.from_source_nodes(nodes)
+
+
+def _long_chat_data(messages: int):
+    from app.api.routers.models import ChatData
+
+    history = []
+    for i in range(messages):
+        if i % 2 == 0:
+            history.append(
+                {
+                    "role": "user",
+                    "content": f"Question {i}: {PARAGRAPH}",
+                    "annotations": [
+                        {"type": "document_file", "data": {"files": []}},
+                    ],
+                }
+            )
+        else:
+            history.append(
+                {
+                    "role": "assistant",
+                    "content": f"Answer {i}: {PARAGRAPH}",
+                    "annotations": [
+                        {
+                            "type": "agent",
+                            "data": {"agent": "researcher", "text": PARAGRAPH},
+                        }
+                    ],
+                }
+            )
+    history.append({"role": "user", "content": "Last question"})
+    return ChatData(messages=history)
+
+
+@benchmark("models.chat_data.get_history_messages")
+def bench_history_messages():
+    chat_data = _long_chat_data(500)
+    return lambda: chat_data.get_history_messages(include_agent_messages=True)
+
+
+@benchmark("models.chat_data.get_last_message_content")
+def bench_last_message_content():
+    chat_data = _long_chat_data(500)
+    return chat_data.get_last_message_content
+
+
+class _StreamingResponse:
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.source_nodes = []
+
+    async def async_response_gen(self):
+        for i in range(self.tokens):
+            yield f" tok{i % 100}"
+
+
+class _Holder:
+    is_done = False
+
+
+@benchmark("streaming.stream_chat_response")
+def bench_stream_chat_response():
+    from app.api.routers import chat
+
+    # Only the framing is measured, not the persistence of the answer
+    chat.save_assistant_message = lambda request, current_user, content: None
+    request = chat.ChatRequest(message="question", conversation_id="bench")
+
+    async def consume():
+        stream = chat.stream_chat_response(
+            request, _Holder(), _StreamingResponse(2000), current_user=None
+        )
+        async for _ in stream:
+            pass
+
+    return lambda: asyncio.run(consume())
+
+
+def run_benchmark(setup: Callable[[], Callable[[], Any]], rounds: int) -> Dict[str, Any]:
+    fn = setup()
+    # Warm up (lazy imports, caches) before calibrating
+    fn()
+    timer = timeit.Timer(fn)
+    # Calibrate the number of calls per round so a round takes at least 0.2s
+    iterations, _ = timer.autorange()
+    times = [t / iterations for t in timer.repeat(repeat=rounds, number=iterations)]
+    return {
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.mean(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "rounds": rounds,
+        "iterations": iterations,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> bool:
+    """
+    Print the median time ratio per benchmark, return True if a benchmark regressed
+    """
+    regressed = False
+    print(f"{'benchmark':<50} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if "median_s" not in result or not base or "median_s" not in base:
+            continue
+        ratio = result["median_s"] / base["median_s"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(
+            f"{name:<50} {base['median_s'] * 1000:>10.3f}ms "
+            f"{result['median_s'] * 1000:>10.3f}ms {ratio:>7.2f}{flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filter", default="", help="Only run benchmarks containing this text")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        start = time.perf_counter()
+        try:
+            results[name] = run_benchmark(setup, args.rounds)
+        except ImportError as e:
+            # e.g. the reader of a file format isn't installed
+            results[name] = {"skipped": str(e)}
+        except Exception as e:
+            # Keep running the other benchmarks, the failure is kept in the results
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{name}: {results[name]} ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
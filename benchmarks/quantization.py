@@ -0,0 +1,222 @@
+"""
+Recall@k versus latency and memory of the Qdrant collection settings
+(quantization, rescoring, on-disk vectors, HNSW parameters).
+
+Needs a Qdrant server: quantization and HNSW are not implemented by the embedded
+Qdrant. One temporary collection is created per setting and deleted at the end.
+
+Usage:
+    python -m benchmarks.quantization --url http://localhost:6333 --points 100000 --dim 1536
+    python -m benchmarks.quantization --url http://localhost:6333 --vectors embeddings.npy
+
+With --vectors, the rows of the .npy file (real embeddings of the corpus) are used as
+points and a random sample of them, slightly perturbed, as queries. Otherwise clustered
+random vectors are generated.
+
+The exact neighbours are computed with NumPy. Memory is an estimate of the RAM used by
+the vectors and the HNSW graph, from the collection settings.
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+from app.engine.vectordb import (
+    build_dense_config,
+    build_quantization_config,
+    build_search_params,
+)
+from benchmarks.loadtest import percentiles
+
+
+@dataclass
+class CollectionSetting:
+    quantization: str = "none"
+    on_disk: bool = False
+    always_ram: bool = True
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    # name -> (rescore, oversampling, hnsw_ef)
+    searches: Dict[str, tuple] = field(default_factory=lambda: {"default": (True, None, None)})
+
+
+QUANTIZED_SEARCHES = {
+    "no-rescore": (False, None, None),
+    "rescore": (True, None, None),
+    "rescore-oversampling-2": (True, 2.0, None),
+}
+
+SETTINGS: Dict[str, CollectionSetting] = {
+    "float32": CollectionSetting(
+        searches={"default": (True, None, None), "ef-256": (True, None, 256)}
+    ),
+    "float32-on-disk": CollectionSetting(on_disk=True),
+    "float32-m8": CollectionSetting(hnsw_m=8, hnsw_ef_construct=64),
+    "scalar": CollectionSetting(quantization="scalar", searches=QUANTIZED_SEARCHES),
+    "scalar-on-disk": CollectionSetting(
+        quantization="scalar", on_disk=True, searches=QUANTIZED_SEARCHES
+    ),
+    "binary-on-disk": CollectionSetting(
+        quantization="binary", on_disk=True, searches=QUANTIZED_SEARCHES
+    ),
+}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_dataset(points: int, queries: int, dim: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(points // 1000, 10), dim)).astype(np.float32)
+
+    def sample(count: int) -> np.ndarray:
+        labels = rng.integers(0, len(centers), size=count)
+        noise = rng.normal(scale=0.6, size=(count, dim)).astype(np.float32)
+        return normalize(centers[labels] + noise)
+
+    return sample(points), sample(queries)
+
+
+def load_dataset(path: str, queries: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = normalize(np.load(path).astype(np.float32))
+    sample = vectors[rng.choice(len(vectors), size=queries, replace=False)]
+    noise = rng.normal(scale=0.01, size=sample.shape).astype(np.float32)
+    return vectors, normalize(sample + noise)
+
+
+def exact_neighbours(points: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    result = []
+    # By batch, to bound the memory of the score matrix
+    for start in range(0, len(queries), 256):
+        scores = queries[start : start + 256] @ points.T
+        top = np.argpartition(-scores, k, axis=1)[:, :k]
+        result.append(top)
+    return np.concatenate(result)
+
+
+def estimate_ram_bytes(setting: CollectionSetting, points: int, dim: int) -> int:
+    ram = 0 if setting.on_disk else points * dim * 4
+    if setting.quantization == "scalar" and setting.always_ram:
+        ram += points * dim
+    elif setting.quantization == "binary" and setting.always_ram:
+        ram += points * ((dim + 7) // 8)
+    # Level 0 of the HNSW graph: 2 * m links of 4 bytes per point
+    ram += points * 2 * (setting.hnsw_m or 16) * 4
+    return ram
+
+
+def wait_indexed(client: QdrantClient, name: str, timeout: float) -> Dict[str, Any]:
+    deadline = time.time() + timeout
+    while True:
+        info = client.get_collection(name)
+        if info.status == rest.CollectionStatus.GREEN or time.time() > deadline:
+            return {
+                "status": str(info.status.value),
+                "indexed_vectors_count": info.indexed_vectors_count,
+            }
+        time.sleep(1)
+
+
+def run_setting(
+    client: QdrantClient,
+    setting: CollectionSetting,
+    points: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    k: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    name = f"bench_quantization_{uuid.uuid4().hex[:8]}"
+    dim = points.shape[1]
+    client.create_collection(
+        collection_name=name,
+        vectors_config=build_dense_config(
+            dim, setting.on_disk, setting.hnsw_m, setting.hnsw_ef_construct
+        ),
+        quantization_config=build_quantization_config(setting.quantization, setting.always_ram),
+    )
+    try:
+        start = time.perf_counter()
+        client.upload_collection(name, vectors=points, ids=range(len(points)), batch_size=256)
+        index_state = wait_indexed(client, name, timeout)
+        result: Dict[str, Any] = {
+            "upload_and_index_s": time.perf_counter() - start,
+            **index_state,
+            "estimated_ram_mb": estimate_ram_bytes(setting, len(points), dim) / 2**20,
+            "searches": {},
+        }
+        for search_name, (rescore, oversampling, hnsw_ef) in setting.searches.items():
+            params = build_search_params(
+                setting.quantization != "none", rescore, oversampling, hnsw_ef
+            )
+            latencies: List[float] = []
+            hits = 0
+            for query, expected in zip(queries, truth):
+                query_start = time.perf_counter()
+                response = client.query_points(
+                    name, query=query.tolist(), limit=k, search_params=params
+                )
+                latencies.append(time.perf_counter() - query_start)
+                hits += len({p.id for p in response.points} & set(expected.tolist()))
+            result["searches"][search_name] = {
+                f"recall@{k}": hits / (len(queries) * k),
+                "latency_s": percentiles(latencies),
+                "qps": len(latencies) / sum(latencies),
+            }
+        return result
+    finally:
+        client.delete_collection(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--api-key")
+    parser.add_argument("--vectors", help="Embeddings of the corpus (.npy) instead of random vectors")
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--settings", default=",".join(SETTINGS), help="Comma-separated settings")
+    parser.add_argument("--index-timeout", type=float, default=600)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.vectors:
+        points, queries = load_dataset(args.vectors, args.queries, args.seed)
+    else:
+        points, queries = make_dataset(args.points, args.queries, args.dim, args.seed)
+    truth = exact_neighbours(points, queries, args.k)
+
+    client = QdrantClient(url=args.url, api_key=args.api_key, timeout=120)
+    report: Dict[str, Any] = {
+        "meta": {"points": len(points), "dim": points.shape[1], "queries": len(queries), "k": args.k},
+        "results": {},
+    }
+    for name in args.settings.split(","):
+        start = time.perf_counter()
+        report["results"][name] = run_setting(
+            client, SETTINGS[name], points, queries, truth, args.k, args.index_timeout
+        )
+        print(f"{name}: done ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output)
+
+
+if __name__ == "__main__":
+    main()
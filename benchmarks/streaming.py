@@ -0,0 +1,87 @@
+"""
+Benchmark of the SSE framing of a chat stream: one frame per token versus coalesced frames.
+
+Usage:
+    python -m benchmarks.streaming --tokens 2000 --streams 50 --token-delay-ms 1
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Dict
+
+from app.api.services.streaming import coalesce_tokens, dumps
+
+
+async def fake_token_stream(tokens: int, delay: float) -> AsyncIterator[str]:
+    for i in range(tokens):
+        if delay:
+            await asyncio.sleep(delay)
+        yield f" tok{i % 100}"
+
+
+async def per_token_frames(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    final_response = ""
+    async for token in tokens:
+        final_response += token
+        yield f"data: {json.dumps({'content': token})}\n\n"
+
+
+async def coalesced_frames(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    parts = []
+    async for chunk in coalesce_tokens(tokens):
+        parts.append(chunk)
+        yield f"data: {dumps({'content': chunk})}\n\n"
+    # Same work as per_token_frames: the final response is rebuilt once at the end
+    final_response = "".join(parts)  # noqa: F841
+
+
+async def run_stream(framer: Callable, tokens: int, delay: float) -> Dict[str, int]:
+    frames = 0
+    size = 0
+    async for frame in framer(fake_token_stream(tokens, delay)):
+        frames += 1
+        size += len(frame.encode())
+    return {"frames": frames, "bytes": size}
+
+
+async def run_case(framer: Callable, tokens: int, streams: int, delay: float) -> Dict:
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    results = await asyncio.gather(
+        *[run_stream(framer, tokens, delay) for _ in range(streams)]
+    )
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    total_bytes = sum(r["bytes"] for r in results)
+    total_frames = sum(r["frames"] for r in results)
+    return {
+        "frames_per_stream": total_frames / streams,
+        "bytes_per_sec": total_bytes / wall,
+        "cpu_ms_per_stream": cpu * 1000 / streams,
+        "wall_s": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--token-delay-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    delay = args.token_delay_ms / 1000
+    report = {
+        "per_token": asyncio.run(
+            run_case(per_token_frames, args.tokens, args.streams, delay)
+        ),
+        "coalesced": asyncio.run(
+            run_case(coalesced_frames, args.tokens, args.streams, delay)
+        ),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Local stand-in for the external services used by the app, to benchmark it offline:
+
+- an OpenAI-compatible API (`/v1/chat/completions`, `/v1/completions`, `/v1/embeddings`)
+  with a configurable latency per token
+- a minimal in-memory Supabase/PostgREST API (`/rest/v1/{table}`)
+- the LlamaParse job API (`/api/parsing/...`): each job succeeds after a fixed
+  parsing time and returns the uploaded file decoded as text
+- with --site-dir, a static website under `/site/` (with ETag and Last-Modified
+  headers, answering conditional requests with 304) to test the web crawler
+
+Usage:
+    python -m benchmarks.stub_server --port 9100 --token-latency-ms 20 --tokens 200
+
+Then point the app to it:
+    OPENAI_API_BASE=http://127.0.0.1:9100/v1 SUPABASE_URL=http://127.0.0.1:9100
+    LLAMA_CLOUD_BASE_URL=http://127.0.0.1:9100 LLAMA_CLOUD_API_KEY=stub
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_EMBEDDING_DIM = 1536
+
+WORDS = (
+    "the document describes how the retrieval pipeline splits files into chunks "
+    "embeds them and answers questions using the most relevant passages"
+).split()
+
+
+class StubConfig:
+    token_latency: float = 0.02
+    first_token_latency: float = 0.2
+    tokens: int = 200
+    embedding_latency: float = 0.01
+    parse_latency: float = 2.0
+
+
+config = StubConfig()
+app = FastAPI(title="OpenAI, PostgREST and LlamaParse stub")
+
+# table name -> rows
+tables: Dict[str, List[Dict[str, Any]]] = {}
+
+# job id -> (time the job is done, parsed text)
+parse_jobs: Dict[str, Tuple[float, str]] = {}
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """
+    Deterministic unit vector for a text, texts sharing words get similar vectors
+    """
+    vector = [0.0] * dim
+    for word in text.lower().split():
+        seed = int.from_bytes(hashlib.sha1(word.encode()).digest()[:8], "big")
+        rng = random.Random(seed)
+        for _ in range(8):
+            vector[rng.randrange(dim)] += rng.uniform(-1, 1)
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_tokens(n: int) -> List[str]:
+    return [f" {WORDS[i % len(WORDS)]}" for i in range(n)]
+
+
+def _usage(prompt: str, completion_tokens: int) -> Dict[str, int]:
+    prompt_tokens = len(prompt.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dim = body.get("dimensions") or DEFAULT_EMBEDDING_DIM
+    await asyncio.sleep(config.embedding_latency)
+    return {
+        "object": "list",
+        "model": body.get("model"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dim)}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+async def _stream_chunks(model: str, object_name: str, make_choice):
+    completion_id = f"stub-{uuid.uuid4().hex}"
+    created = int(time.time())
+    await asyncio.sleep(config.first_token_latency)
+    for token in fake_tokens(config.tokens):
+        chunk = {
+            "id": completion_id,
+            "object": object_name,
+            "created": created,
+            "model": model,
+            "choices": [make_choice(token, None)],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(config.token_latency)
+    chunk = {
+        "id": completion_id,
+        "object": object_name,
+        "created": created,
+        "model": model,
+        "choices": [make_choice("", "stop")],
+    }
+    yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream_chunks(
+                model,
+                "chat.completion.chunk",
+                lambda token, finish: {
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": token} if token else {},
+                    "finish_reason": finish,
+                },
+            ),
+            media_type="text/event-stream",
+        )
+    await asyncio.sleep(config.first_token_latency + config.token_latency * config.tokens)
+    return {
+        "id": f"stub-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": "".join(fake_tokens(config.tokens)),
+                },
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": _usage(prompt, config.tokens),
+    }
+
+
+@app.post("/v1/completions")
+async def completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream_chunks(
+                model,
+                "text_completion",
+                lambda token, finish: {
+                    "index": 0,
+                    "text": token,
+                    "finish_reason": finish,
+                },
+            ),
+            media_type="text/event-stream",
+        )
+    await asyncio.sleep(config.first_token_latency + config.token_latency * config.tokens)
+    return {
+        "id": f"stub-{uuid.uuid4().hex}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "text": "".join(fake_tokens(config.tokens)),
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": _usage(str(body.get("prompt", "")), config.tokens),
+    }
+
+
+def _match(row: Dict[str, Any], column: str, expression: str) -> bool:
+    operator, _, value = expression.partition(".")
+    current = row.get(column)
+    current = None if current is None else str(current)
+    match operator:
+        case "eq":
+            return current == value
+        case "neq":
+            return current != value
+        case "in":
+            return current in value.strip("()").split(",")
+        case "is":
+            return current is None if value == "null" else current is not None
+        case _:
+            return True
+
+
+@app.get("/rest/v1/{table}")
+async def postgrest_select(table: str, request: Request):
+    rows = tables.get(table, [])
+    order = None
+    limit = None
+    for column, expression in request.query_params.multi_items():
+        if column == "select":
+            continue
+        elif column == "order":
+            order = expression
+        elif column == "limit":
+            limit = int(expression)
+        else:
+            rows = [row for row in rows if _match(row, column, expression)]
+    if order:
+        column, _, direction = order.partition(".")
+        rows = sorted(
+            rows, key=lambda row: str(row.get(column)), reverse=direction == "desc"
+        )
+    if limit is not None:
+        rows = rows[:limit]
+    return rows
+
+
+@app.post("/rest/v1/{table}")
+async def postgrest_insert(table: str, request: Request):
+    body = await request.json()
+    items = body if isinstance(body, list) else [body]
+    inserted = []
+    for item in items:
+        row = dict(item)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", datetime.utcnow().isoformat())
+        tables.setdefault(table, []).append(row)
+        inserted.append(row)
+    return JSONResponse(inserted, status_code=201)
+
+
+@app.post("/api/parsing/upload")
+async def parsing_upload(request: Request):
+    form = await request.form()
+    text = (await form["file"].read()).decode("utf-8", errors="ignore")
+    job_id = str(uuid.uuid4())
+    parse_jobs[job_id] = (time.monotonic() + config.parse_latency, text)
+    return {"id": job_id, "status": "PENDING"}
+
+
+@app.get("/api/parsing/job/{job_id}")
+async def parsing_job(job_id: str):
+    if job_id not in parse_jobs:
+        return JSONResponse({"detail": "Job not found"}, status_code=404)
+    done_at, _ = parse_jobs[job_id]
+    return {"id": job_id, "status": "SUCCESS" if time.monotonic() >= done_at else "PENDING"}
+
+
+@app.get("/api/parsing/job/{job_id}/result/{result_type}")
+async def parsing_result(job_id: str, result_type: str):
+    _, text = parse_jobs[job_id]
+    return {result_type: text, "job_metadata": {"job_pages": 1}}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--token-latency-ms", type=float, default=20)
+    parser.add_argument("--first-token-latency-ms", type=float, default=200)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--parse-latency-ms", type=float, default=2000)
+    parser.add_argument("--site-dir", help="Directory served as a static website under /site/")
+    args = parser.parse_args()
+
+    config.token_latency = args.token_latency_ms / 1000
+    config.first_token_latency = args.first_token_latency_ms / 1000
+    config.tokens = args.tokens
+    config.parse_latency = args.parse_latency_ms / 1000
+    if args.site_dir:
+        from fastapi.staticfiles import StaticFiles
+
+        app.mount("/site", StaticFiles(directory=args.site_dir, html=True), name="site")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
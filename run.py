@@ -1,7 +1,9 @@
 import uvicorn
 import logging
 from dotenv import load_dotenv
+import glob
 import os
+import tempfile
 
 # Configuration du logging
 logging.basicConfig(
@@ -13,6 +15,22 @@ logger = logging.getLogger(__name__)
 # Chargement des variables d'environnement
 load_dotenv()
 
+def _prepare_prometheus_multiproc_dir():
+    """
+    Les 4 workers écrivent leurs métriques dans PROMETHEUS_MULTIPROC_DIR, agrégées par /metrics.
+    Les fichiers de métriques (*.db) d'une exécution précédente sont supprimés au démarrage ;
+    le reste du dossier n'est jamais touché.
+    """
+    metrics_dir = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus-multiproc")
+    )
+    if os.path.exists(metrics_dir) and not os.path.isdir(metrics_dir):
+        raise ValueError(f"PROMETHEUS_MULTIPROC_DIR n'est pas un dossier : {metrics_dir}")
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        if os.path.isfile(path):
+            os.remove(path)
+
 def dev():
     """Démarre le serveur en mode développement"""
     try:
@@ -30,6 +48,7 @@ def dev():
 def prod():
     """Démarre le serveur en mode production"""
     try:
+        _prepare_prometheus_multiproc_dir()
         uvicorn.run(
             "app.api.app:app",
             host=os.getenv("APP_HOST", "0.0.0.0"),
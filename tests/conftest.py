@@ -0,0 +1,6 @@
+import os
+
+# app.db.supabase_client creates its client when imported (through app.api.routers.models):
+# placeholder credentials, the tests never send a request to Supabase
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "placeholder.service.key")
@@ -0,0 +1,183 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.services.admission import AdmissionController, AdmissionSlot, get_client_key
+
+
+def controller(**options) -> AdmissionController:
+    settings = dict(max_concurrency=1, max_queue=10, queue_timeout=5.0, max_per_user=10)
+    settings.update(options)
+    return AdmissionController(**settings)
+
+
+async def settle() -> None:
+    # Lets the waiting tasks run up to their next await
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_fast_path_grants_without_queueing():
+    async def scenario():
+        admission = controller(max_concurrency=2)
+        first = await admission.acquire("u1")
+        second = await admission.acquire("u2")
+        stats = admission.stats()
+        first.release()
+        second.release()
+        return stats, admission.stats()
+
+    during, after = asyncio.run(scenario())
+    assert during["active"] == 2 and during["queued"] == 0
+    assert during["max_wait_seconds"] == 0.0
+    assert after["active"] == 0 and after["admitted"] == 2
+
+
+def test_queues_past_capacity_and_rejects_when_queue_is_full():
+    async def scenario():
+        admission = controller(max_queue=1)
+        holder = await admission.acquire("u1")
+        waiter = asyncio.create_task(admission.acquire("u2"))
+        await settle()
+        assert not waiter.done() and admission.stats()["queued"] == 1
+
+        with pytest.raises(HTTPException) as rejected:
+            await admission.acquire("u3")
+        assert rejected.value.status_code == 429
+
+        holder.release()
+        slot = await asyncio.wait_for(waiter, timeout=1)
+        assert admission.stats()["active"] == 1 and admission.stats()["queued"] == 0
+        slot.release()
+
+    asyncio.run(scenario())
+
+
+def test_rejects_requests_above_the_per_user_cap():
+    async def scenario():
+        admission = controller(max_concurrency=4, max_per_user=1)
+        slot = await admission.acquire("u1")
+        with pytest.raises(HTTPException) as rejected:
+            await admission.acquire("u1")
+        other = await admission.acquire("u2")
+        slot.release()
+        other.release()
+        return rejected.value
+
+    assert asyncio.run(scenario()).status_code == 429
+
+
+def test_fifo_within_a_user_and_round_robin_across_users():
+    async def scenario() -> List[str]:
+        admission = controller()
+        order: List[str] = []
+        slots: Dict[str, AdmissionSlot] = {}
+
+        async def request(name: str, key: str) -> None:
+            slots[name] = await admission.acquire(key)
+            order.append(name)
+
+        holder = await admission.acquire("holder")
+        tasks = []
+        for name, key in [("u1-a", "u1"), ("u1-b", "u1"), ("u1-c", "u1"), ("u2-a", "u2"), ("u2-b", "u2")]:
+            tasks.append(asyncio.create_task(request(name, key)))
+            await settle()
+
+        holder.release()
+        for _ in tasks:
+            await settle()
+            slots[order[-1]].release()
+        await asyncio.gather(*tasks)
+        assert admission.stats()["active"] == 0
+        return order
+
+    assert asyncio.run(scenario()) == ["u1-a", "u2-a", "u1-b", "u2-b", "u1-c"]
+
+
+def test_queue_timeout_returns_429_with_retry_after():
+    async def scenario():
+        admission = controller(queue_timeout=0.05)
+        holder = await admission.acquire("u1")
+        with pytest.raises(HTTPException) as rejected:
+            await admission.acquire("u2")
+        stats = admission.stats()
+        holder.release()
+        return rejected.value, stats, admission
+
+    error, stats, admission = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.headers == {"Retry-After": "1"}
+    assert stats["queued"] == 0 and stats["rejected"] == 1
+    assert not admission._per_user and not admission._waiters
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        admission = controller()
+        holder = await admission.acquire("u1")
+        waiter = asyncio.create_task(admission.acquire("u2"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        holder.release()
+        assert admission.stats()["active"] == 0 and admission.stats()["queued"] == 0
+
+        # Granted while being cancelled: the slot is given back, whether the
+        # cancellation hits the wait or the request that got the slot
+        async def request() -> None:
+            async with admission.slot("u2"):
+                await asyncio.sleep(10)
+
+        holder = await admission.acquire("u1")
+        waiter = asyncio.create_task(request())
+        await settle()
+        holder.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert admission.stats()["active"] == 0 and not admission._per_user
+
+        slot = await asyncio.wait_for(admission.acquire("u3"), timeout=0.1)
+        slot.release()
+
+    asyncio.run(scenario())
+
+
+def test_double_release_is_idempotent():
+    async def scenario():
+        admission = controller(max_concurrency=2)
+        slot = await admission.acquire("u1")
+        other = await admission.acquire("u2")
+        slot.release()
+        slot.release()
+        stats = admission.stats()
+        other.release()
+        return stats, admission
+
+    stats, admission = asyncio.run(scenario())
+    assert stats["active"] == 1
+    assert admission.stats()["active"] == 0 and not admission._per_user
+
+
+def request(peer: str, forwarded_for: str = ""):
+    headers = {"x-forwarded-for": forwarded_for} if forwarded_for else {}
+    return SimpleNamespace(client=SimpleNamespace(host=peer), headers=headers)
+
+
+def test_client_key_ignores_forwarded_for_without_trusted_proxies(monkeypatch):
+    monkeypatch.delenv("TRUSTED_PROXIES", raising=False)
+
+    assert get_client_key(request("203.0.113.5", "198.51.100.1")) == "203.0.113.5"
+
+
+def test_client_key_trusts_forwarded_for_only_from_trusted_proxies(monkeypatch):
+    monkeypatch.setenv("TRUSTED_PROXIES", "10.0.0.0/8, 192.168.1.1")
+
+    # Untrusted peer: its X-Forwarded-For may be forged
+    assert get_client_key(request("203.0.113.5", "198.51.100.1")) == "203.0.113.5"
+    # Right-most address not added by a trusted proxy
+    assert get_client_key(request("10.0.0.2", "1.2.3.4, 198.51.100.1, 192.168.1.1")) == "198.51.100.1"
+    assert get_client_key(request("10.0.0.2", "10.0.0.3")) == "10.0.0.3"
+    assert get_client_key(request("10.0.0.2")) == "10.0.0.2"
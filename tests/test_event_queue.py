@@ -0,0 +1,33 @@
+import asyncio
+
+from app.api.services.event_queue import EventQueue
+
+
+def test_keeps_the_order_of_progress_and_data_events():
+    queue = EventQueue(max_progress=10)
+    for event, progress in [("p1", True), ("d1", False), ("p2", True), ("d2", False)]:
+        queue.put(event, progress=progress)
+
+    assert [queue.get_nowait() for _ in range(4)] == ["p1", "d1", "p2", "d2"]
+    assert queue.empty()
+
+
+def test_drops_the_oldest_progress_events_but_never_data_events():
+    queue = EventQueue(max_progress=2)
+    queue.put("d1", progress=False)
+    for i in range(5):
+        queue.put(f"p{i}", progress=True)
+    queue.put("d2", progress=False)
+
+    assert len(queue) == 4
+    assert [queue.get_nowait() for _ in range(4)] == ["d1", "p3", "p4", "d2"]
+
+
+def test_get_waits_for_an_event_or_times_out():
+    async def scenario():
+        queue = EventQueue(max_progress=2)
+        assert await queue.get(timeout=0.01) is None
+        asyncio.get_running_loop().call_later(0.01, queue.put, "late", True)
+        return await queue.get(timeout=1)
+
+    assert asyncio.run(scenario()) == "late"
@@ -0,0 +1,109 @@
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+from llama_index.core import Document
+from llama_index.core.readers.base import BaseReader
+
+from app.engine.loaders import file as file_loader
+from app.engine.loaders.file import FileLoaderConfig, aget_file_documents, aiter_file_documents
+
+
+class StubParser(BaseReader):
+    """Async reader standing in for LlamaParse: records how many files it parses at once."""
+
+    def __init__(self, delay: float = 0.02, fail_on: Optional[str] = None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.active = 0
+        self.max_active = 0
+        self.started: List[str] = []
+        self.completed: List[str] = []
+        self.cancelled: List[str] = []
+
+    def load_data(self, file: Path, extra_info: Optional[Dict] = None, **kwargs) -> List[Document]:
+        raise AssertionError("the async path must be used")
+
+    async def aload_data(
+        self, file: Path, extra_info: Optional[Dict] = None, **kwargs
+    ) -> List[Document]:
+        name = Path(file).name
+        self.started.append(name)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if name == self.fail_on:
+                raise ValueError(f"cannot parse {name}")
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        finally:
+            self.active -= 1
+        self.completed.append(name)
+        return [Document(text=f"content of {name}", metadata=extra_info or {})]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_loader, "DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("PARSE_CACHE", "off")
+    for i in range(6):
+        (tmp_path / f"doc{i}.stub").write_text(f"document {i}")
+    return tmp_path
+
+
+def test_parses_files_concurrently_up_to_the_limit(data_dir):
+    parser = StubParser()
+
+    documents = asyncio.run(
+        aget_file_documents(FileLoaderConfig(), file_extractor={".stub": parser}, concurrency=2)
+    )
+
+    assert sorted(doc.text for doc in documents) == [f"content of doc{i}.stub" for i in range(6)]
+    assert parser.max_active == 2
+    assert all(doc.id_.endswith("_part_0") for doc in documents)
+
+
+def test_closing_the_iterator_cancels_pending_files(data_dir):
+    parser = StubParser(delay=0.05)
+
+    async def consume_first() -> List[Document]:
+        iterator = aiter_file_documents(
+            FileLoaderConfig(), file_extractor={".stub": parser}, concurrency=2
+        )
+        first = await iterator.__anext__()
+        await iterator.aclose()
+        return first
+
+    first = asyncio.run(consume_first())
+
+    assert len(first) == 1
+    assert parser.active == 0
+    assert parser.cancelled
+    assert len(parser.started) < 6
+    assert len(parser.completed) < 6
+
+
+def test_parse_errors_propagate_and_stop_the_other_files(data_dir):
+    parser = StubParser(fail_on="doc0.stub")
+
+    with pytest.raises(Exception) as excinfo:
+        asyncio.run(
+            aget_file_documents(FileLoaderConfig(), file_extractor={".stub": parser}, concurrency=2)
+        )
+
+    error = excinfo.value
+    while not isinstance(error, ValueError) and error.__cause__ is not None:
+        error = error.__cause__
+    assert str(error) == "cannot parse doc0.stub"
+    assert parser.active == 0
+    assert len(parser.completed) < 6
+
+
+def test_empty_data_dir_yields_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_loader, "DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("PARSE_CACHE", "off")
+
+    assert asyncio.run(aget_file_documents(FileLoaderConfig(), file_extractor={})) == []
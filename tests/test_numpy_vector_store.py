@@ -0,0 +1,151 @@
+from typing import List
+
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from app.engine.numpy_vector_store import NumpyVectorStore
+
+DIMENSION = 8
+
+
+def make_node(node_id: str, vector: List[float], doc: str = "doc", **metadata) -> TextNode:
+    return TextNode(
+        id_=node_id,
+        text=f"text of {node_id}",
+        embedding=vector,
+        metadata={"doc": doc, **metadata},
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc)},
+    )
+
+
+def axis(i: int, scale: float = 1.0) -> List[float]:
+    vector = [0.0] * DIMENSION
+    vector[i] = scale
+    return vector
+
+
+def search(store: NumpyVectorStore, vector: List[float], top_k: int = 3, filters=None):
+    return store.query(
+        VectorStoreQuery(query_embedding=vector, similarity_top_k=top_k, filters=filters)
+    )
+
+
+@pytest.fixture
+def store(tmp_path) -> NumpyVectorStore:
+    return NumpyVectorStore(persist_dir=str(tmp_path / "vectors"))
+
+
+def test_add_then_query(store):
+    store.add([make_node(f"n{i}", axis(i, scale=i + 1)) for i in range(4)])
+
+    result = search(store, axis(2))
+
+    assert store.count() == 4
+    assert result.ids[0] == "n2"
+    assert result.similarities[0] == pytest.approx(1.0)
+    assert result.nodes[0].get_content() == "text of n2"
+    assert result.nodes[0].metadata["doc"] == "doc"
+    assert search(store, axis(2), top_k=0).ids == []
+
+
+def test_metadata_filter(store):
+    store.add(
+        [
+            make_node("public", axis(0), private="false"),
+            make_node("private", axis(0, scale=0.9), private="true"),
+            make_node("unset", axis(1)),
+        ]
+    )
+    filters = MetadataFilters(
+        filters=[MetadataFilter(key="private", value="true", operator=FilterOperator.NE)]
+    )
+
+    # A missing field matches no condition, like in Qdrant
+    assert search(store, axis(0), filters=filters).ids == ["public"]
+    assert [node.node_id for node in store.get_nodes(filters=filters)] == ["public"]
+
+
+def test_delete_and_upsert_visibility(store):
+    store.add([make_node("a", axis(0), doc="d1"), make_node("b", axis(1), doc="d2")])
+    store.add([make_node("c", axis(2), doc="d2")])
+
+    store.delete("d2")
+    assert store.count() == 1
+    assert search(store, axis(1)).ids == ["a"]
+
+    # Same id: the new version replaces the old one
+    store.add([make_node("a", axis(3), doc="d1")])
+    result = search(store, axis(3), top_k=5)
+    assert result.ids == ["a"]
+    assert result.similarities[0] == pytest.approx(1.0)
+
+    store.delete_nodes(node_ids=["a"])
+    assert store.count() == 0
+    assert search(store, axis(3)).ids == []
+
+
+def test_second_instance_sees_writes_after_reload(store):
+    other = NumpyVectorStore(persist_dir=store.persist_dir)
+    store.add([make_node("a", axis(0))])
+    assert search(other, axis(0)).ids == ["a"]
+
+    store.add([make_node(f"n{i}", axis(i)) for i in range(1, 4)])
+    store.delete_nodes(node_ids=["n1"])
+    assert other.count() == 3
+    assert sorted(node.node_id for node in other.get_nodes()) == ["a", "n2", "n3"]
+
+
+def test_segments_are_merged_and_deleted_rows_compacted(store):
+    for batch in range(8):
+        store.add([make_node(f"n{batch}-{i}", axis(i)) for i in range(4)])
+    assert store.count() == 32
+    # Merged like a binary counter: 8 equal batches end up in one segment
+    assert store.segments_count() == 1
+
+    store.delete_nodes(node_ids=[f"n{batch}-{i}" for batch in range(6) for i in range(4)])
+    assert store.count() == 8
+    assert sorted(node.node_id for node in store.get_nodes()) == sorted(
+        f"n{batch}-{i}" for batch in (6, 7) for i in range(4)
+    )
+
+
+def test_query_batch_matches_query(store):
+    rng = np.random.default_rng(0)
+    store.add(
+        [
+            make_node(f"n{i}", rng.normal(size=DIMENSION).tolist(), private=str(i % 2 == 0).lower())
+            for i in range(50)
+        ]
+    )
+    queries = rng.normal(size=(5, DIMENSION)).tolist()
+    filters = MetadataFilters(filters=[MetadataFilter(key="private", value="false")])
+
+    batch = store.query_batch(queries, similarity_top_k=4, filters=filters)
+
+    for query, result in zip(queries, batch):
+        single = search(store, query, top_k=4, filters=filters)
+        assert result.ids == single.ids
+        assert result.similarities == pytest.approx(single.similarities)
+
+
+def test_clear(store):
+    store.add([make_node("a", axis(0))])
+    store.clear()
+
+    assert not store.exists()
+    assert store.count() == 0
+    assert search(store, axis(0)).ids == []
+
+
+def test_rejects_vectors_of_another_dimension(store):
+    store.add([make_node("a", axis(0))])
+
+    with pytest.raises(ValueError):
+        store.add([make_node("b", [1.0, 0.0])])
@@ -0,0 +1,55 @@
+from typing import List
+
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from app.engine.numpy_vector_store import NumpyVectorStore
+from app.engine.query_filter import generate_filters
+
+
+@pytest.fixture
+def store(tmp_path) -> NumpyVectorStore:
+    documents = {
+        "public": {"private": "false"},
+        "unset": {},
+        "own-private": {"private": "true", "user_id": "u1"},
+        "other-private": {"private": "true", "user_id": "u2"},
+    }
+    store = NumpyVectorStore(persist_dir=str(tmp_path / "vectors"))
+    store.add(
+        [
+            TextNode(
+                id_=doc_id,
+                text=doc_id,
+                embedding=[1.0, 0.0],
+                metadata=metadata,
+                # Stored as the `doc_id` field of the payload, like at ingestion
+                relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)},
+            )
+            for doc_id, metadata in documents.items()
+        ]
+    )
+    return store
+
+
+def visible(store: NumpyVectorStore, filters) -> List[str]:
+    result = store.query(
+        VectorStoreQuery(query_embedding=[1.0, 0.0], similarity_top_k=10, filters=filters)
+    )
+    return sorted(result.ids)
+
+
+def test_anonymous_user_sees_public_and_unset_documents(store):
+    assert visible(store, generate_filters()) == ["public", "unset"]
+
+
+def test_user_also_sees_own_private_documents(store):
+    assert visible(store, generate_filters("u1")) == ["own-private", "public", "unset"]
+    assert visible(store, generate_filters("u2")) == ["other-private", "public", "unset"]
+
+
+def test_doc_ids_restrict_the_visible_documents(store):
+    filters = generate_filters("u1", doc_ids=["own-private", "other-private", "unset"])
+
+    assert visible(store, filters) == ["own-private", "unset"]
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from app.api.services.streaming import aclose_chat_response, coalesce_tokens
+
+
+async def tokens(*items, delay: float = 0.0):
+    """
+    Fake LLM stream, a float item pauses the stream for that many seconds
+    """
+    for item in items:
+        if isinstance(item, float):
+            await asyncio.sleep(item)
+            continue
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+async def collect(stream) -> List[str]:
+    return [chunk async for chunk in stream]
+
+
+def test_no_window_yields_each_token():
+    chunks = asyncio.run(collect(coalesce_tokens(tokens("a", "", "b"), window=0)))
+
+    assert chunks == ["a", "b"]
+
+
+def test_flushes_when_the_window_expires():
+    stream = tokens("a", "b", 0.3, "c", "d")
+
+    chunks = asyncio.run(collect(coalesce_tokens(stream, window=0.05, max_chars=100)))
+
+    assert chunks == ["ab", "cd"]
+
+
+def test_flushes_when_max_chars_is_reached():
+    stream = tokens("ab", "cd", "ef", "g", delay=0.01)
+
+    start = time.perf_counter()
+    chunks = asyncio.run(collect(coalesce_tokens(stream, window=10, max_chars=3)))
+
+    assert chunks == ["abcd", "efg"]
+    # Flushed by size, not by the window
+    assert time.perf_counter() - start < 5
+
+
+def test_upstream_error_is_raised_after_the_buffered_tokens():
+    async def failing():
+        yield "a"
+        raise ValueError("LLM error")
+
+    async def scenario():
+        chunks = []
+        with pytest.raises(ValueError, match="LLM error"):
+            async for chunk in coalesce_tokens(failing(), window=0.01):
+                chunks.append(chunk)
+        return chunks
+
+    assert asyncio.run(scenario()) == ["a"]
+
+
+def test_cancelling_the_consumer_stops_the_upstream():
+    upstream = SimpleNamespace(cancelled=False, closed=False)
+
+    async def stalled():
+        try:
+            yield "a"
+            await asyncio.Event().wait()
+            yield "never"
+        except asyncio.CancelledError:
+            upstream.cancelled = True
+            raise
+        finally:
+            upstream.closed = True
+
+    async def scenario():
+        received = asyncio.Event()
+
+        async def consume():
+            async for _ in coalesce_tokens(stalled(), window=0.01):
+                received.set()
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.wait_for(received.wait(), timeout=1)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert upstream.cancelled and upstream.closed
+
+
+def test_aclose_chat_response_cancels_the_memory_task_and_closes_the_stream():
+    closed = []
+
+    async def chat_stream():
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        stream = chat_stream()
+        await stream.__anext__()
+        task = asyncio.create_task(asyncio.sleep(10))
+        await aclose_chat_response(
+            SimpleNamespace(awrite_response_to_history_task=task, achat_stream=stream)
+        )
+        await asyncio.gather(task, return_exceptions=True)
+        # A response without a stream or a task is ignored
+        await aclose_chat_response(SimpleNamespace())
+        return task
+
+    assert asyncio.run(scenario()).cancelled()
+    assert closed == [True]
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.routers.models import Message
+from app.api.services import suggestion
+from app.api.services.suggestion import NextQuestionSuggestion, SuggestionCache
+
+ANSWER = "A long answer. " * 20
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def acomplete(self, prompt):
+        self.prompts.append(prompt)
+        return SimpleNamespace(text="```\nWhat next?\nAnd then?\n```")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SuggestionCache(str(tmp_path / "questions.sqlite3"), ttl=60)
+    monkeypatch.setattr(suggestion, "get_suggestion_cache", lambda: cache)
+    monkeypatch.setenv("NEXT_QUESTION_PROMPT", "Suggest questions for {conversation}")
+    monkeypatch.setenv("NEXT_QUESTION_SPECULATIVE_CHARS", "40")
+    return cache
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    llm = FakeLLM()
+    monkeypatch.setattr(NextQuestionSuggestion, "get_llm", classmethod(lambda cls: llm))
+    return llm
+
+
+def conversation(answer: str):
+    return [Message(role="user", content="Question?"), Message(role="assistant", content=answer)]
+
+
+def test_entries_expire_after_ttl(cache, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(suggestion.time, "time", lambda: now)
+    cache.put("key", ["Q1"])
+
+    now += 59
+    assert cache.get(["key"]) == ["Q1"]
+    now += 2
+    assert cache.get(["key"]) is None
+
+
+def test_get_returns_the_first_key_found(cache):
+    cache.put("prefix", ["from prefix"])
+    cache.put("full", ["from full answer"])
+
+    assert cache.get(["missing", "full", "prefix"]) == ["from full answer"]
+    assert cache.get(["missing", "prefix"]) == ["from prefix"]
+    assert cache.get([]) is None
+
+
+def test_cache_keys_include_the_speculative_prefix(monkeypatch):
+    monkeypatch.setenv("NEXT_QUESTION_SPECULATIVE_CHARS", "40")
+    keys = NextQuestionSuggestion._get_cache_keys(conversation(ANSWER))
+
+    assert keys == [
+        NextQuestionSuggestion._cache_key("Question?", ANSWER),
+        NextQuestionSuggestion._cache_key("Question?", ANSWER[:40]),
+    ]
+    assert NextQuestionSuggestion._get_cache_keys(conversation("short")) == [
+        NextQuestionSuggestion._cache_key("Question?", "short")
+    ]
+
+
+def test_speculative_questions_are_served_for_the_full_answer(cache, llm):
+    async def scenario():
+        task = NextQuestionSuggestion.start_speculative(
+            [Message(role="user", content="Question?")], ANSWER
+        )
+        await task
+        return await NextQuestionSuggestion.suggest_next_questions_all_messages(
+            conversation(ANSWER)
+        )
+
+    assert asyncio.run(scenario()) == ["What next?", "And then?"]
+    # Generated once, from the prefix; the full answer is served from the cache
+    assert len(llm.prompts) == 1
+    assert ANSWER[:40] in llm.prompts[0] and ANSWER not in llm.prompts[0]
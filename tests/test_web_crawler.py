@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pytest
+
+from app.engine.loaders.web import (
+    BrowserPool,
+    BrowserStartError,
+    CrawlCache,
+    CrawlUrl,
+    Page,
+    WebCrawler,
+    WebLoaderConfig,
+)
+
+FILLER = "Some text long enough to be read as a static page. " * 5
+
+
+def html_page(title: str, links: Sequence[str] = ()) -> str:
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return f"<html><head><title>{title}</title></head><body><p>{FILLER}</p>{anchors}</body></html>"
+
+
+SITE: Dict[str, str] = {
+    "/robots.txt": "User-agent: *\nDisallow: /docs/private\n",
+    "/": html_page("Home", ["/docs/a", "/docs/b", "/other", "/docs/private"]),
+    "/docs/a": html_page("A", ["/docs/a#intro", "/docs/a#usage", "/docs/a/deep", "/docs/b"]),
+    "/docs/b": html_page("B", ["/docs/a"]),
+    "/docs/a/deep": html_page("Deep"),
+    "/docs/private": html_page("Private"),
+    "/other": html_page("Other"),
+}
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    requests: List[Tuple[str, int]] = []
+
+    def do_GET(self):
+        body = SITE.get(self.path)
+        if body is None:
+            self._respond(404)
+            return
+        etag = '"' + hashlib.sha256(body.encode()).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._respond(304, headers={"ETag": etag})
+            return
+        content_type = "text/plain" if self.path.endswith(".txt") else "text/html"
+        self._respond(200, body.encode(), {"Content-Type": content_type, "ETag": etag})
+
+    def _respond(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None):
+        self.requests.append((self.path, status))
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(monkeypatch):
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+    SiteHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(base_url: str, cache: Optional[CrawlCache] = None, **site_options):
+    config = WebLoaderConfig(
+        urls=[CrawlUrl(base_url=f"{base_url}/", prefix=f"{base_url}/docs", **site_options)]
+    )
+    return asyncio.run(WebCrawler(config, cache=cache).crawl())
+
+
+def fetched_paths() -> List[str]:
+    return [path for path, _ in SiteHandler.requests if path != "/robots.txt"]
+
+
+def test_follows_links_within_prefix_and_depth(site):
+    documents = crawl(site, max_depth=1)
+
+    assert sorted(doc.metadata["title"] for doc in documents) == ["A", "B", "Home"]
+    assert "/other" not in fetched_paths()
+    assert "/docs/a/deep" not in fetched_paths()
+
+
+def test_fetches_each_page_once_ignoring_fragments(site):
+    documents = crawl(site, max_depth=3)
+
+    assert sorted(fetched_paths()) == sorted(["/", "/docs/a", "/docs/b", "/docs/a/deep"])
+    assert len({doc.id_ for doc in documents}) == len(documents) == 4
+
+
+def test_respects_robots_txt(site):
+    documents = crawl(site, max_depth=1)
+
+    assert "/docs/private" not in fetched_paths()
+    assert all(doc.metadata["title"] != "Private" for doc in documents)
+
+
+def test_reuses_cached_pages_when_not_modified(site, tmp_path):
+    cache = CrawlCache(str(tmp_path / "crawl.sqlite3"))
+    first = crawl(site, cache=cache, max_depth=1)
+    SiteHandler.requests = []
+
+    second = crawl(site, cache=cache, max_depth=1)
+
+    pages = [(path, status) for path, status in SiteHandler.requests if path != "/robots.txt"]
+    assert pages and all(status == 304 for _, status in pages)
+    assert sorted((doc.id_, doc.text) for doc in second) == sorted(
+        (doc.id_, doc.text) for doc in first
+    )
+
+
+def test_keeps_static_page_when_browser_rendering_fails(site, monkeypatch):
+    calls = []
+
+    async def failing_render(self, url):
+        calls.append(url)
+        raise RuntimeError("chrome crashed")
+
+    monkeypatch.setattr(BrowserPool, "render", failing_render)
+    documents = crawl(site, max_depth=0, render="browser")
+
+    assert [doc.metadata["title"] for doc in documents] == ["Home"]
+    assert FILLER.strip() in documents[0].text
+    assert len(calls) == 1
+
+
+def test_stops_using_browser_that_fails_to_start(site, monkeypatch):
+    async def failing_render(self, url):
+        raise BrowserStartError("chrome not found")
+
+    monkeypatch.setattr(BrowserPool, "render", failing_render)
+    config = WebLoaderConfig(urls=[CrawlUrl(base_url=f"{site}/", prefix=site, render="browser")])
+    crawler = WebCrawler(config)
+
+    page = Page(url=f"{site}/", text="static text")
+    assert asyncio.run(crawler._render(page.url, page)) is page
+    assert crawler._browser_unavailable